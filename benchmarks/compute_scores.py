@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark :func:`~subliminal.subtitle.compute_scores` against :meth:`~subliminal.subtitle.Subtitle.compute_score`
+for each candidate"""
+from __future__ import print_function, unicode_literals, division
+import logging
+import operator
+import random
+import timeit
+from babelfish import Language
+from subliminal.subtitle import Subtitle, compute_scores, get_score_table
+from subliminal.video import Episode
+
+
+class MatchesSubtitle(Subtitle):
+    """Subtitle with precomputed matches so only the scoring is measured"""
+    def __init__(self, matches):
+        super(MatchesSubtitle, self).__init__(Language('eng'))
+        self.matches = matches
+
+    def compute_matches(self, video):
+        return self.matches
+
+
+if __name__ == '__main__':
+    logging.getLogger('subliminal').setLevel(logging.WARNING)
+    number = 100
+    random.seed(0)
+    video = Episode('The.Big.Bang.Theory.S07E05.720p.HDTV.X264-DIMENSION.mkv', 'The Big Bang Theory', 7, 5)
+    names = sorted(Episode.scores)
+    subtitles = [MatchesSubtitle({n for n in names if random.random() < 0.4}) for _ in range(500)]
+    get_score_table(Episode)
+    reference_scores = sorted([(s, s.compute_score(video)) for s in subtitles], key=operator.itemgetter(1),
+                              reverse=True)
+    if compute_scores(subtitles, video) != reference_scores:
+        raise AssertionError('Scores differ')
+    reference = timeit.timeit(lambda: sorted([(s, s.compute_score(video)) for s in subtitles],
+                                             key=operator.itemgetter(1), reverse=True), number=number) / number
+    batch = timeit.timeit(lambda: compute_scores(subtitles, video), number=number) / number
+    print('compute_score:  %.3f ms per %d candidates' % (reference * 1000, len(subtitles)))
+    print('compute_scores: %.3f ms per %d candidates' % (batch * 1000, len(subtitles)))
+    print('speedup:        %.1fx' % (reference / batch))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark :attr:`~subliminal.subtitle.Subtitle.guessed_encoding` and :attr:`~subliminal.subtitle.Subtitle.text`
+over a corpus of mixed-encoding subtitles against full decoding with each candidate encoding"""
+from __future__ import print_function, unicode_literals, division
+import logging
+import timeit
+from babelfish import Language
+import chardet
+from subliminal.subtitle import Subtitle
+
+
+#: Language, encoding and line of the subtitles in the corpus. The big5 subtitle is guessed as gb18030, like with full
+#: decoding, as it also decodes with gb18030 which is tried first
+CORPUS = [('eng', 'utf-8', 'I told you, we are not going back there.'),
+          ('fra', 'latin-1', 'Je t\'ai dit que nous n\'y retournerions pas, même demain.'),
+          ('bul', 'windows-1251', 'Казах ти, че няма да се връщаме там.'),
+          ('pol', 'windows-1250', 'Mówiłem ci, że tam nie wrócimy, żółw.'),
+          ('ara', 'windows-1256', 'قلت لك، لن نعود إلى هناك.'),
+          ('zho', 'big5', '我告訴過你，我們不會回到那裡。'),
+          ('jpn', 'euc-jp', '言っただろう、あそこには戻らない。')]
+
+#: Candidate encodings of :attr:`~subliminal.subtitle.Subtitle.guessed_encoding` by language
+ENCODINGS = {'zho': ['utf-8', 'gb18030', 'big5'], 'jpn': ['utf-8', 'shift-jis'], 'ara': ['utf-8', 'windows-1256'],
+             'pol': ['utf-8', 'windows-1250'], 'bul': ['utf-8', 'windows-1251']}
+
+
+def subrip(line, count=1500):
+    return '\n'.join('%d\n00:%02d:%02d,000 --> 00:%02d:%02d,500\n%s\n' % (i, i // 60 % 60, i % 60, i // 60 % 60,
+                                                                            i % 60, line) for i in range(1, count + 1))
+
+
+def reference_guessed_encoding(subtitle, encodings):
+    for encoding in encodings:
+        try:
+            subtitle.content.decode(encoding)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    return chardet.detect(subtitle.content)['encoding']
+
+
+def reference(corpus):
+    # guess, then decode for text, is_valid and save_subtitles
+    for subtitle, encodings in corpus:
+        encoding = reference_guessed_encoding(subtitle, encodings)
+        for _ in range(3):
+            subtitle.content.decode(encoding, errors='replace')
+
+
+def memoized(corpus):
+    for subtitle, _ in corpus:
+        subtitle._guess = subtitle._text = None
+        for _ in range(3):
+            subtitle.text
+
+
+if __name__ == '__main__':
+    logging.getLogger('subliminal').setLevel(logging.ERROR)
+    number = 5
+    corpus = []
+    for alpha3, encoding, line in CORPUS:
+        subtitle = Subtitle(Language(alpha3))
+        subtitle.content = subrip(line).encode(encoding)
+        corpus.append((subtitle, ENCODINGS.get(alpha3, ['utf-8', 'latin-1'])))
+        reference_encoding = reference_guessed_encoding(subtitle, corpus[-1][1])
+        assert subtitle.guessed_encoding == reference_encoding, 'guessed %s instead of %s with full decoding' % (
+            subtitle.guessed_encoding, reference_encoding)
+        print('%s: %s guessed as %s, as with full decoding' % (alpha3, encoding, subtitle.guessed_encoding))
+    size = sum(len(s.content) for s, _ in corpus)
+    reference_time = timeit.timeit(lambda: reference(corpus), number=number) / number
+    memoized_time = timeit.timeit(lambda: memoized(corpus), number=number) / number
+    print('full decoding:    %.1f ms per %d subtitles (%d KiB)' % (reference_time * 1000, len(corpus), size // 1024))
+    print('sampled memoized: %.1f ms per %d subtitles (%d KiB)' % (memoized_time * 1000, len(corpus), size // 1024))
+    print('speedup:          %.1fx' % (reference_time / memoized_time))
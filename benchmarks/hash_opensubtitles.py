@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark :func:`~subliminal.video.hash_opensubtitles` against the former 8-byte read implementation"""
+from __future__ import print_function, unicode_literals, division
+import os
+import struct
+import tempfile
+import timeit
+from subliminal.video import hash_opensubtitles
+
+
+def hash_opensubtitles_reference(video_path):
+    """Former implementation of :func:`~subliminal.video.hash_opensubtitles`, 8 bytes at a time"""
+    bytesize = struct.calcsize(b'<q')
+    with open(video_path, 'rb') as f:
+        filesize = os.path.getsize(video_path)
+        filehash = filesize
+        if filesize < 65536 * 2:
+            return None
+        for _ in range(65536 // bytesize):
+            filebuffer = f.read(bytesize)
+            (l_value,) = struct.unpack(b'<q', filebuffer)
+            filehash += l_value
+            filehash = filehash & 0xFFFFFFFFFFFFFFFF
+        f.seek(max(0, filesize - 65536), 0)
+        for _ in range(65536 // bytesize):
+            filebuffer = f.read(bytesize)
+            (l_value,) = struct.unpack(b'<q', filebuffer)
+            filehash += l_value
+            filehash = filehash & 0xFFFFFFFFFFFFFFFF
+    returnedhash = '%016x' % filehash
+    return returnedhash
+
+
+if __name__ == '__main__':
+    number = 100
+    fd, path = tempfile.mkstemp(suffix='.mkv')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(10 * 1024 * 1024 + 12345))
+        if hash_opensubtitles(path) != hash_opensubtitles_reference(path):
+            raise AssertionError('Hashes differ')
+        reference = timeit.timeit(lambda: hash_opensubtitles_reference(path), number=number) / number
+        bulk = timeit.timeit(lambda: hash_opensubtitles(path), number=number) / number
+        print('8-byte reads: %.3f ms per video' % (reference * 1000))
+        print('bulk reads:   %.3f ms per video' % (bulk * 1000))
+        print('speedup:      %.1fx' % (reference / bulk))
+    finally:
+        os.remove(path)
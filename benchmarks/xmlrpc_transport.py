@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark :class:`~subliminal.transport.XMLRPCTransport` against an XML-RPC transport opening a new connection
+for each call, against a local keep-alive server with the given round-trip time"""
+from __future__ import print_function, unicode_literals, division
+import logging
+import socket
+import sys
+import threading
+import time
+import timeit
+from subliminal.compat import ServerProxy, Transport as BaseXMLRPCTransport
+from subliminal.transport import Transport, XMLRPCTransport
+try:
+    from http.client import HTTPConnection
+    from socketserver import ThreadingMixIn
+    from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+except ImportError:
+    from httplib import HTTPConnection
+    from SocketServer import ThreadingMixIn
+    from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+
+class NewConnectionTransport(BaseXMLRPCTransport, object):
+    """XML-RPC transport opening a new connection for each call"""
+    def make_connection(self, host):
+        return HTTPConnection(host, timeout=10)
+
+
+class LatencyHandler(SimpleXMLRPCRequestHandler):
+    """XML-RPC handler keeping connections alive, delaying the handshake and each response by the round-trip time"""
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/xml-rpc',)
+    delay = 0
+
+    def setup(self):
+        time.sleep(self.delay)
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_POST(self):
+        time.sleep(self.delay)
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+    def log_message(self, *args):
+        pass
+
+
+class LatencyServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    logging.getLogger('subliminal').setLevel(logging.WARNING)
+    number = 50
+    rtt = float(sys.argv[1]) if len(sys.argv) > 1 else 0.01
+    LatencyHandler.delay = rtt
+    server = LatencyServer(('127.0.0.1', 0), LatencyHandler, logRequests=False)
+    server.register_function(lambda token: {'status': '200 OK'}, 'NoOperation')
+    threading.Thread(target=server.serve_forever).start()
+    url = 'http://127.0.0.1:%d/xml-rpc' % server.server_address[1]
+    reference_proxy = ServerProxy(url, transport=NewConnectionTransport())
+    pooled_proxy = ServerProxy(url, transport=XMLRPCTransport(Transport()))
+    pooled_proxy.NoOperation('token')
+    reference = timeit.timeit(lambda: reference_proxy.NoOperation('token'), number=number) / number
+    pooled = timeit.timeit(lambda: pooled_proxy.NoOperation('token'), number=number) / number
+    server.shutdown()
+    print('round-trip time:        %.1f ms' % (rtt * 1000))
+    print('new connection per call: %.3f ms per call' % (reference * 1000))
+    print('XMLRPCTransport:         %.3f ms per call' % (pooled * 1000))
+    print('speedup:                 %.1fx' % (reference / pooled))
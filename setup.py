@@ -1,6 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import sys
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
+
+
+class BuildPy(build_py):
+    """Leave out the modules with coroutines when building for Python older than 3.5"""
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info < (3, 5):
+            modules = [m for m in modules if (m[0], m[1]) != ('subliminal', 'aio')]
+        return modules
 
 
 setup(name='subliminal',
@@ -28,4 +39,5 @@ setup(name='subliminal',
         'console_scripts': ['subliminal = subliminal.cli:subliminal']
     },
     install_requires=open('requirements.txt').readlines(),
+    cmdclass={'build_py': BuildPy},
     test_suite='subliminal.tests.suite')
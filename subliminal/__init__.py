@@ -9,9 +9,12 @@ import logging
 from .api import list_subtitles, download_subtitles, download_best_subtitles, save_subtitles
 from .cache import MutexLock, region as cache_region
 from .exceptions import Error, ProviderError
+from .guess import guess_cache
+from .index import ScanIndex
 from .providers import Provider, ProviderPool, provider_manager
 from .subtitle import Subtitle
-from .video import VIDEO_EXTENSIONS, SUBTITLE_EXTENSIONS, Video, Episode, Movie, scan_videos, scan_video
+from .transport import transport as http_transport
+from .video import VIDEO_EXTENSIONS, SUBTITLE_EXTENSIONS, Video, Episode, Movie, iter_videos, scan_videos, scan_video
 
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+# Coroutines of this module require Python 3.5 or later, they are exposed in subliminal.api when available
+from __future__ import unicode_literals
+import asyncio
+import collections
+import logging
+import operator
+import time
+import babelfish
+from .circuit import FAILURE_THRESHOLD, COOLDOWN, RETRIES, get_retry_delay
+from .exceptions import DownloadLimitExceeded
+from .providers import ProviderPool, TRANSIENT_ERRORS
+from .subtitle import iter_ranked_subtitles
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncProviderPool(ProviderPool):
+    """A :class:`~subliminal.providers.ProviderPool` with coroutine counterparts to use in an :mod:`asyncio` event
+    loop
+
+    Providers are queried with their :meth:`~subliminal.providers.Provider.list_subtitles_async` and
+    :meth:`~subliminal.providers.Provider.download_subtitle_async`, so providers that are not ported run in the
+    `executor`. Their initialization and termination also run in the `executor`, as do the CPU-bound ranking and
+    validation of subtitles so they do not stall the event loop.
+
+    The :class:`AsyncProviderPool` supports the ``async with`` statement to :meth:`terminate_async` the providers
+
+    :param providers: providers to use, if not all
+    :type providers: list of string or None
+    :param provider_configs: configuration for providers
+    :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param max_in_flight: maximum number of concurrent requests by provider name, if not the provider's
+        :attr:`~subliminal.providers.Provider.max_in_flight`
+    :type max_in_flight: dict of provider name => int or None
+    :param executor: executor to run the blocking calls in, if not the event loop's default
+    :type executor: :class:`concurrent.futures.Executor` or None
+    :param int failure_threshold: number of consecutive failures after which a provider is skipped
+    :param float cooldown: time in seconds after which a skipped provider is probed again
+    :param int retries: number of retries of a request failing with a transient error
+    :param bool keep_alive: keep the idle providers alive in a background thread
+
+    """
+    def __init__(self, providers=None, provider_configs=None, max_in_flight=None, executor=None,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, retries=RETRIES, keep_alive=False):
+        super(AsyncProviderPool, self).__init__(providers, provider_configs, max_in_flight=max_in_flight,
+                                                failure_threshold=failure_threshold, cooldown=cooldown,
+                                                retries=retries, keep_alive=keep_alive)
+        self.executor = executor
+
+        #: Semaphores bounding the concurrent requests by provider name, created in the event loop on first use
+        self.async_semaphores = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):  # @ReservedAssignment
+        await self.terminate_async()
+
+    def get_async_semaphore(self, name):
+        if name not in self.async_semaphores:
+            self.async_semaphores[name] = asyncio.Semaphore(self.max_in_flight.get(name,
+                                                                                   self.providers[name].max_in_flight))
+        return self.async_semaphores[name]
+
+    async def acquire_provider_async(self, name):
+        """Acquire an idle :class:`~subliminal.providers.Provider` by name, initializing it if necessary
+
+        The provider must be given back with :meth:`release_provider_async`
+
+        :param string name: name of the provider
+        :return: the initialized provider
+        :rtype: :class:`~subliminal.providers.Provider`
+
+        """
+        await self.get_async_semaphore(name).acquire()
+        provider = None
+        try:
+            with self.lock:
+                provider = self.idle_providers[name].pop() if self.idle_providers[name] else None
+            if provider is None:
+                provider = await asyncio.get_event_loop().run_in_executor(self.executor, self.initialize_provider,
+                                                                          name)
+            if name in self.rate_limiters:
+                await asyncio.sleep(self.rate_limiters[name].reserve())
+            return provider
+        except BaseException:
+            if provider is not None:
+                with self.lock:
+                    self.idle_providers[name].append(provider)
+            self.async_semaphores[name].release()
+            raise
+
+    def release_provider_async(self, name, provider):
+        """Give back a provider acquired with :meth:`acquire_provider_async`
+
+        :param string name: name of the provider
+        :param provider: the provider
+        :type provider: :class:`~subliminal.providers.Provider`
+
+        """
+        with self.lock:
+            self.last_used[provider] = time.time()
+            self.idle_providers[name].append(provider)
+        self.async_semaphores[name].release()
+
+    async def call_provider_async(self, name, method, *args):
+        """Coroutine counterpart of :meth:`~subliminal.providers.ProviderPool.call_provider` with the asynchronous
+        `method` of the provider, retrying transient errors in the initialization of the provider as well"""
+        for retry in range(self.retries + 1):
+            provider = None
+            try:
+                provider = await self.acquire_provider_async(name)
+                return await getattr(provider, method)(*args, executor=self.executor)
+            except TRANSIENT_ERRORS + (asyncio.TimeoutError,):
+                if retry == self.retries:
+                    raise
+            finally:
+                if provider is not None:
+                    self.release_provider_async(name, provider)
+            delay = get_retry_delay(retry)
+            logger.info('Transient error in provider %r, retrying in %.1fs', name, delay)
+            await asyncio.sleep(delay)
+
+    async def list_subtitles_provider_async(self, provider_name, video, languages, ticket=None):
+        """Coroutine counterpart of :meth:`~subliminal.providers.ProviderPool.list_subtitles_provider`"""
+        try:
+            logger.info('Listing subtitles with provider %r and languages %r', provider_name, languages)
+            provider_subtitles = await self.call_provider_async(provider_name, 'list_subtitles_async', video,
+                                                                languages)
+            self.circuit_breakers[provider_name].record_success(ticket)
+            logger.info('Found %d subtitles with provider %r', len(provider_subtitles), provider_name)
+            return provider_subtitles
+        except TRANSIENT_ERRORS + (asyncio.TimeoutError,):
+            logger.warning('Provider %r timed out or is unreachable', provider_name)
+            self.circuit_breakers[provider_name].record_failure(ticket)
+        except Exception:
+            logger.exception('Unexpected error in provider %r', provider_name)
+            self.circuit_breakers[provider_name].record_failure(ticket)
+        return []
+
+    async def list_subtitles_async(self, video, languages):
+        """Coroutine counterpart of :meth:`~subliminal.providers.ProviderPool.list_subtitles`, querying all the
+        providers concurrently"""
+        results = await asyncio.gather(*[self.list_subtitles_provider_async(n, video, l, t)
+                                         for n, l, t in self.get_queries(video, languages)])
+        subtitles = []
+        for provider_subtitles in results:
+            subtitles.extend(provider_subtitles)
+        return subtitles
+
+    async def download_subtitle_async(self, subtitle):
+        """Coroutine counterpart of :meth:`~subliminal.providers.ProviderPool.download_subtitle`"""
+        ticket = self.reserve_download(subtitle.provider_name)
+        if not ticket:
+            return False
+        try:
+            await self.call_provider_async(subtitle.provider_name, 'download_subtitle_async', subtitle)
+            self.circuit_breakers[subtitle.provider_name].record_success(ticket)
+        except TRANSIENT_ERRORS + (asyncio.TimeoutError,):
+            logger.warning('Provider %r timed out or is unreachable', subtitle.provider_name)
+            self.circuit_breakers[subtitle.provider_name].record_failure(ticket)
+            self.refund_quota(subtitle.provider_name)
+            return False
+        except DownloadLimitExceeded:
+            self.exhaust_quota(subtitle.provider_name)
+            return False
+        except Exception:
+            logger.exception('Unexpected error in provider %r', subtitle.provider_name)
+            self.circuit_breakers[subtitle.provider_name].record_failure(ticket)
+            self.refund_quota(subtitle.provider_name)
+            return False
+        if not await asyncio.get_event_loop().run_in_executor(self.executor, operator.attrgetter('is_valid'),
+                                                               subtitle):
+            logger.warning('Invalid subtitle')
+            self.refund_quota(subtitle.provider_name)
+            return False
+        return True
+
+    async def next_ranked_subtitle_async(self, ranked_subtitles):
+        """Get the next of the `ranked_subtitles` in the `executor`, as ranking computes matches lazily
+
+        :param ranked_subtitles: the subtitles with their score, see :func:`~subliminal.subtitle.iter_ranked_subtitles`
+        :type ranked_subtitles: iterator of tuple(:class:`~subliminal.subtitle.Subtitle`, int)
+        :return: the next subtitle with its score, `None` if there are no more
+        :rtype: tuple(:class:`~subliminal.subtitle.Subtitle`, int) or None
+
+        """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, next, ranked_subtitles, None)
+
+    async def terminate_async(self):
+        """Coroutine counterpart of :meth:`~subliminal.providers.ProviderPool.terminate`"""
+        await asyncio.get_event_loop().run_in_executor(self.executor, self.terminate)
+
+
+async def list_subtitles_async(videos, languages, providers=None, provider_configs=None, max_in_flight=None,
+                               executor=None, pool=None):
+    """Coroutine counterpart of :func:`~subliminal.api.list_subtitles`, processing all the `videos` concurrently
+
+    :param executor: executor to run the blocking calls in, if not the event loop's default
+    :type executor: :class:`concurrent.futures.Executor` or None
+    :param pool: long-lived pool to use instead of a new one
+    :type pool: :class:`AsyncProviderPool` or None
+
+    """
+    pp = pool or AsyncProviderPool(providers, provider_configs, max_in_flight, executor)
+    try:
+        videos = list(videos)
+        results = await asyncio.gather(*[pp.list_subtitles_async(v, languages) for v in videos])
+    finally:
+        if pool is None:
+            await pp.terminate_async()
+    subtitles = collections.defaultdict(list)
+    for video, video_subtitles in zip(videos, results):
+        logger.info('Found %d subtitles total for %r', len(video_subtitles), video)
+        subtitles[video].extend(video_subtitles)
+    return subtitles
+
+
+async def download_subtitles_async(subtitles, provider_configs=None, max_in_flight=None, executor=None, pool=None):
+    """Coroutine counterpart of :func:`~subliminal.api.download_subtitles`, downloading all the `subtitles`
+    concurrently
+
+    :param executor: executor to run the blocking calls in, if not the event loop's default
+    :type executor: :class:`concurrent.futures.Executor` or None
+    :param pool: long-lived pool to use instead of a new one
+    :type pool: :class:`AsyncProviderPool` or None
+
+    """
+    pp = pool or AsyncProviderPool(provider_configs=provider_configs, max_in_flight=max_in_flight, executor=executor)
+    try:
+        await asyncio.gather(*[pp.download_subtitle_async(s) for s in subtitles])
+    finally:
+        if pool is None:
+            await pp.terminate_async()
+
+
+async def download_best_subtitles_async(videos, languages, providers=None, provider_configs=None, min_score=0,
+                                        hearing_impaired=False, single=False, max_in_flight=None, executor=None,
+                                        pool=None):
+    """Coroutine counterpart of :func:`~subliminal.api.download_best_subtitles`, processing all the `videos`
+    concurrently
+
+    :param executor: executor to run the blocking calls in, if not the event loop's default
+    :type executor: :class:`concurrent.futures.Executor` or None
+    :param pool: long-lived pool to use instead of a new one
+    :type pool: :class:`AsyncProviderPool` or None
+
+    """
+    pp = pool or AsyncProviderPool(providers, provider_configs, max_in_flight, executor)
+    try:
+        async def download_best_video_subtitles(video):
+            video_downloaded_subtitles = []
+
+            # filter
+            if single and babelfish.Language('und') in video.subtitle_languages:
+                logger.debug('Skipping video %r: undetermined language found', video)
+                return video_downloaded_subtitles
+
+            # list
+            logger.info('Listing subtitles for %r', video)
+            video_subtitles = await pp.list_subtitles_async(video, languages)
+            logger.info('Found %d subtitles total for %r', len(video_subtitles), video)
+
+            # download
+            downloaded_languages = set()
+
+            def skip(subtitle):
+                if subtitle.hearing_impaired != hearing_impaired:
+                    logger.debug('Skipping subtitle: hearing impaired != %r', hearing_impaired)
+                    return True
+                if subtitle.language in downloaded_languages:
+                    logger.debug('Skipping subtitle: %r already downloaded', subtitle.language)
+                    return True
+                return False
+            ranked_subtitles = iter_ranked_subtitles(video_subtitles, video, min_score, skip)
+            while True:
+                ranked_subtitle = await pp.next_ranked_subtitle_async(ranked_subtitles)
+                if ranked_subtitle is None:
+                    break
+                subtitle, score = ranked_subtitle
+                logger.info('Downloading subtitle %r with score %d', subtitle, score)
+                if await pp.download_subtitle_async(subtitle):
+                    downloaded_languages.add(subtitle.language)
+                    video_downloaded_subtitles.append(subtitle)
+                if single or downloaded_languages == languages:
+                    logger.debug('All languages downloaded')
+                    break
+            return video_downloaded_subtitles
+        videos = list(videos)
+        results = await asyncio.gather(*[download_best_video_subtitles(v) for v in videos])
+    finally:
+        if pool is None:
+            await pp.terminate_async()
+    downloaded_subtitles = collections.defaultdict(list)
+    for video, video_downloaded_subtitles in zip(videos, results):
+        if video_downloaded_subtitles:
+            downloaded_subtitles[video].extend(video_downloaded_subtitles)
+    return downloaded_subtitles
@@ -1,19 +1,76 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 import collections
+import contextlib
 import io
 import logging
-import operator
+import multiprocessing.pool
 import os.path
+import sys
 import babelfish
 from .providers import ProviderPool
-from .subtitle import get_subtitle_path
+from .subtitle import get_subtitle_path, iter_ranked_subtitles
+if sys.version_info >= (3, 5):
+    from .aio import list_subtitles_async, download_subtitles_async, download_best_subtitles_async
+else:
+    list_subtitles_async = download_subtitles_async = download_best_subtitles_async = None
 
 
 logger = logging.getLogger(__name__)
 
 
-def list_subtitles(videos, languages, providers=None, provider_configs=None):
+def imap(function, iterable, workers=None):
+    """Apply `function` to each item of `iterable`, concurrently with `workers` threads if any
+
+    :param function: the function to apply
+    :param iterable: the items to apply the function to
+    :param workers: number of threads to apply the function with, if not sequentially
+    :type workers: int or None
+    :return: the results, in the order of the items
+    :rtype: iterator
+
+    """
+    if workers is None or workers < 2:
+        for item in iterable:
+            yield function(item)
+        return
+    pool = multiprocessing.pool.ThreadPool(workers)
+    try:
+        for result in pool.imap(function, iterable):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+@contextlib.contextmanager
+def use_pool(pool, providers=None, provider_configs=None, workers=None, max_in_flight=None):
+    """Use the given `pool` if any, leaving it alive for later calls, or a new
+    :class:`~subliminal.providers.ProviderPool` terminated at the end of the :keyword:`with` block
+
+    :param pool: the pool to use, if any
+    :type pool: :class:`~subliminal.providers.ProviderPool` or None
+    :param providers: providers of the new pool, if not all
+    :type providers: list of string or None
+    :param provider_configs: configuration for providers of the new pool
+    :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param workers: number of threads of the new pool, if not sequentially
+    :type workers: int or None
+    :param max_in_flight: maximum number of concurrent requests by provider name of the new pool
+    :type max_in_flight: dict of provider name => int or None
+    :return: the pool
+    :rtype: :class:`~subliminal.providers.ProviderPool`
+
+    """
+    if pool is not None:
+        yield pool
+        return
+    with ProviderPool(providers, provider_configs, workers, max_in_flight) as pp:
+        yield pp
+
+
+def list_subtitles(videos, languages, providers=None, provider_configs=None, workers=None, max_in_flight=None,
+                   pool=None):
     """List subtitles for `videos` with the given `languages` using the specified `providers`
 
     :param videos: videos to list subtitles for
@@ -24,37 +81,126 @@ def list_subtitles(videos, languages, providers=None, provider_configs=None):
     :type providers: list of string or None
     :param provider_configs: configuration for providers
     :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param workers: number of threads to process videos with and to query providers with, if not sequentially
+    :type workers: int or None
+    :param max_in_flight: maximum number of concurrent requests by provider name, if not the provider's default
+    :type max_in_flight: dict of provider name => int or None
+    :param pool: long-lived pool to use instead of a new one, `providers`, `provider_configs` and `max_in_flight` are
+        then those of the pool
+    :type pool: :class:`~subliminal.providers.ProviderPool` or None
     :return: found subtitles
     :rtype: dict of :class:`~subliminal.video.Video` => [:class:`~subliminal.subtitle.Subtitle`]
 
     """
     subtitles = collections.defaultdict(list)
-    with ProviderPool(providers, provider_configs) as pp:
-        for video in videos:
+    with use_pool(pool, providers, provider_configs, workers, max_in_flight) as pp:
+        def list_video_subtitles(video):
             logger.info('Listing subtitles for %r', video)
             video_subtitles = pp.list_subtitles(video, languages)
-            logger.info('Found %d subtitles total', len(video_subtitles))
+            logger.info('Found %d subtitles total for %r', len(video_subtitles), video)
+            return video, video_subtitles
+        for video, video_subtitles in imap(list_video_subtitles, videos, workers):
             subtitles[video].extend(video_subtitles)
     return subtitles
 
 
-def download_subtitles(subtitles, provider_configs=None):
+def download_subtitles(subtitles, provider_configs=None, workers=None, max_in_flight=None, pool=None):
     """Download subtitles
 
     :param subtitles: subtitles to download
     :type subtitles: list of :class:`~subliminal.subtitle.Subtitle`
     :param provider_configs: configuration for providers
     :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param workers: number of threads to download subtitles with concurrently, if not sequentially
+    :type workers: int or None
+    :param max_in_flight: maximum number of concurrent requests by provider name, if not the provider's default
+    :type max_in_flight: dict of provider name => int or None
+    :param pool: long-lived pool to use instead of a new one, `provider_configs` and `max_in_flight` are then those of
+        the pool
+    :type pool: :class:`~subliminal.providers.ProviderPool` or None
 
     """
-    with ProviderPool(provider_configs=provider_configs) as pp:
-        for subtitle in subtitles:
+    with use_pool(pool, provider_configs=provider_configs, max_in_flight=max_in_flight) as pp:
+        def download_subtitle(subtitle):
             logger.info('Downloading subtitle %r', subtitle)
-            pp.download_subtitle(subtitle)
+            return pp.download_subtitle(subtitle)
+        for _ in imap(download_subtitle, subtitles, workers):
+            pass
+
+
+def download_ranked_subtitles(pool, ranked_subtitles, languages, downloaded_languages, count):
+    """Download the best of the `ranked_subtitles` for each language, downloading the top `count` subtitles of each
+    language left concurrently
+
+    Of the subtitles downloaded together, the highest-ranked valid subtitle of each language is kept and the others
+    are discarded, so the result is the same as downloading the subtitles one at a time in rank order at the cost of
+    extra downloads. Subtitles of a provider with a daily quota are downloaded together up to the remaining quota
+    only, the next ones are left for the next round
+
+    :param pool: the pool to download the subtitles with
+    :type pool: :class:`~subliminal.providers.ProviderPool`
+    :param ranked_subtitles: the subtitles with their score, best first, see
+        :func:`~subliminal.subtitle.iter_ranked_subtitles`
+    :type ranked_subtitles: iterator of tuple(:class:`~subliminal.subtitle.Subtitle`, int)
+    :param languages: languages of subtitles to download
+    :type languages: set of :class:`babelfish.Language`
+    :param downloaded_languages: languages already downloaded, updated with those of the downloaded subtitles
+    :type downloaded_languages: set of :class:`babelfish.Language`
+    :param int count: number of subtitles of each language to download concurrently
+    :return: the downloaded subtitles
+    :rtype: list of :class:`~subliminal.subtitle.Subtitle`
+
+    """
+    downloaded_subtitles = []
+    backlog = collections.deque()
+
+    def iter_candidates():
+        while backlog:
+            yield backlog.popleft()
+        for candidate in ranked_subtitles:
+            yield candidate
+
+    while downloaded_languages != languages:
+        # take the top subtitles of each language left, keeping the next ones for the next round
+        candidates = []
+        overflow = []
+        counts = collections.defaultdict(int)
+        remaining = {n: q.remaining for n, q in pool.quotas.items()}
+        for subtitle, score in iter_candidates():
+            if subtitle.language in downloaded_languages:
+                continue
+            if counts[subtitle.language] >= count or remaining.get(subtitle.provider_name, 1) <= 0:
+                overflow.append((subtitle, score))
+                continue
+            candidates.append((subtitle, score))
+            counts[subtitle.language] += 1
+            if subtitle.provider_name in remaining:
+                remaining[subtitle.provider_name] -= 1
+            if all(counts[l] >= count for l in languages - downloaded_languages):
+                break
+        backlog.extendleft(reversed(overflow))
+        if not candidates:
+            break
+
+        # download them concurrently and keep the best valid subtitle of each language
+        for subtitle, score in candidates:
+            logger.info('Downloading subtitle %r with score %d', subtitle, score)
+        results = list(imap(pool.download_subtitle, [s for s, _ in candidates], len(candidates)))
+        for (subtitle, score), downloaded in zip(candidates, results):
+            if not downloaded:
+                continue
+            if subtitle.language in downloaded_languages:
+                logger.debug('Discarding subtitle %r: a better one is downloaded', subtitle)
+                subtitle.content = None
+                continue
+            downloaded_languages.add(subtitle.language)
+            downloaded_subtitles.append(subtitle)
+    return downloaded_subtitles
 
 
 def download_best_subtitles(videos, languages, providers=None, provider_configs=None, min_score=0,
-                            hearing_impaired=False, single=False):
+                            hearing_impaired=False, single=False, workers=None, max_in_flight=None,
+                            speculative_downloads=None, pool=None):
     """Download the best subtitles for `videos` with the given `languages` using the specified `providers`
 
     :param videos: videos to download subtitles for
@@ -68,41 +214,60 @@ def download_best_subtitles(videos, languages, providers=None, provider_configs=
     :param int min_score: minimum score for subtitles to download
     :param bool hearing_impaired: download hearing impaired subtitles
     :param bool single: do not download for videos with an undetermined subtitle language detected
+    :param workers: number of threads to process videos with and to query providers with, if not sequentially
+    :type workers: int or None
+    :param max_in_flight: maximum number of concurrent requests by provider name, if not the provider's default
+    :type max_in_flight: dict of provider name => int or None
+    :param speculative_downloads: number of the best subtitles of each language to download concurrently, if not
+        one at a time, see :func:`download_ranked_subtitles`. Ignored with `single`
+    :type speculative_downloads: int or None
+    :param pool: long-lived pool to use instead of a new one, `providers`, `provider_configs` and `max_in_flight` are
+        then those of the pool
+    :type pool: :class:`~subliminal.providers.ProviderPool` or None
 
     """
     downloaded_subtitles = collections.defaultdict(list)
-    with ProviderPool(providers, provider_configs) as pp:
-        for video in videos:
+    with use_pool(pool, providers, provider_configs, workers, max_in_flight) as pp:
+        def download_best_video_subtitles(video):
+            video_downloaded_subtitles = []
+
             # filter
             if single and babelfish.Language('und') in video.subtitle_languages:
-                logger.debug('Skipping video %r: undetermined language found')
-                continue
+                logger.debug('Skipping video %r: undetermined language found', video)
+                return video, video_downloaded_subtitles
 
             # list
             logger.info('Listing subtitles for %r', video)
             video_subtitles = pp.list_subtitles(video, languages)
-            logger.info('Found %d subtitles total', len(video_subtitles))
+            logger.info('Found %d subtitles total for %r', len(video_subtitles), video)
 
             # download
             downloaded_languages = set()
-            for subtitle, score in sorted([(s, s.compute_score(video)) for s in video_subtitles],
-                                          key=operator.itemgetter(1), reverse=True):
-                if score < min_score:
-                    logger.info('No subtitle with score >= %d', min_score)
-                    break
+
+            def skip(subtitle):
                 if subtitle.hearing_impaired != hearing_impaired:
                     logger.debug('Skipping subtitle: hearing impaired != %r', hearing_impaired)
-                    continue
+                    return True
                 if subtitle.language in downloaded_languages:
                     logger.debug('Skipping subtitle: %r already downloaded', subtitle.language)
-                    continue
+                    return True
+                return False
+            ranked_subtitles = iter_ranked_subtitles(video_subtitles, video, min_score, skip)
+            if not single and speculative_downloads is not None and speculative_downloads > 1:
+                return video, download_ranked_subtitles(pp, ranked_subtitles, languages, downloaded_languages,
+                                                        speculative_downloads)
+            for subtitle, score in ranked_subtitles:
                 logger.info('Downloading subtitle %r with score %d', subtitle, score)
                 if pp.download_subtitle(subtitle):
                     downloaded_languages.add(subtitle.language)
-                    downloaded_subtitles[video].append(subtitle)
+                    video_downloaded_subtitles.append(subtitle)
                 if single or downloaded_languages == languages:
                     logger.debug('All languages downloaded')
                     break
+            return video, video_downloaded_subtitles
+        for video, video_downloaded_subtitles in imap(download_best_video_subtitles, videos, workers):
+            if video_downloaded_subtitles:
+                downloaded_subtitles[video].extend(video_downloaded_subtitles)
     return downloaded_subtitles
 
 
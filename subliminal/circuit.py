@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+#: Number of consecutive failures after which a circuit opens
+FAILURE_THRESHOLD = 3
+
+#: Time in seconds an open circuit waits before letting a probe through
+COOLDOWN = 300
+
+#: Number of retries of a call failing with a transient error
+RETRIES = 1
+
+#: Base delay in seconds before retrying a call failing with a transient error, doubled on each retry
+RETRY_DELAY = 1
+
+
+def get_retry_delay(retry):
+    """Get a jittered delay before a retry, picked uniformly up to :data:`RETRY_DELAY` doubled on each retry
+
+    :param int retry: number of the retry, starting at 0
+    :return: the delay in seconds
+    :rtype: float
+
+    """
+    return random.uniform(0, RETRY_DELAY * 2 ** retry)
+
+
+class CircuitBreaker(object):
+    """Circuit breaker stopping calls to a failing service and probing it again after a cool-down
+
+    The circuit is ``closed`` and lets all calls through until `failure_threshold` consecutive failures open it.
+    While ``open``, calls are not allowed until `cooldown` seconds have passed. The circuit is then ``half-open``
+    and lets a single probe call through: it closes on success and opens again on failure. Another probe is let
+    through if the previous one does not report within `cooldown` seconds. It is safe to share between threads.
+
+    :meth:`allow` gives a ticket to report the result of the call with to :meth:`record_success` and
+    :meth:`record_failure`, so only the probe decides whether the circuit closes: results of calls allowed before the
+    circuit opened do not change its state once it is open or half-open.
+
+    :param string name: name of the circuit, e.g. the provider name
+    :param int failure_threshold: number of consecutive failures to open the circuit
+    :param float cooldown: time in seconds before letting a probe through an open circuit
+    :param timer: function returning the current time in seconds
+
+    """
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, timer=time.time):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.timer = timer
+
+        #: State of the circuit, ``closed``, ``open`` or ``half-open``
+        self.state = 'closed'
+
+        #: Number of consecutive failures
+        self.failures = 0
+
+        #: Time at which the circuit last opened or let a probe through, if any
+        self.opened_at = None
+
+        #: Time in seconds the circuit waits after :attr:`opened_at` before letting a probe through
+        self.open_cooldown = cooldown
+
+        #: Ticket of the calls allowed, renewed when the circuit opens or lets a probe through
+        self.ticket = 1
+
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Check if a call is allowed, letting a probe through if the circuit is open for long enough
+
+        :return: a ticket to report the result of the call with if it is allowed, `False` otherwise
+        :rtype: int or bool
+
+        """
+        with self.lock:
+            if self.state == 'closed':
+                return self.ticket
+            # let a probe through, or another one if the previous probe never reported
+            now = self.timer()
+            if now - self.opened_at >= self.open_cooldown:
+                logger.info('Circuit %r half-open, probing', self.name)
+                self.state = 'half-open'
+                self.opened_at = now
+                self.ticket += 1
+                return self.ticket
+            return False
+
+    def is_stale(self, ticket):
+        """Check if a `ticket` is from a call allowed before the circuit opened while it is open or half-open
+
+        Must be called with the :attr:`lock` held
+
+        :param ticket: ticket given by :meth:`allow`, if any
+        :type ticket: int or None
+        :return: `True` if the ticket is stale, `False` otherwise
+        :rtype: bool
+
+        """
+        return self.state != 'closed' and ticket is not None and ticket != self.ticket
+
+    def record_success(self, ticket=None):
+        """Record a successful call, closing the circuit unless the `ticket` is stale
+
+        :param ticket: ticket given by :meth:`allow` for the call, if any
+        :type ticket: int or None
+
+        """
+        with self.lock:
+            if self.is_stale(ticket):
+                logger.debug('Ignoring late success in circuit %r', self.name)
+                return
+            if self.state != 'closed':
+                logger.info('Circuit %r closed', self.name)
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self, ticket=None):
+        """Record a failed call, opening the circuit if the probe failed or there are too many failures
+
+        A failure with a stale `ticket` or while the circuit is open is only counted, so it does not delay the next
+        probe
+
+        :param ticket: ticket given by :meth:`allow` for the call, if any
+        :type ticket: int or None
+
+        """
+        with self.lock:
+            self.failures += 1
+            if self.state == 'open' or self.is_stale(ticket):
+                return
+            if self.state == 'half-open' or self.failures >= self.failure_threshold:
+                logger.warning('Circuit %r open after %d failures', self.name, self.failures)
+                self.state = 'open'
+                self.opened_at = self.timer()
+                self.open_cooldown = self.cooldown
+                self.ticket += 1
+
+    def trip(self, cooldown=None):
+        """Open the circuit regardless of the failures, e.g. until a quota resets
+
+        :param float cooldown: time in seconds before letting a probe through, if not :attr:`cooldown`
+
+        """
+        with self.lock:
+            self.state = 'open'
+            self.opened_at = self.timer()
+            self.open_cooldown = self.cooldown if cooldown is None else cooldown
+            self.ticket += 1
+            logger.warning('Circuit %r open for %ds', self.name, self.open_cooldown)
+
+    def __repr__(self):
+        return '<%s [%s, %s, %d failures]>' % (self.__class__.__name__, self.name, self.state, self.failures)
@@ -8,8 +8,10 @@ import re
 import sys
 import babelfish
 import xdg.BaseDirectory
-from subliminal import (__version__, cache_region, MutexLock, provider_manager, Video, Episode, Movie, scan_videos,
-    download_best_subtitles, save_subtitles)
+from subliminal import (__version__, cache_region, MutexLock, provider_manager, Video, Episode, Movie, ScanIndex,
+    scan_videos, download_best_subtitles, save_subtitles)
+from subliminal.sessions import SessionStore
+from subliminal.watch import pyinotify, watch_best_subtitles
 try:
     import colorlog
 except ImportError:
@@ -17,6 +19,8 @@ except ImportError:
 
 
 DEFAULT_CACHE_FILE = os.path.join(xdg.BaseDirectory.save_cache_path('subliminal'), 'cli.dbm')
+DEFAULT_INDEX_FILE = os.path.join(xdg.BaseDirectory.save_cache_path('subliminal'), 'index.db')
+DEFAULT_SESSION_FILE = os.path.join(xdg.BaseDirectory.save_cache_path('subliminal'), 'sessions.json')
 
 
 def subliminal():
@@ -36,6 +40,20 @@ def subliminal():
                                      help='download without language code in subtitle\'s filename i.e. .srt only')
     configuration_group.add_argument('-c', '--cache-file', default=DEFAULT_CACHE_FILE,
                                      help='cache file (default: %(default)s)')
+    configuration_group.add_argument('-i', '--index-file', nargs='?', const=DEFAULT_INDEX_FILE,
+                                     help='scan index file to skip unchanged videos (default without INDEX_FILE: '
+                                     '%(const)s)')
+    configuration_group.add_argument('--session-file', nargs='?', const=DEFAULT_SESSION_FILE,
+                                     help='session file to keep provider logins across runs (default without '
+                                     'SESSION_FILE: %(const)s)')
+    configuration_group.add_argument('-w', '--workers', type=int, metavar='WORKERS',
+                                     help='number of processes to scan videos with and of threads to download their '
+                                     'subtitles with (default: sequential)')
+    configuration_group.add_argument('--follow-symlinks', action='store_true',
+                                     help='scan symbolic links to videos and folders instead of skipping them')
+    configuration_group.add_argument('-W', '--watch', action='store_true',
+                                     help='watch the folders for new videos and download their subtitles as soon as '
+                                     'they are complete (requires pyinotify)')
 
     # filtering
     filtering_group = parser.add_argument_group('filtering')
@@ -50,6 +68,15 @@ def subliminal():
     filtering_group.add_argument('-f', '--force', action='store_true',
                                  help='force subtitle download for videos with existing subtitles')
 
+    # limits
+    limits_group = parser.add_argument_group('limits')
+    limits_group.add_argument('--rate-limit', nargs=2, action='append', default=[], metavar=('PROVIDER', 'RATE'),
+                              help='maximum number of requests per second to PROVIDER (default: the provider\'s)')
+    limits_group.add_argument('--rate-burst', nargs=2, action='append', default=[], metavar=('PROVIDER', 'BURST'),
+                              help='number of requests to PROVIDER made at once before pacing them (default: 1)')
+    limits_group.add_argument('--daily-quota', nargs=2, action='append', default=[], metavar=('PROVIDER', 'QUOTA'),
+                              help='maximum number of downloads per day from PROVIDER (default: the provider\'s)')
+
     # addic7ed
     addic7ed_group = parser.add_argument_group('addic7ed')
     addic7ed_group.add_argument('--addic7ed-username', metavar='USERNAME', help='username for addic7ed provider')
@@ -96,12 +123,37 @@ def subliminal():
             parser.error('argument -a/--age: invalid age: %r' % args.age)
         args.age = datetime.timedelta(**{k: int(v) for k, v in match.groupdict(0).items()})
 
+    # parse workers
+    if args.workers is not None and args.workers < 1:
+        parser.error('argument -w/--workers: invalid number of workers: %r' % args.workers)
+
     # parse cache-file
     args.cache_file = os.path.abspath(os.path.expanduser(args.cache_file))
     if not os.path.exists(os.path.split(args.cache_file)[0]):
         parser.error('argument -c/--cache-file: directory %r for cache file does not exist'
                      % os.path.split(args.cache_file)[0])
 
+    # parse watch
+    if args.watch:
+        if pyinotify is None:
+            parser.error('argument -W/--watch: pyinotify required')
+        if not all(os.path.isdir(p) for p in args.paths):
+            parser.error('argument -W/--watch: paths must be folders: %r' % args.paths)
+
+    # parse index-file
+    if args.index_file is not None:
+        args.index_file = os.path.abspath(os.path.expanduser(args.index_file))
+        if not os.path.exists(os.path.split(args.index_file)[0]):
+            parser.error('argument -i/--index-file: directory %r for index file does not exist'
+                         % os.path.split(args.index_file)[0])
+
+    # parse session-file
+    if args.session_file is not None:
+        args.session_file = os.path.abspath(os.path.expanduser(args.session_file))
+        if not os.path.exists(os.path.split(args.session_file)[0]):
+            parser.error('argument --session-file: directory %r for session file does not exist'
+                         % os.path.split(args.session_file)[0])
+
     # parse provider configs
     provider_configs = {}
     if (args.addic7ed_username is not None and args.addic7ed_password is None
@@ -109,6 +161,21 @@ def subliminal():
         parser.error('argument --addic7ed-username/--addic7ed-password: both arguments are required or none')
     if args.addic7ed_username is not None and args.addic7ed_password is not None:
         provider_configs['addic7ed'] = {'username': args.addic7ed_username, 'password': args.addic7ed_password}
+    for option, key, type_ in (('--rate-limit', 'rate_limit', float), ('--rate-burst', 'rate_burst', int),
+                               ('--daily-quota', 'daily_quota', int)):
+        for provider_name, value in getattr(args, key):
+            if provider_name not in provider_manager.available_providers:
+                parser.error('argument %s: invalid provider: %r' % (option, provider_name))
+            try:
+                provider_configs.setdefault(provider_name, {})[key] = type_(value)
+            except ValueError:
+                parser.error('argument %s: invalid value: %r' % (option, value))
+            if provider_configs[provider_name][key] <= 0:
+                parser.error('argument %s: value must be positive: %r' % (option, value))
+    if args.session_file is not None:
+        session_store = SessionStore(args.session_file)
+        for provider_name in ('addic7ed', 'opensubtitles'):
+            provider_configs.setdefault(provider_name, {})['session_store'] = session_store
 
     # parse color
     if args.color and colorlog is None:
@@ -169,9 +236,41 @@ def subliminal():
     cache_region.configure('dogpile.cache.dbm', expiration_time=datetime.timedelta(days=30),  # @UndefinedVariable
                            arguments={'filename': args.cache_file, 'lock_factory': MutexLock})
 
+    # watch videos
+    if args.watch:
+        index = ScanIndex(args.index_file) if args.index_file is not None else None
+        watcher = watch_best_subtitles(args.paths, args.languages, providers=args.providers,
+                                       provider_configs=provider_configs, min_score=args.min_score,
+                                       hearing_impaired=args.hearing_impaired, single=args.single,
+                                       subtitles=not args.force, embedded_subtitles=not args.force,
+                                       workers=args.workers, index=index, follow_symlinks=args.follow_symlinks)
+        try:
+            for subtitles in watcher:
+                save_subtitles(subtitles, single=args.single, directory=args.directory, encoding=args.encoding)
+                if not args.quiet:
+                    subtitles_count = sum([len(s) for s in subtitles.values()])
+                    if subtitles_count == 1:
+                        print('%d subtitle downloaded' % subtitles_count)
+                    else:
+                        print('%d subtitles downloaded' % subtitles_count)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+            if index is not None:
+                index.close()
+        return
+
     # scan videos
-    videos = scan_videos([p for p in args.paths if os.path.exists(p)], subtitles=not args.force,
-                         embedded_subtitles=not args.force, age=args.age)
+    index = ScanIndex(args.index_file) if args.index_file is not None else None
+    try:
+        videos = scan_videos([p for p in args.paths if os.path.exists(p)], subtitles=not args.force,
+                             embedded_subtitles=not args.force, age=args.age, workers=args.workers, index=index,
+                             hash_functions=provider_manager.get_hash_functions(args.providers),
+                             follow_symlinks=args.follow_symlinks)
+    finally:
+        if index is not None:
+            index.close()
 
     # guess videos
     videos.extend([Video.fromname(p) for p in args.paths if not os.path.exists(p)])
@@ -179,7 +278,8 @@ def subliminal():
     # download best subtitles
     subtitles = download_best_subtitles(videos, args.languages, providers=args.providers,
                                         provider_configs=provider_configs, min_score=args.min_score,
-                                        hearing_impaired=args.hearing_impaired, single=args.single)
+                                        hearing_impaired=args.hearing_impaired, single=args.single,
+                                        workers=args.workers)
 
     # save subtitles
     save_subtitles(subtitles, single=args.single, directory=args.directory, encoding=args.encoding)
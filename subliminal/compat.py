@@ -1,21 +1,69 @@
 # -*- coding: utf-8 -*-
+import os
+import stat
 import sys
-import socket
 
 
 if sys.version_info[0] == 2:
-    from xmlrpclib import ServerProxy, Transport
-    from httplib import HTTPConnection
+    from xmlrpclib import ServerProxy, Transport, ProtocolError
 elif sys.version_info[0] == 3:
-    from xmlrpc.client import ServerProxy, Transport
-    from http.client import HTTPConnection
+    from xmlrpc.client import ServerProxy, Transport, ProtocolError
 
 
-class TimeoutTransport(Transport, object):
-    def __init__(self, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, *args, **kwargs):
-        super(TimeoutTransport, self).__init__(*args, **kwargs)
-        self.timeout = timeout
+class DirEntry(object):
+    """Entry of a directory with the same API as the entries of :func:`os.scandir`
 
-    def make_connection(self, host):
-        h = HTTPConnection(host, timeout=self.timeout)
-        return h
+    The result of :func:`os.lstat` is cached on first use and reused by :meth:`stat` for anything
+    but symbolic links, so there is at most one syscall per entry.
+
+    :param string dirpath: path to the directory of the entry
+    :param string name: name of the entry
+
+    """
+    def __init__(self, dirpath, name):
+        self.dirpath = dirpath
+        self.name = name
+        self._lstat = None
+        self._stat = None
+
+    @property
+    def path(self):
+        return os.path.join(self.dirpath, self.name)
+
+    def stat(self, follow_symlinks=True):
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        if not follow_symlinks or not stat.S_ISLNK(self._lstat.st_mode):
+            return self._lstat
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.stat(follow_symlinks=False).st_mode)
+
+    def is_dir(self, follow_symlinks=True):
+        try:
+            return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        try:
+            return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def __repr__(self):
+        return '<%s [%r]>' % (self.__class__.__name__, self.name)
+
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        def scandir(path):
+            """Fallback for :func:`os.scandir` with :class:`DirEntry` entries"""
+            return (DirEntry(path, name) for name in os.listdir(path))
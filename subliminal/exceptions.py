@@ -20,3 +20,7 @@ class AuthenticationError(ProviderError):
 
 class DownloadLimitExceeded(ProviderError):
     """Exception raised by providers when download limit is exceeded"""
+
+
+class ProbeError(Error):
+    """Exception raised when the metadata of a video cannot be probed from its headers"""
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import collections
+import datetime
+import logging
+import threading
+import guessit
+import guessit.matchtree
+import guessit.plugins.transformers
+from .cache import CACHE_VERSION
+
+
+logger = logging.getLogger(__name__)
+
+#: Maximum number of guesses kept in memory
+GUESS_CACHE_SIZE = 4096
+
+#: Expiration time for guess caching in the region
+GUESS_EXPIRATION_TIME = datetime.timedelta(weeks=3).total_seconds()
+
+
+def extract_properties(string):
+    """Extract all the properties of `string` in a single pass of guessit's own properties transformer instance
+
+    Supported properties are those of :meth:`guessit.transfo.guess_properties.GuessProperties.supported_properties`,
+    e.g. screenSize, format, videoCodec and audioCodec
+
+    :param string string: the string to extract the properties from
+    :return: the values found for each property
+    :rtype: dict of property => set
+
+    """
+    properties = {}
+    if not string:
+        return properties
+    tree = guessit.matchtree.MatchTree(string)
+    guessit.plugins.transformers.get_transformer('guess_properties').process(tree)
+    for node in tree.nodes():
+        for name, value in node.guess.items():
+            properties.setdefault(name, set()).add(value)
+    return properties
+
+
+#: Guess functions by guess type
+GUESS_FUNCTIONS = {'file': guessit.guess_file_info, 'episode': guessit.guess_episode_info,
+                   'movie': guessit.guess_movie_info, 'properties': extract_properties}
+
+
+class GuessCache(object):
+    """In-memory LRU cache of guessit guesses, optionally backed by a dogpile.cache region
+
+    Guesses are keyed on the guessed string and the guess type. They are shared between callers and must not
+    be modified.
+
+    :param int size: maximum number of guesses kept in memory
+    :param region: region to look up and store the guesses missing from memory, if any
+    :type region: :class:`dogpile.cache.region.CacheRegion` or None
+
+    """
+    def __init__(self, size=GUESS_CACHE_SIZE, region=None):
+        self.size = size
+        self.region = region
+
+        #: Guesses by (guess type, string), least recently used first
+        self.guesses = collections.OrderedDict()
+
+        #: Number of guesses found in memory
+        self.hits = 0
+
+        #: Number of guesses not found in memory
+        self.misses = 0
+
+        self.lock = threading.Lock()
+
+    def guess(self, string, guess_type):
+        """Guess `string` with the guessit function of `guess_type`, see :data:`GUESS_FUNCTIONS`
+
+        :param string string: the string to guess
+        :param string guess_type: the type of guess, file, episode, movie or properties
+        :return: the guess
+        :rtype: :class:`guessit.Guess` or dict for properties
+
+        """
+        key = (guess_type, string)
+        with self.lock:
+            guess = self.guesses.pop(key, None)
+            if guess is not None:
+                self.hits += 1
+                self.guesses[key] = guess
+                return guess
+            self.misses += 1
+        if self.region is not None:
+            guess = self.region.get_or_create('%d:guess:%s:%s|%s' % (CACHE_VERSION, guessit.__version__, guess_type,
+                                                                     string),
+                                              lambda: GUESS_FUNCTIONS[guess_type](string),
+                                              expiration_time=GUESS_EXPIRATION_TIME)
+        else:
+            guess = GUESS_FUNCTIONS[guess_type](string)
+        with self.lock:
+            self.guesses[key] = guess
+            while len(self.guesses) > self.size:
+                self.guesses.popitem(last=False)
+        return guess
+
+    def clear(self):
+        """Clear the guesses kept in memory and the counters"""
+        with self.lock:
+            self.guesses.clear()
+            self.hits = self.misses = 0
+
+    def __repr__(self):
+        return '<%s [%d/%d, %d hits, %d misses]>' % (self.__class__.__name__, len(self.guesses), self.size, self.hits,
+                                                     self.misses)
+
+
+#: The guess cache all guesses go through
+guess_cache = GuessCache()
+
+
+def guess_file_info(string):
+    """Cached :func:`guessit.guess_file_info`, see :data:`guess_cache`"""
+    return guess_cache.guess(string, 'file')
+
+
+def guess_episode_info(string):
+    """Cached :func:`guessit.guess_episode_info`, see :data:`guess_cache`"""
+    return guess_cache.guess(string, 'episode')
+
+
+def guess_movie_info(string):
+    """Cached :func:`guessit.guess_movie_info`, see :data:`guess_cache`"""
+    return guess_cache.guess(string, 'movie')
+
+
+def guess_properties_info(string):
+    """Cached :func:`extract_properties`, see :data:`guess_cache`"""
+    return guess_cache.guess(string, 'properties')
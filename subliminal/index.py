@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+
+logger = logging.getLogger(__name__)
+
+#: Scan index version, to be incremented when the schema or the stored videos change
+INDEX_VERSION = 2
+
+#: Number of writes between two commits
+COMMIT_INTERVAL = 100
+
+#: Time in seconds since the modification of a directory during which its listing is not indexed, as a change within
+#: the resolution of the modification time would not change it
+RACY_MTIME_WINDOW = 2
+
+
+class ScanIndex(object):
+    """On-disk index of scanned videos and directory listings, stored in a SQLite database
+
+    Videos are stored with their identity: path, size, modification time and inode. A video is only scanned
+    again when its identity changes. Directories are stored with their modification time and their listing is
+    reused by :func:`~subliminal.video.walk` as long as it is unchanged. Listings of directories modified less than
+    :data:`RACY_MTIME_WINDOW` seconds before they are listed are not stored, as they could change again without
+    changing their modification time.
+
+    Subtitle languages from external subtitle files are not stored as they depend on the other files
+    of the directory, see :func:`~subliminal.video.iter_videos`.
+
+    The :class:`ScanIndex` supports the ``with`` statement to :meth:`close` the database
+
+    :param string filename: path to the database
+    :param timer: function returning the current time in seconds since the epoch
+
+    """
+    def __init__(self, filename, timer=time.time):
+        self.filename = filename
+        self.timer = timer
+        self.connection = sqlite3.connect(filename)
+        self.writes = 0
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != INDEX_VERSION:
+            logger.info('Index version %d is not %d, resetting it', version, INDEX_VERSION)
+            self.connection.execute('DROP TABLE IF EXISTS videos')
+            self.connection.execute('DROP TABLE IF EXISTS directories')
+            self.connection.execute('PRAGMA user_version = %d' % INDEX_VERSION)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS videos (path TEXT PRIMARY KEY, directory TEXT, '
+                                'size INTEGER, mtime REAL, inode INTEGER, embedded_subtitles INTEGER, video BLOB)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS videos_directory ON videos (directory)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS directories (path TEXT PRIMARY KEY, mtime REAL, '
+                                'inode INTEGER, listing BLOB)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):  # @ReservedAssignment
+        self.close()
+
+    def get_video(self, path, stat, embedded_subtitles=True):
+        """Get the indexed video at `path` if its identity did not change
+
+        :param string path: path to the video
+        :param stat: result of :func:`os.stat` on `path`
+        :param bool embedded_subtitles: whether the video must have been scanned for embedded subtitles
+        :return: the indexed video, if any
+        :rtype: :class:`~subliminal.video.Video` or None
+
+        """
+        row = self.connection.execute('SELECT video FROM videos WHERE path = ? AND size = ? AND mtime = ? '
+                                      'AND inode = ? AND embedded_subtitles = ?',
+                                      (path, stat.st_size, stat.st_mtime, stat.st_ino, embedded_subtitles)).fetchone()
+        if row is None:
+            return None
+        logger.debug('Found video %r in the index', path)
+        return pickle.loads(bytes(row[0]))
+
+    def set_video(self, path, stat, video, embedded_subtitles=True):
+        """Index the `video` at `path` with its identity
+
+        :param string path: path to the video
+        :param stat: result of :func:`os.stat` on `path` before the `video` was scanned
+        :param video: the scanned video
+        :type video: :class:`~subliminal.video.Video`
+        :param bool embedded_subtitles: whether the video has been scanned for embedded subtitles
+
+        """
+        self.connection.execute('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (path, os.path.dirname(path), stat.st_size, stat.st_mtime, stat.st_ino,
+                                 embedded_subtitles, sqlite3.Binary(pickle.dumps(video, 2))))
+        self.write()
+
+    def get_directory(self, path, stat):
+        """Get the indexed listing of the directory at `path` if its modification time did not change
+
+        :param string path: path to the directory
+        :param stat: result of :func:`os.stat` on `path`
+        :return: names of the sub directories, of the symbolic links to directories and of the other files, if any
+        :rtype: tuple of (list, list, list) or None
+
+        """
+        row = self.connection.execute('SELECT listing FROM directories WHERE path = ? AND mtime = ? AND inode = ?',
+                                      (path, stat.st_mtime, stat.st_ino)).fetchone()
+        if row is None:
+            return None
+        logger.debug('Found directory %r in the index', path)
+        return pickle.loads(bytes(row[0]))
+
+    def set_directory(self, path, stat, dirnames, linknames, filenames):
+        """Index the listing of the directory at `path` and forget about videos that are no longer in it
+
+        The listing is not indexed if the directory was modified within :data:`RACY_MTIME_WINDOW` seconds
+
+        :param string path: path to the directory
+        :param stat: result of :func:`os.stat` on `path` before it was listed
+        :param list dirnames: names of the sub directories
+        :param list linknames: names of the symbolic links to directories
+        :param list filenames: names of the other files
+
+        """
+        if self.timer() - stat.st_mtime < RACY_MTIME_WINDOW:
+            logger.debug('Directory %r was modified too recently to index its listing', path)
+            self.connection.execute('DELETE FROM directories WHERE path = ?', (path,))
+        else:
+            self.connection.execute('INSERT OR REPLACE INTO directories VALUES (?, ?, ?, ?)',
+                                    (path, stat.st_mtime, stat.st_ino,
+                                     sqlite3.Binary(pickle.dumps((dirnames, linknames, filenames), 2))))
+        filepaths = set(os.path.join(path, f) for f in filenames if not isinstance(f, bytes))
+        for (filepath,) in self.connection.execute('SELECT path FROM videos WHERE directory = ?', (path,)).fetchall():
+            if filepath not in filepaths:
+                logger.debug('Removing video %r from the index', filepath)
+                self.connection.execute('DELETE FROM videos WHERE path = ?', (filepath,))
+        self.write()
+
+    def write(self):
+        """Count a write and commit when :data:`COMMIT_INTERVAL` is reached"""
+        self.writes += 1
+        if self.writes % COMMIT_INTERVAL == 0:
+            self.commit()
+
+    def commit(self):
+        """Commit the pending writes"""
+        self.connection.commit()
+
+    def close(self):
+        """Commit and close the database"""
+        self.commit()
+        self.connection.close()
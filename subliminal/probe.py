@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+import os
+import struct
+import babelfish
+import enzyme
+from .exceptions import ProbeError
+
+
+logger = logging.getLogger(__name__)
+
+#: Maximum number of bytes read from a video to probe its metadata
+DEFAULT_BUDGET = 262144
+
+#: Matroska element ids
+MKV_EBML = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_CLUSTER = 0x1F43B675
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_LANGUAGE = 0x22B59C
+MKV_NAME = 0x536E
+MKV_VIDEO = 0xE0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_FLAG_INTERLACED = 0x9A
+
+#: Matroska track types
+MKV_TRACK_TYPES = {1: 'video', 2: 'audio', 0x11: 'subtitle'}
+
+#: Matroska codec ids
+MKV_CODECS = {'V_MPEG4/ISO/AVC': 'h264', 'V_MPEG4/ISO/SP': 'DivX', 'V_MPEG4/ISO/ASP': 'XviD', 'A_AC3': 'AC3',
+              'A_DTS': 'DTS', 'A_AAC': 'AAC'}
+
+#: MP4 handler types
+MP4_TRACK_TYPES = {b'vide': 'video', b'soun': 'audio', b'sbtl': 'subtitle', b'subt': 'subtitle'}
+
+#: MP4 sample entry formats of the text tracks that are subtitles, unless they are chapter tracks
+MP4_TEXT_SUBTITLE_FORMATS = {b'tx3g'}
+
+#: MP4 sample entry formats
+MP4_CODECS = {b'avc1': 'h264', b'avc3': 'h264', b'ac-3': 'AC3', b'mp4a': 'AAC', b'dtsc': 'DTS', b'dtsh': 'DTS',
+              b'dtsl': 'DTS'}
+
+#: AVI stream types
+AVI_TRACK_TYPES = {b'vids': 'video', b'auds': 'audio', b'txts': 'subtitle'}
+
+#: AVI video compressions
+AVI_VIDEO_CODECS = {b'H264': 'h264', b'X264': 'h264', b'AVC1': 'h264', b'DIVX': 'DivX', b'DX50': 'DivX',
+                    b'XVID': 'XviD'}
+
+#: AVI audio format tags
+AVI_AUDIO_CODECS = {0x2000: 'AC3', 0x2001: 'DTS', 0xFF: 'AAC'}
+
+
+class Track(object):
+    """Track of a video
+
+    :param string type: type of the track, one of video, audio or subtitle
+    :param codec: codec of the track, if known
+    :type codec: string or None
+    :param height: height in pixels of a video track, if known
+    :type height: int or None
+    :param bool interlaced: whether a video track is interlaced
+    :param language: language of the track, if known
+    :type language: :class:`babelfish.Language` or None
+
+    """
+    def __init__(self, type, codec=None, height=None, interlaced=False, language=None):  # @ReservedAssignment
+        self.type = type
+        self.codec = codec
+        self.height = height
+        self.interlaced = interlaced
+        self.language = language
+
+    def __repr__(self):
+        return '<%s [%s, %r]>' % (self.__class__.__name__, self.type, self.codec)
+
+
+class BudgetReader(object):
+    """File wrapper raising :class:`~subliminal.exceptions.ProbeError` when more than `budget` bytes are read
+
+    Seeking is free so elements that are not needed can be skipped without reading them
+
+    :param f: file object to read from
+    :param int budget: maximum number of bytes to read
+
+    """
+    def __init__(self, f, budget=DEFAULT_BUDGET):
+        self.f = f
+        self.budget = budget
+
+    def read(self, size):
+        """Read exactly `size` bytes
+
+        :param int size: number of bytes to read
+        :return: the bytes read
+        :rtype: bytes
+        :raise: :class:`~subliminal.exceptions.ProbeError` if `size` is negative, the budget is exceeded or the file is
+            too short
+
+        """
+        if size < 0:
+            raise ProbeError('Invalid read size')
+        if size > self.budget:
+            raise ProbeError('Byte budget exceeded')
+        data = self.f.read(size)
+        self.budget -= len(data)
+        if len(data) < size:
+            raise ProbeError('Unexpected end of file')
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.f.seek(offset, whence)
+
+    def tell(self):
+        return self.f.tell()
+
+
+def probe(path, budget=DEFAULT_BUDGET):
+    """Probe the tracks of a video from its headers only, reading at most `budget` bytes
+
+    Supported containers are Matroska, MP4 and AVI
+
+    :param string path: path to the video
+    :param int budget: maximum number of bytes to read
+    :return: the tracks of the video
+    :rtype: list of :class:`Track`
+    :raise: :class:`~subliminal.exceptions.ProbeError` if the container is not supported, the headers are malformed
+        or the budget is exceeded
+
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.mkv', '.webm'):
+        probe_function = probe_mkv
+    elif extension in ('.mp4', '.m4v', '.mov'):
+        probe_function = probe_mp4
+    elif extension == '.avi':
+        probe_function = probe_avi
+    else:
+        raise ProbeError('Unsupported container %r' % extension)
+    with open(path, 'rb') as f:
+        reader = BudgetReader(f, budget)
+        tracks = probe_function(reader)
+    logger.debug('Probed tracks %r with %d bytes left', tracks, reader.budget)
+    return tracks
+
+
+def probe_enzyme(path):
+    """Probe the tracks of a Matroska video with a full parse by :mod:`enzyme`
+
+    This is the fallback of :func:`probe` for Matroska videos
+
+    :param string path: path to the video
+    :return: the tracks of the video
+    :rtype: list of :class:`Track`
+    :raise: :class:`~subliminal.exceptions.ProbeError` if the parsing failed
+
+    """
+    try:
+        with open(path, 'rb') as f:
+            mkv = enzyme.MKV(f)
+    except enzyme.Error as e:
+        raise ProbeError('Parsing with enzyme failed: %s' % e)
+    tracks = []
+    for video_track in mkv.video_tracks:
+        tracks.append(Track('video', MKV_CODECS.get(video_track.codec_id), video_track.height,
+                            bool(video_track.interlaced)))
+    for audio_track in mkv.audio_tracks:
+        tracks.append(Track('audio', MKV_CODECS.get(audio_track.codec_id)))
+    for subtitle_track in mkv.subtitle_tracks:
+        tracks.append(Track('subtitle', MKV_CODECS.get(subtitle_track.codec_id),
+                            language=mkv_language(subtitle_track.language, subtitle_track.name)))
+    return tracks
+
+
+def read_vint(data, position, keep_marker=False):
+    """Read an EBML variable size integer
+
+    :param bytearray data: data to read from
+    :param int position: position of the integer in `data`
+    :param bool keep_marker: keep the length marker, as in element ids
+    :return: the integer, or `None` for the reserved unknown size, and the position after it
+    :rtype: tuple of (int or None, int)
+    :raise: :class:`~subliminal.exceptions.ProbeError` if the integer is invalid
+
+    """
+    if position >= len(data):
+        raise ProbeError('Truncated EBML integer')
+    length = vint_length(data[position], 8)
+    if position + length > len(data):
+        raise ProbeError('Truncated EBML integer')
+    value = data[position] if keep_marker else data[position] & (0xFF >> length)
+    unknown = value == 0xFF >> length
+    for byte in data[position + 1:position + length]:
+        value = value << 8 | byte
+        unknown = unknown and byte == 0xFF
+    if unknown and not keep_marker:
+        return None, position + length
+    return value, position + length
+
+
+def read_element_header(reader):
+    """Read the id and the size of the next EBML element in `reader`
+
+    :param reader: reader positioned at the start of the element
+    :type reader: :class:`BudgetReader`
+    :return: the id and the size of the element, `None` if unknown
+    :rtype: tuple of (int, int or None)
+
+    """
+    data = bytearray(reader.read(1))
+    data += bytearray(reader.read(vint_length(data[0], 4) - 1))
+    element_id, position = read_vint(data, 0, keep_marker=True)
+    data += bytearray(reader.read(1))
+    data += bytearray(reader.read(vint_length(data[position], 8) - 1))
+    element_size, _ = read_vint(data, position)
+    return element_id, element_size
+
+
+def vint_length(byte, max_length):
+    """Get the length of an EBML variable size integer from its first byte
+
+    :param int byte: first byte of the integer
+    :param int max_length: maximum length of the integer
+    :return: the length of the integer
+    :rtype: int
+    :raise: :class:`~subliminal.exceptions.ProbeError` if the length is greater than `max_length`
+
+    """
+    length = 1
+    while length <= max_length and not byte & (0x80 >> (length - 1)):
+        length += 1
+    if length > max_length:
+        raise ProbeError('Invalid EBML integer')
+    return length
+
+
+def iter_elements(data):
+    """Iterate over the EBML elements of `data`
+
+    :param bytearray data: data of a master element
+    :return: a generator of element ids with their data
+    :rtype: generator of tuple of (int, bytearray)
+
+    """
+    position = 0
+    while position < len(data):
+        element_id, position = read_vint(data, position, keep_marker=True)
+        size, position = read_vint(data, position)
+        if size is None or position + size > len(data):
+            raise ProbeError('Truncated EBML element')
+        yield element_id, data[position:position + size]
+        position += size
+
+
+def read_uint(data):
+    value = 0
+    for byte in data:
+        value = value << 8 | byte
+    return value
+
+
+def read_string(data, encoding='ascii'):
+    return bytes(data).rstrip(b'\x00').decode(encoding, 'replace')
+
+
+def mkv_language(language, name):
+    """Get the language of a Matroska track from its ISO-639-2/B `language` or its `name`
+
+    :param language: language element of the track, if any
+    :type language: string or None
+    :param name: name element of the track, if any
+    :type name: string or None
+    :return: the language, if any
+    :rtype: :class:`babelfish.Language` or None
+
+    """
+    if language:
+        try:
+            return babelfish.Language.fromalpha3b(language)
+        except babelfish.Error:
+            logger.error('Embedded subtitle track language %r is not a valid language', language)
+            return babelfish.Language('und')
+    if name:
+        try:
+            return babelfish.Language.fromname(name)
+        except babelfish.Error:
+            logger.debug('Embedded subtitle track name %r is not a valid language', name)
+            return babelfish.Language('und')
+    return None
+
+
+def probe_mkv(reader):
+    """Probe the tracks of a Matroska video, only reading its Tracks element
+
+    Top level elements of the Segment are skipped until the Tracks element is found. If the first Cluster comes
+    before, the position of the Tracks element is taken from the SeekHead.
+
+    :param reader: reader positioned at the start of the video
+    :type reader: :class:`BudgetReader`
+    :return: the tracks of the video
+    :rtype: list of :class:`Track`
+
+    """
+    element_id, size = read_element_header(reader)
+    if element_id != MKV_EBML or size is None:
+        raise ProbeError('No EBML header found')
+    reader.seek(size, os.SEEK_CUR)
+    element_id, _ = read_element_header(reader)
+    if element_id != MKV_SEGMENT:
+        raise ProbeError('No Segment found')
+    segment_position = reader.tell()
+    tracks_position = None
+    while True:
+        element_id, size = read_element_header(reader)
+        if element_id == MKV_TRACKS:
+            if size is None:
+                raise ProbeError('Tracks with unknown size')
+            return parse_mkv_tracks(bytearray(reader.read(size)))
+        if element_id == MKV_SEEK_HEAD and size is not None:
+            for seek_id, seek in iter_elements(bytearray(reader.read(size))):
+                if seek_id != MKV_SEEK:
+                    continue
+                seek_elements = dict(iter_elements(seek))
+                if read_uint(seek_elements.get(MKV_SEEK_ID, b'')) == MKV_TRACKS:
+                    tracks_position = segment_position + read_uint(seek_elements.get(MKV_SEEK_POSITION, b''))
+            continue
+        if element_id == MKV_CLUSTER or size is None:
+            if tracks_position is None:
+                raise ProbeError('No Tracks before the first Cluster')
+            logger.debug('Seeking to Tracks at %d', tracks_position)
+            reader.seek(tracks_position)
+            tracks_position = None
+            continue
+        reader.seek(size, os.SEEK_CUR)
+
+
+def parse_mkv_tracks(data):
+    """Parse the data of a Matroska Tracks element
+
+    :param bytearray data: data of the Tracks element
+    :return: the tracks
+    :rtype: list of :class:`Track`
+
+    """
+    tracks = []
+    for element_id, track_entry in iter_elements(data):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        elements = dict(iter_elements(track_entry))
+        track_type = MKV_TRACK_TYPES.get(read_uint(elements.get(MKV_TRACK_TYPE, b'')))
+        if track_type is None:
+            continue
+        track = Track(track_type, MKV_CODECS.get(read_string(elements.get(MKV_CODEC_ID, b''))))
+        if track_type == 'video' and MKV_VIDEO in elements:
+            video_elements = dict(iter_elements(elements[MKV_VIDEO]))
+            if MKV_PIXEL_HEIGHT in video_elements:
+                track.height = read_uint(video_elements[MKV_PIXEL_HEIGHT])
+            track.interlaced = read_uint(video_elements.get(MKV_FLAG_INTERLACED, b'')) == 1
+        elif track_type == 'subtitle':
+            track.language = mkv_language(read_string(elements.get(MKV_LANGUAGE, b'')),
+                                          read_string(elements.get(MKV_NAME, b''), 'utf-8'))
+        tracks.append(track)
+    return tracks
+
+
+def iter_boxes(reader, end=None):
+    """Iterate over the MP4 boxes from the current position of `reader` to `end`
+
+    The reader is positioned at the end of each box before reading the next one so the caller only reads
+    what it needs
+
+    :param reader: reader positioned at the start of the first box
+    :type reader: :class:`BudgetReader`
+    :param end: position of the end of the boxes, if not the end of the file
+    :type end: int or None
+    :return: a generator of box types with the positions of their data and of their end, `None` if the box
+        extends to the end of the file
+    :rtype: generator of tuple of (bytes, int, int or None)
+
+    """
+    position = reader.tell()
+    while end is None or position + 8 <= end:
+        try:
+            size, box_type = struct.unpack(b'>I4s', reader.read(8))
+        except ProbeError:
+            if end is None:
+                return
+            raise
+        data_position = position + 8
+        if size == 1:
+            (size,) = struct.unpack(b'>Q', reader.read(8))
+            data_position += 8
+        if size == 0:
+            yield box_type, data_position, end
+            return
+        if size < data_position - position:
+            raise ProbeError('Invalid box size')
+        yield box_type, data_position, position + size
+        position += size
+        reader.seek(position)
+
+
+def probe_mp4(reader):
+    """Probe the tracks of an MP4 video, only reading the headers of the tracks in its moov box
+
+    :param reader: reader positioned at the start of the video
+    :type reader: :class:`BudgetReader`
+    :return: the tracks of the video
+    :rtype: list of :class:`Track`
+
+    """
+    for box_type, _, moov_end in iter_boxes(reader):
+        if box_type != b'moov':
+            continue
+        traks = []
+        chapter_track_ids = set()
+        for moov_box_type, _, trak_end in iter_boxes(reader, moov_end):
+            if moov_box_type != b'trak':
+                continue
+            track_id, chapter_ids, track = probe_mp4_trak(reader, trak_end)
+            traks.append((track_id, track))
+            chapter_track_ids.update(chapter_ids)
+        return [t for i, t in traks if t is not None and i not in chapter_track_ids]
+    raise ProbeError('No moov box found')
+
+
+def probe_mp4_trak(reader, end):
+    """Probe a track from the trak box of an MP4 video
+
+    :param reader: reader positioned at the start of the data of the trak box
+    :type reader: :class:`BudgetReader`
+    :param int end: position of the end of the trak box
+    :return: the id of the track, the ids of its chapter tracks and the track, if it is a video, audio or subtitle
+        track
+    :rtype: tuple of (int, list of int, :class:`Track` or None)
+
+    """
+    track_id = handler_type = codec = height = language = None
+    chapter_ids = []
+    for box_type, _, box_end in iter_boxes(reader, end):
+        if box_type == b'tkhd':
+            version = bytearray(reader.read(1))[0]
+            # flags then creation and modification times
+            reader.seek(19 if version == 1 else 11, os.SEEK_CUR)
+            (track_id,) = struct.unpack(b'>I', reader.read(4))
+            continue
+        if box_type == b'tref':
+            for tref_box_type, tref_data_position, tref_box_end in iter_boxes(reader, box_end):
+                if tref_box_type == b'chap':
+                    count = (tref_box_end - tref_data_position) // 4
+                    chapter_ids.extend(struct.unpack(b'>' + b'I' * count, reader.read(count * 4)))
+            continue
+        if box_type != b'mdia':
+            continue
+        for mdia_box_type, _, mdia_box_end in iter_boxes(reader, box_end):
+            if mdia_box_type == b'mdhd':
+                version = bytearray(reader.read(1))[0]
+                reader.seek(31 if version == 1 else 19, os.SEEK_CUR)
+                (packed,) = struct.unpack(b'>H', reader.read(2))
+                code = ''.join(chr(((packed >> shift) & 0x1F) + 0x60) for shift in (10, 5, 0))
+                language = mp4_language(code)
+            elif mdia_box_type == b'hdlr':
+                handler_type = reader.read(12)[8:]
+            elif mdia_box_type == b'minf':
+                for minf_box_type, _, minf_box_end in iter_boxes(reader, mdia_box_end):
+                    if minf_box_type != b'stbl':
+                        continue
+                    for stbl_box_type, _, _ in iter_boxes(reader, minf_box_end):
+                        if stbl_box_type != b'stsd':
+                            continue
+                        # full box header, entry count, then the sample entry size and format
+                        codec = reader.read(16)[12:]
+                        if MP4_TRACK_TYPES.get(handler_type) == 'video':
+                            # reserved, data reference index, pre defined and reserved then width and height
+                            reader.seek(24, os.SEEK_CUR)
+                            (height,) = struct.unpack(b'>H', reader.read(4)[2:])
+                        break
+                    break
+    track_type = MP4_TRACK_TYPES.get(handler_type)
+    if handler_type == b'text' and codec in MP4_TEXT_SUBTITLE_FORMATS:
+        track_type = 'subtitle'
+    if track_type is None:
+        return track_id, chapter_ids, None
+    return track_id, chapter_ids, Track(track_type, MP4_CODECS.get(codec), height,
+                                        language=language if track_type == 'subtitle' else None)
+
+
+def mp4_language(code):
+    """Get the language of an MP4 track from its packed ISO-639-2/T `code`
+
+    :param string code: language code of the track
+    :return: the language, `None` if undetermined
+    :rtype: :class:`babelfish.Language` or None
+
+    """
+    if code in ('und', '```'):
+        return None
+    try:
+        return babelfish.Language(code)
+    except ValueError:
+        try:
+            return babelfish.Language.fromalpha3b(code)
+        except babelfish.Error:
+            logger.error('Track language %r is not a valid language', code)
+            return babelfish.Language('und')
+
+
+def probe_avi(reader):
+    """Probe the tracks of an AVI video, only reading its hdrl list
+
+    :param reader: reader positioned at the start of the video
+    :type reader: :class:`BudgetReader`
+    :return: the tracks of the video
+    :rtype: list of :class:`Track`
+
+    """
+    riff, _, form_type, list_id, size, list_type = struct.unpack(b'<4sI4s4sI4s', reader.read(24))
+    if riff != b'RIFF' or form_type != b'AVI ' or list_id != b'LIST' or list_type != b'hdrl':
+        raise ProbeError('No AVI header found')
+    # the size of the list includes its type
+    if size < 4:
+        raise ProbeError('Invalid hdrl size')
+    data = reader.read(size - 4)
+    tracks = []
+    for chunk_id, chunk in iter_chunks(data):
+        if chunk_id != b'LIST' or chunk[:4] != b'strl':
+            continue
+        chunks = dict(iter_chunks(chunk[4:]))
+        if b'strh' not in chunks or len(chunks[b'strh']) < 8:
+            continue
+        track_type = AVI_TRACK_TYPES.get(chunks[b'strh'][:4])
+        strf = chunks.get(b'strf', b'')
+        if track_type == 'video' and len(strf) >= 20:
+            _, _, height, _, _, compression = struct.unpack(b'<IiiHH4s', strf[:20])
+            tracks.append(Track(track_type, AVI_VIDEO_CODECS.get(compression.upper()), abs(height)))
+        elif track_type == 'audio' and len(strf) >= 2:
+            (format_tag,) = struct.unpack(b'<H', strf[:2])
+            tracks.append(Track(track_type, AVI_AUDIO_CODECS.get(format_tag)))
+        elif track_type == 'subtitle':
+            tracks.append(Track(track_type))
+    return tracks
+
+
+def iter_chunks(data):
+    """Iterate over the RIFF chunks of `data`
+
+    :param bytes data: data of a list
+    :return: a generator of chunk ids with their data
+    :rtype: generator of tuple of (bytes, bytes)
+
+    """
+    position = 0
+    while position + 8 <= len(data):
+        chunk_id, size = struct.unpack(b'<4sI', data[position:position + 8])
+        yield chunk_id, data[position + 8:position + 8 + size]
+        # chunks are padded to an even size
+        position += 8 + size + size % 2
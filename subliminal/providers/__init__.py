@@ -1,16 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import collections
 import contextlib
 import logging
+import multiprocessing.pool
 import socket
+import threading
+import time
 import babelfish
 from pkg_resources import iter_entry_points, EntryPoint
 import requests
+from ..cache import region
+from ..circuit import CircuitBreaker, FAILURE_THRESHOLD, COOLDOWN, RETRIES, get_retry_delay
+from ..exceptions import DownloadLimitExceeded
+from ..ratelimit import DailyQuota, TokenBucket, get_quota_reset_delay
+from ..transport import transport
 from ..video import Episode, Movie
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
 
 
 logger = logging.getLogger(__name__)
 
+#: Errors of providers that are worth retrying
+TRANSIENT_ERRORS = (requests.exceptions.Timeout, requests.exceptions.ConnectionError, socket.timeout)
+
 
 class Provider(object):
     """Base class for providers
@@ -30,6 +46,22 @@ class Provider(object):
     #: Required hash, if any
     required_hash = None
 
+    #: Functions to compute the hashes used by the provider by hash name,
+    #: see :func:`~subliminal.video.compute_hashes`
+    hash_functions = {}
+
+    #: Maximum number of concurrent requests to the provider, see :class:`ProviderPool`
+    max_in_flight = 1
+
+    #: Maximum number of requests per second to the provider, if limited, see :class:`ProviderPool`
+    rate_limit = None
+
+    #: Maximum number of downloads per day from the provider, if limited, see :class:`ProviderPool`
+    daily_quota = None
+
+    #: Time in seconds after which an idle provider must be kept alive with :meth:`keep_alive`, if ever
+    keep_alive_interval = None
+
     def __init__(self, **kwargs):
         pass
 
@@ -67,6 +99,16 @@ class Provider(object):
         """
         pass
 
+    def keep_alive(self):
+        """Keep the provider alive while idle, e.g. to prevent its session from expiring
+
+        Called every :attr:`keep_alive_interval` seconds while the provider is idle in a :class:`ProviderPool`
+
+        :raise: :class:`~subliminal.exceptions.ProviderNotAvailable` if the provider is unavailable
+
+        """
+        pass
+
     @classmethod
     def check(cls, video):
         """Check if the `video` can be processed
@@ -133,6 +175,39 @@ class Provider(object):
         """
         raise NotImplementedError
 
+    def list_subtitles_async(self, video, languages, executor=None):
+        """Asynchronous counterpart of :meth:`list_subtitles` to await in a running :mod:`asyncio` event loop
+
+        Providers can override it with a native coroutine, otherwise :meth:`list_subtitles` is run in the `executor`
+
+        :param video: video to list subtitles for
+        :type video: :class:`~subliminal.video.Video`
+        :param languages: languages to search for
+        :type languages: set of :class:`babelfish.Language`
+        :param executor: executor to run :meth:`list_subtitles` in, if not the event loop's default
+        :type executor: :class:`concurrent.futures.Executor` or None
+        :return: awaitable of the subtitles
+        :rtype: :class:`asyncio.Future`
+
+        """
+        return asyncio.get_event_loop().run_in_executor(executor, self.list_subtitles, video, languages)
+
+    def download_subtitle_async(self, subtitle, executor=None):
+        """Asynchronous counterpart of :meth:`download_subtitle` to await in a running :mod:`asyncio` event loop
+
+        Providers can override it with a native coroutine, otherwise :meth:`download_subtitle` is run in the
+        `executor`
+
+        :param subtitle: subtitle to download
+        :type subtitle: :class:`~subliminal.subtitle.Subtitle`
+        :param executor: executor to run :meth:`download_subtitle` in, if not the event loop's default
+        :type executor: :class:`concurrent.futures.Executor` or None
+        :return: awaitable of the download
+        :rtype: :class:`asyncio.Future`
+
+        """
+        return asyncio.get_event_loop().run_in_executor(executor, self.download_subtitle, subtitle)
+
     def __repr__(self):
         return '<%s [%r]>' % (self.__class__.__name__, self.video_types)
 
@@ -197,6 +272,20 @@ class ProviderManager(object):
         """Iterator over loaded providers"""
         return iter(self.providers)
 
+    def get_hash_functions(self, names=None):
+        """Get the functions to compute the hashes used by providers
+
+        :param names: names of the providers, if not all
+        :type names: list of string or None
+        :return: functions to compute the hashes by hash name, see :func:`~subliminal.video.compute_hashes`
+        :rtype: dict
+
+        """
+        hash_functions = {}
+        for name in (names or self.available_providers):
+            hash_functions.update(self[name].hash_functions)
+        return hash_functions
+
     def register(self, entry_point):
         """Register a provider
 
@@ -234,13 +323,92 @@ class ProviderPool(object):
     :type providers: list of string or None
     :param provider_configs: configuration for providers
     :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param workers: number of threads to query the providers with concurrently, if not sequentially
+    :type workers: int or None
+    :param max_in_flight: maximum number of concurrent requests by provider name, if not the provider's
+        :attr:`Provider.max_in_flight`
+    :type max_in_flight: dict of provider name => int or None
+    :param int failure_threshold: number of consecutive failures after which a provider is skipped
+    :param float cooldown: time in seconds after which a skipped provider is probed again
+    :param int retries: number of retries of a request failing with one of the :data:`TRANSIENT_ERRORS`
+    :param bool keep_alive: keep the idle providers alive in a background thread, see :meth:`keep_alive`
+
+    Each provider has a :class:`~subliminal.circuit.CircuitBreaker`: a provider failing `failure_threshold` times in a
+    row is skipped for `cooldown` seconds, then a single request probes it and it is used again if the probe succeeds.
+    Transient errors are retried with a jittered delay first. Providers reporting their download limit is exceeded
+    are skipped until their daily quota resets. See :attr:`health`
+
+    The pool is safe to share between threads: each concurrent request to a provider is made with its own initialized
+    instance, up to the provider's maximum number of concurrent requests, and instances are reused once idle
+
+    Requests are paced with a :class:`~subliminal.ratelimit.TokenBucket` and downloads are accounted for in a
+    :class:`~subliminal.ratelimit.DailyQuota`, persisted in the cache region when configured, for providers with a
+    limit. Limits default to the provider's :attr:`Provider.rate_limit` and :attr:`Provider.daily_quota` and can be
+    set in the configuration of the provider with the `rate_limit`, `rate_burst` and `daily_quota` keys, which are
+    not passed to the provider constructor
+
+    A long-lived pool can be passed to the :mod:`~subliminal.api` functions to reuse the initialized providers, e.g.
+    their login sessions and HTTP connections, across calls. With `keep_alive`, providers with a
+    :attr:`Provider.keep_alive_interval` are kept alive while idle until the pool is terminated
 
     """
-    def __init__(self, providers=None, provider_configs=None):
-        self.provider_configs = provider_configs or {}
+    def __init__(self, providers=None, provider_configs=None, workers=None, max_in_flight=None,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN, retries=RETRIES, keep_alive=False):
         self.providers = {p: provider_manager[p] for p in (providers or provider_manager.available_providers)}
-        self.initialized_providers = {}
-        self.discarded_providers = set()
+        self.workers = workers
+        self.max_in_flight = max_in_flight or {}
+        self.retries = retries
+
+        #: Circuit breakers by provider name
+        self.circuit_breakers = {n: CircuitBreaker(n, failure_threshold, cooldown) for n in self.providers}
+
+        #: Provider constructor kwargs by provider name
+        self.provider_configs = {}
+
+        #: Rate limiters by provider name
+        self.rate_limiters = {}
+
+        #: Daily download quotas by provider name
+        self.quotas = {}
+
+        for name, config in (provider_configs or {}).items():
+            self.provider_configs[name] = {k: v for k, v in config.items()
+                                           if k not in ('rate_limit', 'rate_burst', 'daily_quota')}
+        for name, provider_class in self.providers.items():
+            config = (provider_configs or {}).get(name, {})
+            rate_limit = config.get('rate_limit', provider_class.rate_limit)
+            if rate_limit is not None:
+                self.rate_limiters[name] = TokenBucket(rate_limit, config.get('rate_burst', 1))
+            daily_quota = config.get('daily_quota', provider_class.daily_quota)
+            if daily_quota is not None:
+                self.quotas[name] = DailyQuota(name, daily_quota, region if region.is_configured else None)
+
+        #: Initialized providers by name
+        self.initialized_providers = collections.defaultdict(list)
+
+        #: Initialized providers not in use by name
+        self.idle_providers = collections.defaultdict(list)
+
+        #: Time at which initialized providers were last used
+        self.last_used = {}
+
+        #: Semaphores bounding the concurrent requests by provider name
+        self.semaphores = {n: threading.BoundedSemaphore(self.max_in_flight.get(n, p.max_in_flight))
+                           for n, p in self.providers.items()}
+
+        #: Thread pool to query the providers with, created on first use
+        self.thread_pool = None
+
+        self.lock = threading.Lock()
+
+        #: Thread keeping the idle providers alive, if any
+        self.keep_alive_thread = None
+        self.keep_alive_event = threading.Event()
+        intervals = [p.keep_alive_interval for p in self.providers.values() if p.keep_alive_interval is not None]
+        if keep_alive and intervals:
+            self.keep_alive_thread = threading.Thread(target=self.run_keep_alive, args=(min(intervals),))
+            self.keep_alive_thread.daemon = True
+            self.keep_alive_thread.start()
 
     def __enter__(self):
         return self
@@ -248,33 +416,76 @@ class ProviderPool(object):
     def __exit__(self, type, value, traceback):  # @ReservedAssignment
         self.terminate()
 
-    def get_initialized_provider(self, name):
-        """Get a :class:`Provider` by name, initializing it if necessary
+    def initialize_provider(self, name):
+        """Initialize a new :class:`Provider` by name
 
         :param string name: name of the provider
         :return: the initialized provider
         :rtype: :class:`Provider`
 
         """
-        if name in self.initialized_providers:
-            return self.initialized_providers[name]
         provider = self.providers[name](**self.provider_configs.get(name, {}))
         provider.initialize()
-        self.initialized_providers[name] = provider
+        with self.lock:
+            self.initialized_providers[name].append(provider)
         return provider
 
-    def list_subtitles(self, video, languages):
-        """List subtitles for `video` with the given `languages`
+    def get_initialized_provider(self, name):
+        """Get a :class:`Provider` by name, initializing it if necessary
+
+        The provider is not accounted for in the concurrent requests, use :meth:`acquire_provider` to share the pool
+        between threads
+
+        :param string name: name of the provider
+        :return: the initialized provider
+        :rtype: :class:`Provider`
+
+        """
+        with self.lock:
+            if self.initialized_providers[name]:
+                return self.initialized_providers[name][0]
+        return self.initialize_provider(name)
+
+    @contextlib.contextmanager
+    def acquire_provider(self, name):
+        """Acquire an idle :class:`Provider` by name, initializing it if necessary, for the duration of the
+        :keyword:`with` block
+
+        This blocks while the maximum number of concurrent requests to the provider is reached
+
+        :param string name: name of the provider
+        :return: the initialized provider
+        :rtype: :class:`Provider`
+
+        """
+        with self.semaphores[name]:
+            with self.lock:
+                provider = self.idle_providers[name].pop() if self.idle_providers[name] else None
+            if provider is None:
+                provider = self.initialize_provider(name)
+            try:
+                if name in self.rate_limiters:
+                    self.rate_limiters[name].acquire()
+                yield provider
+            finally:
+                with self.lock:
+                    self.last_used[provider] = time.time()
+                    self.idle_providers[name].append(provider)
+
+    def get_queries(self, video, languages):
+        """Get the providers to query for `video` with the given `languages`, skipping those that cannot process the
+        `video`, have no language to search for or are not available, see :meth:`is_available`
 
         :param video: video to list subtitles for
         :type video: :class:`~subliminal.video.Video`
         :param languages: languages of subtitles to search for
         :type languages: set of :class:`babelfish.Language`
-        :return: found subtitles
-        :rtype: list of :class:`~subliminal.subtitle.Subtitle`
+        :return: the name of the providers to query with their languages to search for and the ticket of their circuit
+            breaker
+        :rtype: list of tuple(string, set of :class:`babelfish.Language`, int)
 
         """
-        subtitles = []
+        queries = []
         for provider_name, provider_class in self.providers.items():
             if not provider_class.check(video):
                 logger.info('Skipping provider %r: not a valid video', provider_name)
@@ -283,56 +494,287 @@ class ProviderPool(object):
             if not provider_languages:
                 logger.info('Skipping provider %r: no language to search for', provider_name)
                 continue
-            if provider_name in self.discarded_providers:
-                logger.debug('Skipping discarded provider %r', provider_name)
+            ticket = self.is_available(provider_name)
+            if not ticket:
                 continue
+            queries.append((provider_name, provider_languages, ticket))
+        return queries
+
+    @property
+    def health(self):
+        """State of the circuit breaker of the providers by name, ``closed`` when healthy, ``open`` when skipped or
+        ``half-open`` when probed"""
+        return {n: b.state for n, b in self.circuit_breakers.items()}
+
+    def is_available(self, name):
+        """Check if a provider can be used, i.e. its daily quota, if any, is not reached and its circuit breaker
+        allows it
+
+        :param string name: name of the provider
+        :return: the ticket of the circuit breaker to report the result with if the provider can be used, `False`
+            otherwise
+        :rtype: int or bool
+
+        """
+        if name in self.quotas and not self.quotas[name].remaining:
+            logger.debug('Skipping provider %r: daily quota reached', name)
+            return False
+        ticket = self.circuit_breakers[name].allow()
+        if not ticket:
+            logger.debug('Skipping provider %r: circuit open', name)
+        return ticket
+
+    def call_provider(self, name, method, *args):
+        """Call a `method` of an acquired provider, retrying it with a jittered delay on transient errors
+
+        :param string name: name of the provider
+        :param string method: name of the method of the provider
+        :param \*args: arguments of the method
+        :return: the result of the method
+
+        """
+        for retry in range(self.retries + 1):
             try:
-                provider = self.get_initialized_provider(provider_name)
-                logger.info('Listing subtitles with provider %r and languages %r', provider_name, provider_languages)
-                provider_subtitles = provider.list_subtitles(video, provider_languages)
-                logger.info('Found %d subtitles', len(provider_subtitles))
-                subtitles.extend(provider_subtitles)
-            except (requests.exceptions.Timeout, socket.timeout):
-                logger.warning('Provider %r timed out, discarding it', provider_name)
-                self.discarded_providers.add(provider_name)
-            except:
-                logger.exception('Unexpected error in provider %r, discarding it', provider_name)
-                self.discarded_providers.add(provider_name)
+                with self.acquire_provider(name) as provider:
+                    return getattr(provider, method)(*args)
+            except TRANSIENT_ERRORS:
+                if retry == self.retries:
+                    raise
+                delay = get_retry_delay(retry)
+                logger.info('Transient error in provider %r, retrying in %.1fs', name, delay)
+                time.sleep(delay)
+
+    def list_subtitles_provider(self, provider_name, video, languages, ticket=None):
+        """List subtitles for `video` with the given `languages` with a single provider
+
+        Failures are recorded in the circuit breaker of the provider
+
+        :param string provider_name: name of the provider
+        :param video: video to list subtitles for
+        :type video: :class:`~subliminal.video.Video`
+        :param languages: languages of subtitles to search for
+        :type languages: set of :class:`babelfish.Language`
+        :param ticket: ticket of the circuit breaker of the provider, see :meth:`is_available`
+        :type ticket: int or None
+        :return: found subtitles
+        :rtype: list of :class:`~subliminal.subtitle.Subtitle`
+
+        """
+        try:
+            logger.info('Listing subtitles with provider %r and languages %r', provider_name, languages)
+            provider_subtitles = self.call_provider(provider_name, 'list_subtitles', video, languages)
+            self.circuit_breakers[provider_name].record_success(ticket)
+            logger.info('Found %d subtitles with provider %r', len(provider_subtitles), provider_name)
+            return provider_subtitles
+        except TRANSIENT_ERRORS:
+            logger.warning('Provider %r timed out or is unreachable', provider_name)
+            self.circuit_breakers[provider_name].record_failure(ticket)
+        except:
+            logger.exception('Unexpected error in provider %r', provider_name)
+            self.circuit_breakers[provider_name].record_failure(ticket)
+        return []
+
+    def list_subtitles(self, video, languages):
+        """List subtitles for `video` with the given `languages`
+
+        With :attr:`workers`, the eligible providers are queried concurrently so the latency is that of the slowest
+        provider rather than the sum of all. Subtitles are merged in the same order either way
+
+        :param video: video to list subtitles for
+        :type video: :class:`~subliminal.video.Video`
+        :param languages: languages of subtitles to search for
+        :type languages: set of :class:`babelfish.Language`
+        :return: found subtitles
+        :rtype: list of :class:`~subliminal.subtitle.Subtitle`
+
+        """
+        queries = self.get_queries(video, languages)
+
+        # query the providers
+        if self.workers is not None and self.workers > 1 and len(queries) > 1:
+            with self.lock:
+                if self.thread_pool is None:
+                    logger.info('Querying providers with %d workers', self.workers)
+                    self.thread_pool = multiprocessing.pool.ThreadPool(self.workers)
+            results = [self.thread_pool.apply_async(self.list_subtitles_provider, (n, video, l, t))
+                       for n, l, t in queries]
+            results = [r.get() for r in results]
+        else:
+            results = [self.list_subtitles_provider(n, video, l, t) for n, l, t in queries]
+
+        subtitles = []
+        for provider_subtitles in results:
+            subtitles.extend(provider_subtitles)
         return subtitles
 
+    def consume_quota(self, name):
+        """Account for a download from a provider in its daily quota, if any
+
+        :param string name: name of the provider
+        :return: `True` if the download is accounted for, `False` if the quota is reached
+        :rtype: bool
+
+        """
+        if name in self.quotas and not self.quotas[name].consume():
+            logger.info('Daily quota of provider %r reached', name)
+            return False
+        return True
+
+    def refund_quota(self, name):
+        """Give back a download from a provider that did not happen to its daily quota, if any
+
+        :param string name: name of the provider
+
+        """
+        if name in self.quotas:
+            self.quotas[name].refund()
+
+    def exhaust_quota(self, name):
+        """Skip a provider that reports its download limit is exceeded until its daily quota resets
+
+        The daily quota of the provider is reached if any, its circuit breaker is opened until the next UTC day
+        otherwise
+
+        :param string name: name of the provider
+
+        """
+        logger.warning('Provider %r download limit exceeded, skipping it until its quota resets', name)
+        if name in self.quotas:
+            self.quotas[name].exhaust()
+        else:
+            self.circuit_breakers[name].trip(get_quota_reset_delay(time.time()))
+
+    def reserve_download(self, name):
+        """Reserve a download from a provider in its daily quota, if any, then check its circuit breaker allows it
+
+        The quota is checked first so a probe let through by the circuit breaker is always made. A reserved download
+        that does not happen must be given back with :meth:`refund_quota`
+
+        :param string name: name of the provider
+        :return: the ticket of the circuit breaker to report the result with if the download is reserved, `False`
+            otherwise
+        :rtype: int or bool
+
+        """
+        if name not in self.circuit_breakers or not self.consume_quota(name):
+            return False
+        ticket = self.circuit_breakers[name].allow()
+        if not ticket:
+            logger.debug('Skipping provider %r: circuit open', name)
+            self.refund_quota(name)
+        return ticket
+
     def download_subtitle(self, subtitle):
         """Download a subtitle
 
+        Only successful downloads of valid subtitles count towards the daily quota of the provider
+
         :param subtitle: subtitle to download
         :type subtitle: :class:`~subliminal.subtitle.Subtitle`
         :return: ``True`` if the subtitle has been successfully downloaded, ``False`` otherwise
         :rtype: bool
 
         """
-        if subtitle.provider_name in self.discarded_providers:
-            logger.debug('Discarded provider %r', subtitle.provider_name)
+        ticket = self.reserve_download(subtitle.provider_name)
+        if not ticket:
             return False
         try:
-            provider = self.get_initialized_provider(subtitle.provider_name)
-            provider.download_subtitle(subtitle)
-            if not subtitle.is_valid:
-                logger.warning('Invalid subtitle')
-                return False
-            return True
+            self.call_provider(subtitle.provider_name, 'download_subtitle', subtitle)
+            self.circuit_breakers[subtitle.provider_name].record_success(ticket)
+        except TRANSIENT_ERRORS:
+            logger.warning('Provider %r timed out or is unreachable', subtitle.provider_name)
+            self.circuit_breakers[subtitle.provider_name].record_failure(ticket)
+            self.refund_quota(subtitle.provider_name)
+            return False
+        except DownloadLimitExceeded:
+            self.exhaust_quota(subtitle.provider_name)
+            return False
+        except:
+            logger.exception('Unexpected error in provider %r', subtitle.provider_name)
+            self.circuit_breakers[subtitle.provider_name].record_failure(ticket)
+            self.refund_quota(subtitle.provider_name)
+            return False
+        if not subtitle.is_valid:
+            logger.warning('Invalid subtitle')
+            self.refund_quota(subtitle.provider_name)
+            return False
+        return True
+
+    def keep_alive(self):
+        """Keep alive the idle providers unused for their :attr:`Provider.keep_alive_interval`
+
+        Providers in use or failing to keep alive are skipped, the latter are terminated so a new instance is
+        initialized on next use
+
+        """
+        now = time.time()
+        for name, provider_class in self.providers.items():
+            if provider_class.keep_alive_interval is None:
+                continue
+            with self.lock:
+                providers = [p for p in self.idle_providers[name]
+                             if now - self.last_used.get(p, now) >= provider_class.keep_alive_interval]
+            for provider in providers:
+                if not self.semaphores[name].acquire(False):
+                    break
+                try:
+                    with self.lock:
+                        if provider not in self.idle_providers[name]:
+                            continue
+                        self.idle_providers[name].remove(provider)
+                    try:
+                        logger.debug('Keeping provider %r alive', name)
+                        if name in self.rate_limiters:
+                            self.rate_limiters[name].acquire()
+                        provider.keep_alive()
+                    except Exception:
+                        logger.warning('Provider %r failed to keep alive, terminating it', name)
+                        with self.lock:
+                            self.initialized_providers[name].remove(provider)
+                            self.last_used.pop(provider, None)
+                        self.terminate_provider(name, provider)
+                        continue
+                    with self.lock:
+                        self.last_used[provider] = time.time()
+                        self.idle_providers[name].append(provider)
+                finally:
+                    self.semaphores[name].release()
+
+    def run_keep_alive(self, interval):
+        """Call :meth:`keep_alive` every `interval` seconds until the pool is terminated"""
+        while not self.keep_alive_event.wait(interval):
+            self.keep_alive()
+
+    def terminate_provider(self, name, provider):
+        """Terminate an initialized provider, logging errors
+
+        :param string name: name of the provider
+        :param provider: the provider
+        :type provider: :class:`Provider`
+
+        """
+        try:
+            provider.terminate()
         except (requests.exceptions.Timeout, socket.timeout):
-            logger.warning('Provider %r timed out, discarding it', subtitle.provider_name)
-            self.discarded_providers.add(subtitle.provider_name)
+            logger.warning('Provider %r timed out, unable to terminate', name)
         except:
-            logger.exception('Unexpected error in provider %r, discarding it', subtitle.provider_name)
-            self.discarded_providers.add(subtitle.provider_name)
-        return False
+            logger.exception('Unexpected error in provider %r', name)
 
     def terminate(self):
-        """Terminate all the initialized providers"""
-        for (provider_name, provider) in self.initialized_providers.items():
-            try:
-                provider.terminate()
-            except (requests.exceptions.Timeout, socket.timeout):
-                logger.warning('Provider %r timed out, unable to terminate', provider_name)
-            except:
-                logger.exception('Unexpected error in provider %r', provider_name)
+        """Terminate all the initialized providers, the thread pool and the keep alive thread, if any, then close the
+        connections kept alive by the shared :class:`~subliminal.transport.Transport`"""
+        if self.keep_alive_thread is not None:
+            self.keep_alive_event.set()
+            self.keep_alive_thread.join()
+            self.keep_alive_thread = None
+        if self.thread_pool is not None:
+            self.thread_pool.close()
+            self.thread_pool.join()
+            self.thread_pool = None
+        for (provider_name, providers) in self.initialized_providers.items():
+            for provider in providers:
+                self.terminate_provider(provider_name, provider)
+        self.initialized_providers.clear()
+        self.idle_providers.clear()
+        self.last_used.clear()
+        transport.close()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import datetime
 import logging
 import babelfish
 import bs4
@@ -9,15 +10,18 @@ from .. import __version__
 from ..cache import region, SHOW_EXPIRATION_TIME
 from ..exceptions import ConfigurationError, AuthenticationError, DownloadLimitExceeded, ProviderError
 from ..subtitle import Subtitle, fix_line_endings, compute_guess_properties_matches
+from ..transport import transport
 from ..video import Episode
 
 
 logger = logging.getLogger(__name__)
+
 babelfish.language_converters.register('addic7ed = subliminal.converters.addic7ed:Addic7edConverter')
 
 
 class Addic7edSubtitle(Subtitle):
     provider_name = 'addic7ed'
+    expensive_matches = {'resolution', 'format'}
 
     def __init__(self, language, series, season, episode, title, year, version, hearing_impaired, download_link,
                  page_link):
@@ -31,6 +35,15 @@ class Addic7edSubtitle(Subtitle):
         self.download_link = download_link
 
     def compute_matches(self, video):
+        matches = self.compute_cheap_matches(video)
+        # we don't have the complete filename, so we need to guess the matches separately
+        # guess resolution (screenSize in guessit)
+        matches |= compute_guess_properties_matches(video, self.version, 'screenSize')
+        # guess format
+        matches |= compute_guess_properties_matches(video, self.version, 'format')
+        return matches
+
+    def compute_cheap_matches(self, video):
         matches = set()
         # series
         if video.series and self.series == video.series:
@@ -58,11 +71,6 @@ class Addic7edSubtitle(Subtitle):
         if video.format and self.version and video.format in self.version.lower:
             matches.add('format')
         """
-        # we don't have the complete filename, so we need to guess the matches separately
-        # guess resolution (screenSize in guessit)
-        matches |= compute_guess_properties_matches(video, self.version, 'screenSize')
-        # guess format
-        matches |= compute_guess_properties_matches(video, self.version, 'format')
         return matches
 
 
@@ -75,36 +83,93 @@ class Addic7edProvider(Provider):
     video_types = (Episode,)
     server = 'http://www.addic7ed.com'
 
-    def __init__(self, username=None, password=None):
+    # the site throttles clients making requests too fast and allows 40 downloads per day to anonymous users, set the
+    # daily_quota in the configuration of the provider to use the higher limit of registered users
+    rate_limit = 0.5
+    daily_quota = 40
+
+    session_expiration_time = datetime.timedelta(days=1).total_seconds()
+
+    def __init__(self, username=None, password=None, session_store=None):
         if username is not None and password is None or username is None and password is not None:
             raise ConfigurationError('Username and password must be specified')
         self.username = username
         self.password = password
+        self.session_store = session_store
         self.logged_in = False
 
+    @property
+    def session_key(self):
+        return 'addic7ed:%s' % self.username
+
     def initialize(self):
-        self.session = requests.Session()
-        self.session.headers = {'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]}
-        # login
+        self.session = transport.create_session({'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]})
         if self.username is not None and self.password is not None:
-            logger.debug('Logging in')
-            data = {'username': self.username, 'password': self.password, 'Submit': 'Log in'}
-            r = self.session.post(self.server + '/dologin.php', data, timeout=10, allow_redirects=False)
-            if r.status_code == 302:
-                logger.info('Logged in')
-                self.logged_in = True
-            else:
-                raise AuthenticationError(self.username)
+            if self.session_store is not None:
+                session = self.session_store.get(self.session_key)
+                if session is not None:
+                    requests.utils.add_dict_to_cookiejar(self.session.cookies, session['cookies'])
+                    self.logged_in = True
+                    return
+            self.login()
 
     def terminate(self):
-        # logout
-        if self.logged_in:
-            r = self.session.get(self.server + '/logout.php', timeout=10)
+        # logout, unless the session is kept for the next run
+        if self.logged_in and self.session_store is None:
+            r = self.session.get(self.server + '/logout.php')
             logger.info('Logged out')
             if r.status_code != 200:
                 raise ProviderError('Request failed with status code %d' % r.status_code)
         self.session.close()
 
+    def login(self):
+        """Log in and store the session cookies, if configured"""
+        logger.debug('Logging in')
+        self.session.cookies.clear()
+        data = {'username': self.username, 'password': self.password, 'Submit': 'Log in'}
+        r = self.session.post(self.server + '/dologin.php', data, allow_redirects=False)
+        if r.status_code != 302:
+            raise AuthenticationError(self.username)
+        logger.info('Logged in')
+        self.logged_in = True
+        if self.session_store is not None:
+            cookies = requests.utils.dict_from_cookiejar(self.session.cookies)
+            self.session_store.set(self.session_key, {'cookies': cookies}, self.session_expiration_time)
+
+    def is_logged_out(self, response, download=False):
+        """Check whether the `response` was made in an anonymous session
+
+        The server answers anonymous sessions with the page requested rather than an error, and all its pages link to
+        the login page, so the session is considered expired when redirected to the login page or, for a download,
+        given an HTML page instead of the subtitle
+
+        :param response: the response
+        :type response: :class:`requests.Response`
+        :param bool download: whether the response is that of a subtitle download
+        :rtype: bool
+
+        """
+        if response.status_code == 401 or response.url.split('?')[0].endswith('/login.php'):
+            return True
+        return download and response.headers.get('Content-Type', '').startswith('text/html')
+
+    def request(self, url, download=False, **kwargs):
+        """Make a GET request on `url`, logging in again once if the session expired
+
+        :param string url: part of the URL to reach with the leading slash
+        :param bool download: whether the request is a subtitle download, see :meth:`is_logged_out`
+        :param \*\*kwargs: other arguments of the request
+        :return: the response
+        :rtype: :class:`requests.Response`
+
+        """
+        r = self.session.get(self.server + url, **kwargs)
+        if self.logged_in and self.is_logged_out(r, download):
+            logger.info('Session expired, logging in again')
+            self.login()
+            r = self.session.get(self.server + url, **kwargs)
+        return r
+
     def get(self, url, params=None):
         """Make a GET request on `url` with the given parameters
 
@@ -114,7 +179,7 @@ class Addic7edProvider(Provider):
         :rtype: :class:`bs4.BeautifulSoup`
 
         """
-        r = self.session.get(self.server + url, params=params, timeout=10)
+        r = self.request(url, params=params)
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         return bs4.BeautifulSoup(r.content, ['permissive'])
@@ -196,7 +261,7 @@ class Addic7edProvider(Provider):
                 if s.language in languages and s.episode == video.episode]
 
     def download_subtitle(self, subtitle):
-        r = self.session.get(self.server + subtitle.download_link, timeout=10, headers={'Referer': subtitle.page_link})
+        r = self.request(subtitle.download_link, download=True, headers={'Referer': subtitle.page_link})
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         if r.headers['Content-Type'] == 'text/html':
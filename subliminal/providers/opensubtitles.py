@@ -6,13 +6,14 @@ import os
 import re
 import zlib
 import babelfish
-import guessit
 from . import Provider
 from .. import __version__
-from ..compat import ServerProxy, TimeoutTransport
+from ..compat import ServerProxy
 from ..exceptions import ProviderError, AuthenticationError, DownloadLimitExceeded
-from ..subtitle import Subtitle, fix_line_endings, compute_guess_matches
-from ..video import Episode, Movie
+from ..guess import guess_episode_info, guess_movie_info
+from ..subtitle import Subtitle, fix_line_endings, compute_guess_matches, GUESS_MATCHES
+from ..transport import XMLRPCTransport, transport
+from ..video import Episode, Movie, hash_opensubtitles_chunks
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,7 @@ logger = logging.getLogger(__name__)
 class OpenSubtitlesSubtitle(Subtitle):
     provider_name = 'opensubtitles'
     series_re = re.compile('^"(?P<series_name>.*)" (?P<series_title>.*)$')
+    expensive_matches = GUESS_MATCHES
 
     def __init__(self, language, hearing_impaired, id, matched_by, movie_kind, hash, movie_name, movie_release_name,  # @ReservedAssignment
                  movie_year, movie_imdb_id, series_season, series_episode, page_link):
@@ -45,6 +47,15 @@ class OpenSubtitlesSubtitle(Subtitle):
         return self.series_re.match(self.movie_name).group('series_title')
 
     def compute_matches(self, video):
+        matches = self.compute_cheap_matches(video)
+        # guess
+        if isinstance(video, Episode) and self.movie_kind == 'episode':
+            matches |= compute_guess_matches(video, guess_episode_info(self.movie_release_name + '.mkv'))
+        elif isinstance(video, Movie) and self.movie_kind == 'movie':
+            matches |= compute_guess_matches(video, guess_movie_info(self.movie_release_name + '.mkv'))
+        return matches
+
+    def compute_cheap_matches(self, video):
         matches = set()
         # episode
         if isinstance(video, Episode) and self.movie_kind == 'episode':
@@ -57,15 +68,11 @@ class OpenSubtitlesSubtitle(Subtitle):
             # episode
             if video.episode and self.series_episode == video.episode:
                 matches.add('episode')
-            # guess
-            matches |= compute_guess_matches(video, guessit.guess_episode_info(self.movie_release_name + '.mkv'))
         # movie
         elif isinstance(video, Movie) and self.movie_kind == 'movie':
             # year
             if video.year and self.movie_year == video.year:
                 matches.add('year')
-            # guess
-            matches |= compute_guess_matches(video, guessit.guess_movie_info(self.movie_release_name + '.mkv'))
         else:
             logger.info('%r is not a valid movie_kind for %r', self.movie_kind, video)
             return matches
@@ -83,21 +90,78 @@ class OpenSubtitlesSubtitle(Subtitle):
 
 class OpenSubtitlesProvider(Provider):
     languages = {babelfish.Language.fromopensubtitles(l) for l in babelfish.language_converters['opensubtitles'].codes}
+    hash_functions = {'opensubtitles': hash_opensubtitles_chunks}
+    max_in_flight = 8
 
-    def __init__(self):
-        self.server = ServerProxy('http://api.opensubtitles.org/xml-rpc', transport=TimeoutTransport(10))
+    # the API allows 40 requests per 10 seconds and 200 downloads per day to regular users
+    rate_limit = 2
+    daily_quota = 200
+
+    # sessions expire after 15 minutes of inactivity
+    keep_alive_interval = 300
+    session_expiration_time = 900
+
+    def __init__(self, session_store=None):
+        self.server = ServerProxy('http://api.opensubtitles.org/xml-rpc', transport=XMLRPCTransport(transport))
+        self.session_store = session_store
         self.token = None
 
+        #: Whether the token was loaded from the session store rather than given by a login
+        self.stored_token = False
+
     def initialize(self):
-        response = checked(self.server.LogIn('', '', 'eng', 'subliminal v%s' % __version__.split('-')[0]))
-        self.token = response['token']
+        if self.session_store is not None:
+            session = self.session_store.get('opensubtitles')
+            if session is not None:
+                self.token = session['token']
+                self.stored_token = True
+                return
+        self.login()
 
     def terminate(self):
-        checked(self.server.LogOut(self.token))
+        if self.session_store is not None:
+            # keep the session for the next run
+            self.session_store.set('opensubtitles', {'token': self.token}, self.session_expiration_time)
+        else:
+            checked(self.server.LogOut(self.token))
         self.server.close()
 
+    def login(self):
+        """Log in and store the session, if configured"""
+        response = checked(self.server.LogIn('', '', 'eng', 'subliminal v%s' % __version__.split('-')[0]))
+        self.token = response['token']
+        self.stored_token = False
+        logger.debug('Logged in')
+        if self.session_store is not None:
+            self.session_store.set('opensubtitles', {'token': self.token}, self.session_expiration_time)
+
+    def call(self, method, *args):
+        """Call an XML-RPC `method` with the token and the given arguments, logging in again once if the session
+        expired or the token loaded from the session store is unauthorized
+
+        :param string method: name of the method
+        :param \*args: arguments of the method after the token
+        :return: the checked response
+        :raise: :class:`OpenSubtitlesError`
+
+        """
+        try:
+            return checked(getattr(self.server, method)(self.token, *args))
+        except NoSession:
+            logger.info('Session expired, logging in again')
+        except Unauthorized:
+            if not self.stored_token:
+                raise
+            logger.info('Stored session unauthorized, logging in again')
+            self.session_store.delete('opensubtitles')
+        self.login()
+        return checked(getattr(self.server, method)(self.token, *args))
+
     def no_operation(self):
-        checked(self.server.NoOperation(self.token))
+        self.call('NoOperation')
+
+    def keep_alive(self):
+        self.no_operation()
 
     def query(self, languages, hash=None, size=None, imdb_id=None, query=None, season=None, episode=None):  # @ReservedAssignment
         searches = []
@@ -114,7 +178,7 @@ class OpenSubtitlesProvider(Provider):
         for search in searches:
             search['sublanguageid'] = ','.join(l.opensubtitles for l in languages)
         logger.debug('Searching subtitles %r', searches)
-        response = checked(self.server.SearchSubtitles(self.token, searches))
+        response = self.call('SearchSubtitles', searches)
         if not response['data']:
             logger.debug('No subtitle found')
             return []
@@ -140,7 +204,7 @@ class OpenSubtitlesProvider(Provider):
                           query=query, season=season, episode=episode)
 
     def download_subtitle(self, subtitle):
-        response = checked(self.server.DownloadSubtitles(self.token, [subtitle.id]))
+        response = self.call('DownloadSubtitles', [subtitle.id])
         if not response['data']:
             raise ProviderError('Nothing to download')
         subtitle.content = fix_line_endings(zlib.decompress(base64.b64decode(response['data'][0]['data']), 47))
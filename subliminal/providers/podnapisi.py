@@ -7,12 +7,12 @@ import xml.etree.ElementTree
 import zipfile
 import babelfish
 import bs4
-import guessit
-import requests
 from . import Provider
 from .. import __version__
 from ..exceptions import ProviderError
-from ..subtitle import Subtitle, fix_line_endings, compute_guess_matches
+from ..guess import guess_episode_info, guess_movie_info
+from ..subtitle import Subtitle, fix_line_endings, compute_guess_matches, GUESS_MATCHES
+from ..transport import transport
 from ..video import Episode, Movie
 
 
@@ -22,6 +22,7 @@ babelfish.language_converters.register('podnapisi = subliminal.converters.podnap
 
 class PodnapisiSubtitle(Subtitle):
     provider_name = 'podnapisi'
+    expensive_matches = GUESS_MATCHES
 
     def __init__(self, language, id, releases, hearing_impaired, page_link, series=None, season=None, episode=None,  # @ReservedAssignment
                  title=None, year=None):
@@ -36,6 +37,17 @@ class PodnapisiSubtitle(Subtitle):
         self.year = year
 
     def compute_matches(self, video):
+        matches = self.compute_cheap_matches(video)
+        # guess
+        if isinstance(video, Episode):
+            for release in self.releases:
+                matches |= compute_guess_matches(video, guess_episode_info(release + '.mkv'))
+        elif isinstance(video, Movie):
+            for release in self.releases:
+                matches |= compute_guess_matches(video, guess_movie_info(release + '.mkv'))
+        return matches
+
+    def compute_cheap_matches(self, video):
         matches = set()
         # episode
         if isinstance(video, Episode):
@@ -48,17 +60,11 @@ class PodnapisiSubtitle(Subtitle):
             # episode
             if video.episode and self.episode == video.episode:
                 matches.add('episode')
-            # guess
-            for release in self.releases:
-                matches |= compute_guess_matches(video, guessit.guess_episode_info(release + '.mkv'))
         # movie
         elif isinstance(video, Movie):
             # title
             if video.title and self.title.lower() == video.title.lower():
                 matches.add('title')
-            # guess
-            for release in self.releases:
-                matches |= compute_guess_matches(video, guessit.guess_movie_info(release + '.mkv'))
         # year
         if self.year == video.year:
             matches.add('year')
@@ -69,11 +75,11 @@ class PodnapisiProvider(Provider):
     languages = {babelfish.Language.frompodnapisi(l) for l in babelfish.language_converters['podnapisi'].codes}
     video_types = (Episode, Movie)
     server = 'http://simple.podnapisi.net'
+    max_in_flight = 4
     link_re = re.compile('^.*(?P<link>/ppodnapisi/download/i/\d+/k/.*$)')
 
     def initialize(self):
-        self.session = requests.Session()
-        self.session.headers = {'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]}
+        self.session = transport.create_session({'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]})
 
     def terminate(self):
         self.session.close()
@@ -88,7 +94,7 @@ class PodnapisiProvider(Provider):
         :rtype: :class:`xml.etree.ElementTree.Element` or :class:`bs4.BeautifulSoup`
 
         """
-        r = self.session.get(self.server + '/ppodnapisi' + url, params=params, timeout=10)
+        r = self.session.get(self.server + '/ppodnapisi' + url, params=params)
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         if is_xml:
@@ -145,7 +151,7 @@ class PodnapisiProvider(Provider):
         link = soup.find('a', href=self.link_re)
         if not link:
             raise ProviderError('Cannot find the download link')
-        r = self.session.get(self.server + self.link_re.match(link['href']).group('link'), timeout=10)
+        r = self.session.get(self.server + self.link_re.match(link['href']).group('link'))
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
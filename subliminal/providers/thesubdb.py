@@ -2,11 +2,12 @@
 from __future__ import unicode_literals
 import logging
 import babelfish
-import requests
 from . import Provider
 from .. import __version__
 from ..exceptions import ProviderError
 from ..subtitle import Subtitle, fix_line_endings
+from ..transport import transport
+from ..video import hash_thesubdb_chunks
 
 
 logger = logging.getLogger(__name__)
@@ -30,11 +31,12 @@ class TheSubDBSubtitle(Subtitle):
 class TheSubDBProvider(Provider):
     languages = {babelfish.Language.fromalpha2(l) for l in ['en', 'es', 'fr', 'it', 'nl', 'pl', 'pt', 'ro', 'sv', 'tr']}
     required_hash = 'thesubdb'
+    hash_functions = {'thesubdb': hash_thesubdb_chunks}
+    max_in_flight = 4
 
     def initialize(self):
-        self.session = requests.Session()
-        self.session.headers = {'User-Agent': 'SubDB/1.0 (subliminal/%s; https://github.com/Diaoul/subliminal)' %
-                                __version__.split('-')[0]}
+        self.session = transport.create_session({'User-Agent': 'SubDB/1.0 (subliminal/%s; '
+                                                 'https://github.com/Diaoul/subliminal)' % __version__.split('-')[0]})
 
     def terminate(self):
         self.session.close()
@@ -47,7 +49,7 @@ class TheSubDBProvider(Provider):
         :rtype: :class:`requests.Response`
 
         """
-        return self.session.get('http://api.thesubdb.com', params=params, timeout=10)
+        return self.session.get('http://api.thesubdb.com', params=params)
 
     def query(self, hash):  # @ReservedAssignment
         params = {'action': 'search', 'hash': hash}
@@ -6,12 +6,12 @@ import re
 import zipfile
 import babelfish
 import bs4
-import requests
 from . import Provider
 from .. import __version__
 from ..cache import region, SHOW_EXPIRATION_TIME, EPISODE_EXPIRATION_TIME
 from ..exceptions import ProviderError
 from ..subtitle import Subtitle, fix_line_endings, compute_guess_properties_matches
+from ..transport import transport
 from ..video import Episode
 
 
@@ -21,6 +21,7 @@ babelfish.language_converters.register('tvsubtitles = subliminal.converters.tvsu
 
 class TVsubtitlesSubtitle(Subtitle):
     provider_name = 'tvsubtitles'
+    expensive_matches = {'video_codec', 'resolution', 'format'}
 
     def __init__(self, language, series, season, episode, year, id, rip, release, page_link):  # @ReservedAssignment
         super(TVsubtitlesSubtitle, self).__init__(language, page_link=page_link)
@@ -33,6 +34,17 @@ class TVsubtitlesSubtitle(Subtitle):
         self.release = release
 
     def compute_matches(self, video):
+        matches = self.compute_cheap_matches(video)
+        # we don't have the complete filename, so we need to guess the matches separately
+        # guess video_codec (videoCodec in guessit)
+        matches |= compute_guess_properties_matches(video, self.release, 'videoCodec')
+        # guess resolution (screenSize in guessit)
+        matches |= compute_guess_properties_matches(video, self.rip, 'screenSize')
+        # guess format
+        matches |= compute_guess_properties_matches(video, self.rip, 'format')
+        return matches
+
+    def compute_cheap_matches(self, video):
         matches = set()
         # series
         if video.series and self.series == video.series:
@@ -61,13 +73,6 @@ class TVsubtitlesSubtitle(Subtitle):
         if video.format and self.rip and video.format in self.rip.lower():
             matches.add('format')
         """
-        # we don't have the complete filename, so we need to guess the matches separately
-        # guess video_codec (videoCodec in guessit)
-        matches |= compute_guess_properties_matches(video, self.release, 'videoCodec')
-        # guess resolution (screenSize in guessit)
-        matches |= compute_guess_properties_matches(video, self.rip, 'screenSize')
-        # guess format
-        matches |= compute_guess_properties_matches(video, self.rip, 'format')
         return matches
 
 
@@ -82,8 +87,7 @@ class TVsubtitlesProvider(Provider):
     link_re = re.compile('^(?P<series>[A-Za-z0-9 \'.]+).*\((?P<first_year>\d{4})-\d{4}\)$')
 
     def initialize(self):
-        self.session = requests.Session()
-        self.session.headers = {'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]}
+        self.session = transport.create_session({'User-Agent': 'Subliminal/%s' % __version__.split('-')[0]})
 
     def terminate(self):
         self.session.close()
@@ -99,7 +103,7 @@ class TVsubtitlesProvider(Provider):
         :rtype: :class:`bs4.BeautifulSoup`
 
         """
-        r = self.session.request(method, self.server + url, params=params, data=data, timeout=10)
+        r = self.session.request(method, self.server + url, params=params, data=data)
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         return bs4.BeautifulSoup(r.content, ['permissive'])
@@ -181,8 +185,7 @@ class TVsubtitlesProvider(Provider):
         return [s for s in self.query(video.series, video.season, video.episode, video.year) if s.language in languages]
 
     def download_subtitle(self, subtitle):
-        r = self.session.get(self.server + '/download-{subtitle_id}.html'.format(subtitle_id=subtitle.id),
-                             timeout=10)
+        r = self.session.get(self.server + '/download-{subtitle_id}.html'.format(subtitle_id=subtitle.id))
         if r.status_code != 200:
             raise ProviderError('Request failed with status code %d' % r.status_code)
         with zipfile.ZipFile(io.BytesIO(r.content)) as zf:
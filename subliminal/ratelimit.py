@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division
+import datetime
+import logging
+import threading
+import time
+from dogpile.cache.api import NO_VALUE
+from .cache import CACHE_VERSION
+
+
+logger = logging.getLogger(__name__)
+
+#: Expiration time for quota counts in the region
+QUOTA_EXPIRATION_TIME = datetime.timedelta(days=2).total_seconds()
+
+
+def get_quota_reset_delay(now):
+    """Get the time until daily quotas reset, at the start of the next UTC day
+
+    :param float now: current time in seconds since the epoch
+    :return: the delay in seconds
+    :rtype: float
+
+    """
+    return datetime.timedelta(days=1).total_seconds() - now % datetime.timedelta(days=1).total_seconds()
+
+
+class TokenBucket(object):
+    """Token bucket pacing requests at a sustained `rate` with bursts of up to `capacity` requests
+
+    Tokens are reserved in advance: a request that finds the bucket empty takes its token anyway and waits until the
+    token would have been added, so concurrent requests are scheduled one after the other at the `rate` rather than
+    polling for tokens. It is safe to share between threads.
+
+    :param float rate: number of tokens added per second
+    :param int capacity: maximum number of tokens in the bucket
+    :param timer: function returning the current time in seconds
+    :param sleep: function to wait with
+
+    """
+    def __init__(self, rate, capacity=1, timer=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.timer = timer
+        self.sleep = sleep
+
+        #: Number of tokens in the bucket, negative when tokens are reserved in advance
+        self.tokens = capacity
+
+        #: Time at which :attr:`tokens` was last updated
+        self.timestamp = timer()
+
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take `tokens` from the bucket, in advance if necessary
+
+        :param int tokens: number of tokens to take
+        :return: the time to wait in seconds before the tokens are available
+        :rtype: float
+
+        """
+        with self.lock:
+            now = self.timer()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            self.tokens -= tokens
+            return max(0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        """Take `tokens` from the bucket, waiting until they are available
+
+        :param int tokens: number of tokens to take
+        :return: the time waited in seconds
+        :rtype: float
+
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            self.sleep(delay)
+        return delay
+
+    def __repr__(self):
+        return '<%s [%g/s, %d]>' % (self.__class__.__name__, self.rate, self.capacity)
+
+
+class DailyQuota(object):
+    """Quota of actions per UTC day, persisted in a dogpile.cache region if any so it is accounted for across runs
+
+    It is safe to share between threads.
+
+    :param string name: name of the quota, e.g. the provider name
+    :param int limit: maximum number of actions per day
+    :param region: region to persist the count of actions in, if any
+    :type region: :class:`dogpile.cache.region.CacheRegion` or None
+    :param timer: function returning the current time in seconds since the epoch
+
+    """
+    def __init__(self, name, limit, region=None, timer=time.time):
+        self.name = name
+        self.limit = limit
+        self.region = region
+        self.timer = timer
+
+        #: Day and count of actions of the day, loaded on first use
+        self.day = None
+        self.count = 0
+
+        self.lock = threading.Lock()
+
+    @property
+    def key(self):
+        return '%d:quota:%s:%s' % (CACHE_VERSION, self.name, self.day.isoformat())
+
+    def refresh(self):
+        """Load the count of actions of the current day, must be called with :attr:`lock` held"""
+        day = datetime.datetime.utcfromtimestamp(self.timer()).date()
+        if self.region is not None:
+            self.day = day
+            count = self.region.get(self.key, expiration_time=QUOTA_EXPIRATION_TIME)
+            self.count = 0 if count is NO_VALUE else count
+        elif day != self.day:
+            self.day = day
+            self.count = 0
+
+    @property
+    def remaining(self):
+        """Number of actions left for the current day"""
+        with self.lock:
+            self.refresh()
+            return max(0, self.limit - self.count)
+
+    def consume(self, count=1):
+        """Account for `count` actions if the quota allows them
+
+        :param int count: number of actions
+        :return: `True` if the actions are accounted for, `False` if the quota is reached
+        :rtype: bool
+
+        """
+        with self.lock:
+            self.refresh()
+            if self.count + count > self.limit:
+                return False
+            self.count += count
+            if self.region is not None:
+                self.region.set(self.key, self.count)
+            return True
+
+    def refund(self, count=1):
+        """Give back `count` actions accounted for that did not happen, e.g. failed downloads
+
+        :param int count: number of actions
+
+        """
+        with self.lock:
+            self.refresh()
+            self.count = max(0, self.count - count)
+            if self.region is not None:
+                self.region.set(self.key, self.count)
+
+    def exhaust(self):
+        """Reach the quota for the current day, e.g. when the provider reports it"""
+        with self.lock:
+            self.refresh()
+            self.count = max(self.count, self.limit)
+            if self.region is not None:
+                self.region.set(self.key, self.count)
+
+    def __repr__(self):
+        return '<%s [%s, %d/%d]>' % (self.__class__.__name__, self.name, self.count, self.limit)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(object):
+    """Store of provider sessions, e.g. login tokens or cookies, persisted in a JSON file so they are reused across
+    runs until they expire
+
+    The file is only readable by its owner and is read again before each change, so processes sharing it keep each
+    other's sessions. It is safe to share between threads.
+
+    :param string path: path to the JSON file
+    :param timer: function returning the current time in seconds since the epoch
+
+    """
+    def __init__(self, path, timer=time.time):
+        self.path = path
+        self.timer = timer
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Load the sessions, must be called with :attr:`lock` held
+
+        :return: the sessions by key
+        :rtype: dict
+
+        """
+        try:
+            with io.open(self.path, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def save(self, sessions):
+        """Save the `sessions`, dropping the expired ones, must be called with :attr:`lock` held
+
+        :param dict sessions: the sessions by key
+
+        """
+        now = self.timer()
+        sessions = {k: s for k, s in sessions.items() if s['expires'] > now}
+        path = self.path + '.tmp'
+        with io.open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+            f.write(json.dumps(sessions).encode('utf-8'))
+        try:
+            os.rename(path, self.path)
+        except OSError:
+            os.remove(self.path)
+            os.rename(path, self.path)
+
+    def get(self, key):
+        """Get the data of a session
+
+        :param string key: key of the session, e.g. the provider name and username
+        :return: the data of the session, `None` if missing or expired
+        :rtype: dict or None
+
+        """
+        with self.lock:
+            session = self.load().get(key)
+        if session is None or session['expires'] <= self.timer():
+            return None
+        logger.debug('Reusing session %r', key)
+        return session['data']
+
+    def set(self, key, data, expiration_time):
+        """Set the data of a session
+
+        :param string key: key of the session, e.g. the provider name and username
+        :param dict data: data of the session, serializable to JSON
+        :param float expiration_time: time in seconds after which the session expires
+
+        """
+        with self.lock:
+            sessions = self.load()
+            sessions[key] = {'data': data, 'expires': self.timer() + expiration_time}
+            self.save(sessions)
+
+    def delete(self, key):
+        """Delete a session, if any
+
+        :param string key: key of the session
+
+        """
+        with self.lock:
+            sessions = self.load()
+            if sessions.pop(key, None) is not None:
+                self.save(sessions)
+
+    def __repr__(self):
+        return '<%s [%r]>' % (self.__class__.__name__, self.path)
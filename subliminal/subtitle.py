@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import codecs
+import heapq
+import itertools
 import logging
 import os.path
+import re
 import babelfish
-import chardet
-import guessit.matchtree
-import guessit.transfo
-import pysrt
+import chardet.universaldetector
+from .guess import guess_properties_info
 from .video import Episode, Movie
 
 
 logger = logging.getLogger(__name__)
 
+#: Size of the head of the content an encoding must decode before the whole content is decoded with it
+ENCODING_SAMPLE_SIZE = 4096
+
+#: Maximum size of the content fed to chardet
+CHARDET_MAX_SIZE = 16384
+
+#: Index of the last line at which a SubRip error makes the subtitle invalid, see :func:`is_valid_subrip`
+SUBRIP_TOLERANCE_LINE = 80
+
+#: Line breaks of :meth:`str.splitlines`
+LINE_BREAKS = '\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029'
+
+#: Line of a text, including its line break
+LINE_RE = re.compile('[^%s]*(?:\r\n|[%s])?' % (LINE_BREAKS, LINE_BREAKS))
+
+#: Separator of the time items of a SubRip timestamp
+SUBRIP_TIME_SEPARATOR_RE = re.compile(r'\:|\.|\,')
+
 
 class Subtitle(object):
     """Base class for subtitle
@@ -34,9 +54,22 @@ class Subtitle(object):
         #: Encoding to decode with when accessing :attr:`text`
         self.encoding = None
 
+        #: Memoized (content, guessed encoding, decoded text or None) of :attr:`guessed_encoding`
+        self._guess = None
+
+        #: Memoized (content, encoding, text) of :attr:`text`
+        self._text = None
+
     @property
     def guessed_encoding(self):
-        """Guessed encoding using the language, falling back on chardet"""
+        """Guessed encoding using the language, falling back on chardet, see :func:`detect_encoding`
+
+        The guess is memoized until :attr:`content` changes
+
+        """
+        if self._guess is not None and self._guess[0] is self.content:
+            return self._guess[1]
+
         # always try utf-8 first
         encodings = ['utf-8']
 
@@ -61,42 +94,45 @@ class Subtitle(object):
             # Western European (windows-1252)
             encodings.append('latin-1')
 
-        # try to decode
-        for encoding in encodings:
-            try:
-                self.content.decode(encoding)
-                return encoding
-            except UnicodeDecodeError:
-                pass
-
-        # fallback on chardet
-        logger.warning('Could not decode content with encodings %r', encodings)
-        return chardet.detect(self.content)['encoding']
+        encoding, text = detect_encoding(self.content, encodings)
+        self._guess = (self.content, encoding, text)
+        return encoding
 
     @property
     def text(self):
         """Content as string
 
-        If :attr:`encoding` is None, the encoding is guessed with :attr:`guessed_encoding`
+        If :attr:`encoding` is None, the encoding is guessed with :attr:`guessed_encoding`. The text is memoized
+        until :attr:`content` or :attr:`encoding` changes
 
         """
         if not self.content:
             return ''
-        return self.content.decode(self.encoding or self.guessed_encoding, errors='replace')
+        if self._text is not None and self._text[0] is self.content and self._text[1] == self.encoding:
+            return self._text[2]
+        if self.encoding is None:
+            encoding = self.guessed_encoding
+            text = self._guess[2]
+        else:
+            encoding, text = self.encoding, None
+        if text is None:
+            text = self.content.decode(encoding, errors='replace')
+        self._text = (self.content, self.encoding, text)
+        return text
 
     @property
     def is_valid(self):
-        """Check if a subtitle text is a valid SubRip format"""
+        """Check if a subtitle text is a valid SubRip format, see :func:`is_valid_subrip`"""
         try:
-            pysrt.from_string(self.text, error_handling=pysrt.ERROR_RAISE)
-            return True
-        except pysrt.Error as e:
-            if e.args[0] > 80:
-                return True
-        except:
+            return is_valid_subrip(self.text)
+        except Exception:
             logger.exception('Unexpected error when validating subtitle')
         return False
 
+    #: Matches that :meth:`compute_matches` can find in addition to those of :meth:`compute_cheap_matches`, if
+    #: the subtitle splits the computation of its matches, see :func:`iter_ranked_subtitles`
+    expensive_matches = None
+
     def compute_matches(self, video):
         """Compute the matches of the subtitle against the `video`
 
@@ -108,6 +144,20 @@ class Subtitle(object):
         """
         raise NotImplementedError
 
+    def compute_cheap_matches(self, video):
+        """Compute the matches of the subtitle against the `video` that are cheap to compute
+
+        Subtitles setting :attr:`expensive_matches` must implement this with the part of :meth:`compute_matches`
+        that does not use guessit, so the score can be bounded before the expensive matches are computed
+
+        :param video: the video to compute the matches against
+        :type video: :class:`~subliminal.video.Video`
+        :return: cheap matches of the subtitle
+        :rtype: set
+
+        """
+        raise NotImplementedError
+
     def compute_score(self, video):
         """Compute the score of the subtitle against the `video`
 
@@ -126,31 +176,290 @@ class Subtitle(object):
         :rtype: int
 
         """
-        score = 0
-        # compute matches
-        initial_matches = self.compute_matches(video)
-        matches = initial_matches.copy()
-        # hash is the perfect match
-        if 'hash' in matches:
-            score = video.scores['hash']
-        else:
-            # remove equivalences
-            if isinstance(video, Episode):
-                if 'imdb_id' in matches:
-                    matches -= {'series', 'tvdb_id', 'season', 'episode', 'title', 'year'}
-                if 'tvdb_id' in matches:
-                    matches -= {'series', 'year'}
-                if 'title' in matches:
-                    matches -= {'season', 'episode'}
-            # add other scores
-            score += sum((video.scores[match] for match in matches))
-        logger.info('Computed score %d with matches %r', score, initial_matches)
+        # skip the expensive matches when they cannot change the score, e.g. with a hash match
+        if self.expensive_matches is not None:
+            bits, _ = get_score_table(type(video))
+            lower, upper = get_score_bounds(type(video), self.expensive_matches)
+            matches = self.compute_cheap_matches(video)
+            mask = encode_matches(matches, bits)
+            if lower[mask] == upper[mask]:
+                logger.info('Computed score %d with cheap matches %r', upper[mask], matches)
+                return upper[mask]
+        matches = self.compute_matches(video)
+        score = compute_matches_score(matches, type(video))
+        logger.info('Computed score %d with matches %r', score, matches)
         return score
 
     def __repr__(self):
         return '<%s [%s]>' % (self.__class__.__name__, self.language)
 
 
+def compute_matches_score(matches, video_class):
+    """Compute the score of `matches` against a video of `video_class` with the equivalences of
+    :meth:`Subtitle.compute_score`
+
+    :param set matches: matches of a subtitle
+    :param video_class: class of the video the matches were computed against
+    :type video_class: :class:`~subliminal.video.Episode` or :class:`~subliminal.video.Movie`
+    :return: score of the matches
+    :rtype: int
+
+    """
+    # hash is the perfect match
+    if 'hash' in matches:
+        return video_class.scores['hash']
+    # remove equivalences
+    if issubclass(video_class, Episode):
+        matches = set(matches)
+        if 'imdb_id' in matches:
+            matches -= {'series', 'tvdb_id', 'season', 'episode', 'title', 'year'}
+        if 'tvdb_id' in matches:
+            matches -= {'series', 'year'}
+        if 'title' in matches:
+            matches -= {'season', 'episode'}
+    # add other scores
+    return sum((video_class.scores[match] for match in matches))
+
+
+#: Score tables by video class, see :func:`get_score_table`
+score_tables = {}
+
+
+def get_score_table(video_class):
+    """Get the score table of `video_class`
+
+    Each match of :attr:`~subliminal.video.Video.scores` is given a bit. The score table holds the score of every
+    combination of matches, computed with :func:`compute_matches_score`, at the index of the bitmask of the
+    combination. Tables are computed once per video class.
+
+    :param video_class: class of the videos to score against
+    :type video_class: :class:`~subliminal.video.Episode` or :class:`~subliminal.video.Movie`
+    :return: the bit of each match and the score table
+    :rtype: tuple of (dict of match => int, list of int)
+
+    """
+    if video_class not in score_tables:
+        names = sorted(video_class.scores)
+        bits = {name: 1 << i for i, name in enumerate(names)}
+        table = [compute_matches_score({n for n in names if mask & bits[n]}, video_class)
+                 for mask in range(1 << len(names))]
+        score_tables[video_class] = bits, table
+    return score_tables[video_class]
+
+
+#: Score bounds tables by video class and expensive matches, see :func:`get_score_bounds`
+score_bounds = {}
+
+
+def get_score_bounds(video_class, expensive_matches):
+    """Get the score bounds tables of `video_class` for subtitles that can find `expensive_matches`
+
+    The tables hold the lowest and the highest score that adding any of the `expensive_matches` to each
+    combination of matches can give, at the index of the bitmask of the combination, see :func:`get_score_table`.
+    When both bounds are equal, the expensive matches cannot change the score.
+
+    :param video_class: class of the videos to score against
+    :type video_class: :class:`~subliminal.video.Episode` or :class:`~subliminal.video.Movie`
+    :param set expensive_matches: matches that may be added to the cheap matches
+    :return: the lower bounds and the upper bounds tables
+    :rtype: tuple of (list of int, list of int)
+
+    """
+    key = (video_class, frozenset(expensive_matches))
+    if key not in score_bounds:
+        bits, table = get_score_table(video_class)
+        lower, upper = list(table), list(table)
+        for bit in (bits[m] for m in expensive_matches if m in bits):
+            for mask in range(len(table)):
+                if not mask & bit:
+                    lower[mask] = min(lower[mask], lower[mask | bit])
+                    upper[mask] = max(upper[mask], upper[mask | bit])
+        score_bounds[key] = lower, upper
+    return score_bounds[key]
+
+
+def encode_matches(matches, bits):
+    """Encode `matches` as a bitmask
+
+    :param set matches: matches of a subtitle
+    :param dict bits: bit of each match, see :func:`get_score_table`
+    :return: the bitmask of the matches
+    :rtype: int
+
+    """
+    mask = 0
+    for match in matches:
+        mask |= bits[match]
+    return mask
+
+
+def compute_scores(subtitles, video):
+    """Compute the scores of `subtitles` against the `video` in a batch and rank them
+
+    Matches are encoded as bitmasks and scores are looked up in the score table of the class of the `video`,
+    see :func:`get_score_table`. Scores are the same as :meth:`Subtitle.compute_score`.
+
+    :param subtitles: subtitles to score
+    :type subtitles: list of :class:`Subtitle`
+    :param video: the video to compute the scores against
+    :type video: :class:`~subliminal.video.Video`
+    :return: subtitles with their score, best first and in the order of `subtitles` for equal scores
+    :rtype: list of tuple of (:class:`Subtitle`, int)
+
+    """
+    bits, table = get_score_table(type(video))
+    masks = [encode_matches(s.compute_matches(video), bits) for s in subtitles]
+    scores = [table[mask] for mask in masks]
+    ranking = sorted(range(len(subtitles)), key=scores.__getitem__, reverse=True)
+    logger.info('Computed %d scores', len(subtitles))
+    return [(subtitles[i], scores[i]) for i in ranking]
+
+
+def iter_ranked_subtitles(subtitles, video, min_score=0, skip=None):
+    """Lazily rank `subtitles` against the `video`, best first
+
+    Subtitles are ranked in the same order as :func:`compute_scores` but only as far as they are consumed.
+    Subtitles with :attr:`~Subtitle.expensive_matches` are first bounded with their cheap matches, see
+    :func:`get_score_bounds`, and their expensive matches are only computed when their upper bound reaches the
+    top of the ranking. Subtitles that cannot reach `min_score` are never fully scored.
+
+    :param subtitles: subtitles to rank
+    :type subtitles: list of :class:`Subtitle`
+    :param video: the video to compute the scores against
+    :type video: :class:`~subliminal.video.Video`
+    :param int min_score: minimum score of the subtitles to yield
+    :param skip: function returning `True` for the subtitles to leave out, called as late as possible
+    :type skip: callable or None
+    :return: a generator of subtitles with their score
+    :rtype: generator of tuple of (:class:`Subtitle`, int)
+
+    """
+    bits, table = get_score_table(type(video))
+    # heap of (-score or -upper bound, index, exact, subtitle) with the index keeping the order of subtitles
+    heap = []
+    for i, subtitle in enumerate(subtitles):
+        if subtitle.expensive_matches is None:
+            heap.append((-table[encode_matches(subtitle.compute_matches(video), bits)], i, True, subtitle))
+            continue
+        lower, upper = get_score_bounds(type(video), subtitle.expensive_matches)
+        mask = encode_matches(subtitle.compute_cheap_matches(video), bits)
+        heap.append((-upper[mask], i, lower[mask] == upper[mask], subtitle))
+    heapq.heapify(heap)
+    while heap:
+        score, i, exact, subtitle = heapq.heappop(heap)
+        if -score < min_score:
+            logger.info('No subtitle with score >= %d, %d subtitles not fully scored', min_score,
+                        sum(not e for _, _, e, _ in heap) + (not exact))
+            return
+        if skip is not None and skip(subtitle):
+            continue
+        if not exact:
+            heapq.heappush(heap, (-table[encode_matches(subtitle.compute_matches(video), bits)], i, True, subtitle))
+            continue
+        yield subtitle, -score
+
+
+def detect_encoding(content, encodings):
+    """Detect the encoding of `content` among `encodings`, falling back on chardet
+
+    Each encoding must first decode the head of the content, up to :data:`ENCODING_SAMPLE_SIZE`, so wrong encodings
+    are ruled out without decoding the whole content. The first encoding that decodes the whole content is returned
+    along with the decoded text. Otherwise chardet is fed with the content until it is confident, up to
+    :data:`CHARDET_MAX_SIZE`
+
+    :param bytes content: the content to detect the encoding of
+    :param list encodings: the encodings to try, in order
+    :return: the detected encoding and the text decoded with it, if any
+    :rtype: tuple(string, string or None)
+
+    """
+    sample = content[:ENCODING_SAMPLE_SIZE] if len(content) > ENCODING_SAMPLE_SIZE else None
+    for encoding in encodings:
+        try:
+            if sample is not None:
+                # incremental decoding does not fail on a multibyte character truncated by the sample
+                codecs.getincrementaldecoder(encoding)().decode(sample)
+            return encoding, content.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+
+    # fallback on chardet
+    logger.warning('Could not decode content with encodings %r', encodings)
+    detector = chardet.universaldetector.UniversalDetector()
+    for i in range(0, min(len(content), CHARDET_MAX_SIZE), ENCODING_SAMPLE_SIZE):
+        detector.feed(content[i:i + ENCODING_SAMPLE_SIZE])
+        if detector.done:
+            break
+    detector.close()
+    return detector.result['encoding'], None
+
+
+def iter_lines(text):
+    """Iterate over the lines of `text` lazily, as split by :meth:`str.splitlines` with line breaks kept
+
+    :param string text: the text to split
+    :return: the lines
+    :rtype: iterator of string
+
+    """
+    for match in LINE_RE.finditer(text):
+        line = match.group()
+        if not line:
+            return
+        yield line
+
+
+def is_valid_subrip_block(lines):
+    """Check if the `lines` of a block are a valid SubRip item: an optional index, then a timestamp line followed
+    by the text
+
+    :param list lines: the non-blank lines of the block
+    :return: `True` if the block is valid, `False` otherwise
+    :rtype: bool
+
+    """
+    if len(lines) < 2:
+        return False
+    timestamps = (lines[0] if '-->' in lines[0] else lines[1]).rstrip().split('-->')
+    if len(timestamps) != 2:
+        return False
+    start = timestamps[0].strip()
+    end = timestamps[1].lstrip().split(' ', 1)[0].strip()
+    for timestamp in (start, end):
+        if not timestamp:
+            continue
+        fields = SUBRIP_TIME_SEPARATOR_RE.split(timestamp)
+        if len(fields) != 4 or not all(f.isdigit() for f in fields):
+            return False
+    return True
+
+
+def is_valid_subrip(text):
+    """Check if `text` is a valid SubRip format
+
+    Blocks of non-blank lines are checked one at a time with :func:`is_valid_subrip_block`, with the tolerance of
+    pysrt's parsing as it was previously used: the text is invalid if a block ending before or at line
+    :data:`SUBRIP_TOLERANCE_LINE` is invalid. Scanning stops as soon as this is decided, so at most the first
+    lines of the text are read. Being a module-level function of the text, it can be mapped over a worker pool
+
+    :param string text: the text to check
+    :return: `True` if the text is valid, `False` otherwise
+    :rtype: bool
+
+    """
+    block = []
+    for index, line in enumerate(itertools.chain(iter_lines(text), ['\n'])):
+        if index > SUBRIP_TOLERANCE_LINE:
+            return True
+        if line.strip():
+            block.append(line)
+            continue
+        if block and not is_valid_subrip_block(block):
+            return False
+        block = []
+    return True
+
+
 def get_subtitle_path(video_path, language=None):
     """Create the subtitle path from the given `video_path` and `language`
 
@@ -170,6 +479,11 @@ def get_subtitle_path(video_path, language=None):
     return subtitle_path + '.srt'
 
 
+#: Matches that :func:`compute_guess_matches` can find
+GUESS_MATCHES = {'series', 'season', 'episode', 'year', 'title', 'release_group', 'resolution', 'format',
+                 'video_codec', 'audio_codec'}
+
+
 def compute_guess_matches(video, guess):
     """Compute matches between a `video` and a `guess`
 
@@ -266,12 +580,18 @@ def compute_guess_properties_matches(video, string, propertytype):
 
 
 def guess_properties(string, propertytype):
-    properties = set()
-    if string:
-        tree = guessit.matchtree.MatchTree(string)
-        guessit.transfo.guess_properties.GuessProperties().process(tree)
-        properties = set(n.guess[propertytype] for n in tree.nodes() if propertytype in n.guess)
-    return properties
+    """Get the values of a certain property type in `string`
+
+    All the property types of `string` are extracted once and cached, see
+    :func:`~subliminal.guess.guess_properties_info`, so checking several property types of the same string is cheap
+
+    :param string string: the string to check for a certain property type
+    :param string propertytype: the type of property to check (as defined in guessit)
+    :return: the values of the property type
+    :rtype: set
+
+    """
+    return guess_properties_info(string).get(propertytype, set())
 
 
 def fix_line_endings(content):
@@ -3,15 +3,56 @@
 from __future__ import unicode_literals
 import os
 import shutil
-from unittest import TestCase, TestSuite, TestLoader, TextTestRunner
+import socket
+import struct
+import threading
+import time
+from unittest import TestCase, TestSuite, TestLoader, TextTestRunner, skipIf
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from SimpleXMLRPCServer import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
 from babelfish import Language
-from subliminal import list_subtitles, download_subtitles, save_subtitles, download_best_subtitles, scan_video
+from dogpile.cache import make_region
+import requests
+from subliminal import (list_subtitles, download_subtitles, save_subtitles, download_best_subtitles, scan_video,
+    iter_videos, scan_videos, ScanIndex, circuit, watch)
+from subliminal.api import download_ranked_subtitles, imap, list_subtitles_async, download_best_subtitles_async
+from subliminal.circuit import CircuitBreaker
+from subliminal.compat import ServerProxy
+from subliminal.exceptions import DownloadLimitExceeded, ProbeError
+from subliminal.guess import GuessCache, extract_properties, guess_cache
+from subliminal.probe import BudgetReader, probe
+from subliminal.providers import Provider, ProviderPool, provider_manager
+from subliminal.providers.opensubtitles import OpenSubtitlesProvider, Unauthorized
+from subliminal.ratelimit import DailyQuota, TokenBucket, get_quota_reset_delay
+from subliminal.sessions import SessionStore
+from subliminal.subtitle import (Subtitle, compute_guess_properties_matches, compute_scores, detect_encoding,
+    is_valid_subrip, iter_lines, iter_ranked_subtitles, ENCODING_SAMPLE_SIZE, GUESS_MATCHES)
 from subliminal.tests.common import MOVIES, EPISODES
-
+from subliminal.transport import Transport, XMLRPCTransport, transport
+from subliminal.video import compute_hashes, hash_opensubtitles, hash_thesubdb, hash_opensubtitles_chunks
+from subliminal.watch import Debouncer, watch_best_subtitles
 
 TEST_DIR = 'test_data'
 
 
+def ebml(element_id, data):
+    return bytes(bytearray.fromhex('%x' % element_id)) + struct.pack(b'>I', 0x10000000 | len(data)) + data
+
+
+def box(box_type, data):
+    return struct.pack(b'>I4s', len(data) + 8, box_type) + data
+
+
+def chunk(chunk_id, data):
+    return struct.pack(b'<4sI', chunk_id, len(data)) + data + b'\x00' * (len(data) % 2)
+
+
 class ApiTestCase(TestCase):
     def setUp(self):
         os.mkdir(TEST_DIR)
@@ -179,11 +220,1107 @@ class VideoTestCase(TestCase):
         scanned_video = scan_video(os.path.join(TEST_DIR, os.path.split(video.name)[1]))
         self.assertEqual(scanned_video.subtitle_languages, {Language('eng'), Language('fra'), Language('und')})
 
+    def test_hash_opensubtitles(self):
+        video_path = os.path.join(TEST_DIR, 'hash.mkv')
+        with open(video_path, 'wb') as f:
+            f.write(bytes(bytearray((i * 7) % 251 for i in range(200003))))
+        self.assertEqual(hash_opensubtitles(video_path), '6c88a1b0bdd6dfe5')
+
+    def test_hash_opensubtitles_too_small(self):
+        video_path = os.path.join(TEST_DIR, 'hash.mkv')
+        with open(video_path, 'wb') as f:
+            f.write(b'\x00' * 131071)
+        self.assertIsNone(hash_opensubtitles(video_path))
+
+    def test_hash_thesubdb_too_small(self):
+        video_path = os.path.join(TEST_DIR, 'hash.mkv')
+        with open(video_path, 'wb') as f:
+            f.write(b'\x00' * 65535)
+        self.assertIsNone(hash_thesubdb(video_path))
+
+    def test_scan_videos_subtitles_languages(self):
+        episode_path = os.path.join(TEST_DIR, os.path.splitext(os.path.split(EPISODES[0].name)[1])[0])
+        open(episode_path + '.en.srt', 'w').close()
+        open(episode_path + '.fr.srt', 'w').close()
+        movie_path = os.path.join(TEST_DIR, os.path.splitext(os.path.split(MOVIES[0].name)[1])[0])
+        open(movie_path + '.srt', 'w').close()
+        scanned_videos = {os.path.splitext(v.name)[0]: v for v in scan_videos([os.path.abspath(TEST_DIR)])}
+        self.assertEqual(scanned_videos[os.path.abspath(episode_path)].subtitle_languages,
+                         {Language('eng'), Language('fra')})
+        self.assertEqual(scanned_videos[os.path.abspath(movie_path)].subtitle_languages, {Language('und')})
+        self.assertEqual(len([v for v in scanned_videos.values() if v.subtitle_languages]), 2)
+
+    def test_compute_hashes(self):
+        video_path = os.path.join(TEST_DIR, 'hash.mkv')
+        with open(video_path, 'wb') as f:
+            f.write(bytes(bytearray((i * 7) % 251 for i in range(200003))))
+        self.assertEqual(compute_hashes(video_path), {'opensubtitles': hash_opensubtitles(video_path),
+                                                      'thesubdb': hash_thesubdb(video_path)})
+        self.assertEqual(compute_hashes(video_path, {'opensubtitles': hash_opensubtitles_chunks}),
+                         {'opensubtitles': '6c88a1b0bdd6dfe5'})
+
+    def test_scan_videos_workers(self):
+        scanned_videos = scan_videos([os.path.abspath(TEST_DIR)])
+        self.assertEqual(len(scanned_videos), len(MOVIES + EPISODES))
+        parallel_scanned_videos = scan_videos([os.path.abspath(TEST_DIR)], workers=2)
+        self.assertEqual([v.name for v in parallel_scanned_videos], [v.name for v in scanned_videos])
+
+    def test_iter_videos(self):
+        videos = iter_videos([os.path.abspath(TEST_DIR)])
+        video = next(videos)
+        self.assertIn(video.name, [os.path.join(os.path.abspath(TEST_DIR), os.path.split(v.name)[1])
+                                   for v in MOVIES + EPISODES])
+        self.assertEqual([video.name] + [v.name for v in videos],
+                         [v.name for v in scan_videos([os.path.abspath(TEST_DIR)])])
+
+    def test_scan_videos_index(self):
+        video = EPISODES[0]
+        video_path = os.path.join(os.path.abspath(TEST_DIR), os.path.split(video.name)[1])
+        with ScanIndex(os.path.join(TEST_DIR, 'index.db')) as index:
+            scanned_videos = scan_videos([os.path.abspath(TEST_DIR)], index=index)
+            self.assertIsNotNone(index.get_video(video_path, os.stat(video_path)))
+        open(os.path.splitext(video_path)[0] + '.en.srt', 'w').close()
+        with ScanIndex(os.path.join(TEST_DIR, 'index.db')) as index:
+            indexed_videos = scan_videos([os.path.abspath(TEST_DIR)], index=index)
+        self.assertEqual([v.name for v in indexed_videos], [v.name for v in scanned_videos])
+        indexed_video = [v for v in indexed_videos if v.name == video_path][0]
+        self.assertEqual(indexed_video.series, video.series)
+        self.assertEqual(indexed_video.subtitle_languages, {Language('eng')})
+
+    def test_scan_videos_index_racy_directory(self):
+        path = os.path.join(os.path.abspath(TEST_DIR), 'videos')
+        os.mkdir(path)
+        open(os.path.join(path, 'Dallas.S01E03.mkv'), 'w').close()
+        stat = os.stat(path)
+        with ScanIndex(os.path.join(TEST_DIR, 'index.db'), timer=lambda: stat.st_mtime + 1) as index:
+            scan_videos([path], index=index)
+            self.assertIsNone(index.get_directory(path, stat))
+            index.timer = lambda: stat.st_mtime + 2
+            scan_videos([path], index=index)
+            self.assertIsNotNone(index.get_directory(path, stat))
+
+    def test_scan_videos_follow_symlinks(self):
+        videos_dir = os.path.join(os.path.abspath(TEST_DIR), 'videos')
+        links_dir = os.path.join(os.path.abspath(TEST_DIR), 'links')
+        os.mkdir(videos_dir)
+        os.mkdir(links_dir)
+        open(os.path.join(videos_dir, 'Dallas.S01E03.mkv'), 'w').close()
+        os.symlink(os.path.join(videos_dir, 'Dallas.S01E03.mkv'), os.path.join(links_dir, 'Dallas.S01E04.mkv'))
+        os.symlink(videos_dir, os.path.join(links_dir, 'videos'))
+        self.assertEqual(scan_videos([links_dir]), [])
+        scanned_videos = scan_videos([links_dir], follow_symlinks=True)
+        self.assertEqual(sorted(v.name for v in scanned_videos),
+                         [os.path.join(links_dir, 'Dallas.S01E04.mkv'),
+                          os.path.join(links_dir, 'videos', 'Dallas.S01E03.mkv')])
+
+
+class ProbeTestCase(TestCase):
+    def setUp(self):
+        os.mkdir(TEST_DIR)
+        self.mkv_tracks = ebml(0x1654AE6B,
+                               ebml(0xAE, ebml(0x83, b'\x01') + ebml(0x86, b'V_MPEG4/ISO/AVC') +
+                                    ebml(0xE0, ebml(0xBA, b'\x02\xd0') + ebml(0x9A, b'\x02'))) +
+                               ebml(0xAE, ebml(0x83, b'\x02') + ebml(0x86, b'A_AC3')) +
+                               ebml(0xAE, ebml(0x83, b'\x11') + ebml(0x86, b'S_TEXT/UTF8') + ebml(0x22B59C, b'fre')))
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def write(self, filename, data):
+        video_path = os.path.join(TEST_DIR, filename)
+        with open(video_path, 'wb') as f:
+            f.write(data)
+        return video_path
+
+    def test_probe_mkv(self):
+        video_path = self.write('Dallas.S01E03.mkv', ebml(0x1A45DFA3, ebml(0x4282, b'matroska')) +
+                                ebml(0x18538067, ebml(0x1549A966, b'\x00' * 100) + self.mkv_tracks +
+                                     ebml(0x1F43B675, b'\x00' * 100)))
+        video = scan_video(video_path)
+        self.assertEqual(video.resolution, '720p')
+        self.assertEqual(video.video_codec, 'h264')
+        self.assertEqual(video.audio_codec, 'AC3')
+        self.assertEqual(video.subtitle_languages, {Language('fra')})
+
+    def test_probe_mkv_seek_head(self):
+        cluster = ebml(0x1F43B675, b'\x00' * 100000)
+        seek_head = ebml(0x114D9B74, ebml(0x4DBB, ebml(0x53AB, b'\x16\x54\xae\x6b') +
+                                           ebml(0x53AC, struct.pack(b'>I', 100 + len(cluster)))))
+        seek_head += ebml(0xEC, b'\x00' * (100 - len(seek_head) - 5))
+        video_path = self.write('Dallas.S01E03.mkv', ebml(0x1A45DFA3, ebml(0x4282, b'matroska')) +
+                                ebml(0x18538067, seek_head + cluster + self.mkv_tracks))
+        self.assertEqual([(t.type, t.codec, t.height) for t in probe(video_path, budget=1000)],
+                         [('video', 'h264', 720), ('audio', 'AC3', None), ('subtitle', None, None)])
+
+    def test_probe_mkv_budget(self):
+        video_path = self.write('Dallas.S01E03.mkv', ebml(0x1A45DFA3, ebml(0x4282, b'matroska')) +
+                                ebml(0x18538067, ebml(0x1549A966, b'\x00' * 100) + self.mkv_tracks))
+        with self.assertRaises(ProbeError):
+            probe(video_path, budget=50)
+        self.assertEqual(len(probe(video_path, budget=200)), 3)
+
+    def mp4_trak(self, handler_type, language, sample_entry, track_id=0, tref=b''):
+        return box(b'trak', box(b'tkhd', b'\x00' * 12 + struct.pack(b'>I', track_id) + b'\x00' * 68) + tref +
+                   box(b'mdia', box(b'mdhd', b'\x00' * 20 + struct.pack(b'>H', language) + b'\x00' * 2) +
+                       box(b'hdlr', b'\x00' * 8 + handler_type + b'\x00' * 13) +
+                       box(b'minf', box(b'stbl', box(b'stts', b'\x00' * 8) +
+                                        box(b'stsd', b'\x00' * 8 + sample_entry)))))
+
+    def test_probe_mp4(self):
+        video_path = self.write('Dallas.S01E03.mp4', box(b'ftyp', b'isom' + b'\x00' * 4) +
+                                box(b'mdat', b'\x00' * 100000) +
+                                box(b'moov', box(b'mvhd', b'\x00' * 100) +
+                                    self.mp4_trak(b'vide', 0x55c4, box(b'avc1', b'\x00' * 24 + b'\x05\x00\x04\x38')) +
+                                    self.mp4_trak(b'soun', 0x15c7, box(b'mp4a', b'\x00' * 28)) +
+                                    self.mp4_trak(b'sbtl', 0x1a41, box(b'tx3g', b'\x00' * 28))))
+        video = scan_video(video_path)
+        self.assertEqual(video.resolution, '1080p')
+        self.assertEqual(video.video_codec, 'h264')
+        self.assertEqual(video.audio_codec, 'AAC')
+        self.assertEqual(video.subtitle_languages, {Language('fra')})
+
+    def test_probe_mp4_chapter_track(self):
+        video_path = self.write('Dallas.S01E03.mp4', box(b'ftyp', b'isom' + b'\x00' * 4) +
+                                box(b'moov', box(b'mvhd', b'\x00' * 100) +
+                                    self.mp4_trak(b'vide', 0x55c4, box(b'avc1', b'\x00' * 24 + b'\x05\x00\x04\x38'),
+                                                  1, box(b'tref', box(b'chap', struct.pack(b'>I', 3)))) +
+                                    self.mp4_trak(b'text', 0x1a41, box(b'tx3g', b'\x00' * 28), 2) +
+                                    self.mp4_trak(b'text', 0x15c7, box(b'tx3g', b'\x00' * 28), 3)) +
+                                box(b'mdat', b'\x00' * 100000))
+        self.assertEqual([(t.type, t.language) for t in probe(video_path)],
+                         [('video', None), ('subtitle', Language('fra'))])
+        video = scan_video(video_path)
+        self.assertEqual(video.resolution, '1080p')
+        self.assertEqual(video.subtitle_languages, {Language('fra')})
+
+    def test_probe_avi(self):
+        strl_video = chunk(b'LIST', b'strl' + chunk(b'strh', b'vidsXVID' + b'\x00' * 48) +
+                           chunk(b'strf', struct.pack(b'<IiiHH4s', 40, 1280, 720, 1, 24, b'XVID') + b'\x00' * 20))
+        strl_audio = chunk(b'LIST', b'strl' + chunk(b'strh', b'auds' + b'\x00' * 52) +
+                           chunk(b'strf', struct.pack(b'<H', 0x2000) + b'\x00' * 16))
+        hdrl = chunk(b'LIST', b'hdrl' + chunk(b'avih', b'\x00' * 56) + strl_video + strl_audio)
+        video_path = self.write('Dallas.S01E03.avi', chunk(b'RIFF', b'AVI ' + hdrl + chunk(b'LIST', b'movi' +
+                                                                                          b'\x00' * 100000)))
+        video = scan_video(video_path)
+        self.assertEqual(video.resolution, '720p')
+        self.assertEqual(video.video_codec, 'XviD')
+        self.assertEqual(video.audio_codec, 'AC3')
+
+    def test_probe_avi_invalid_hdrl_size(self):
+        video_path = self.write('Dallas.S01E03.avi', b'RIFF' + struct.pack(b'<I', 100012) + b'AVI ' + b'LIST' +
+                                struct.pack(b'<I', 2) + b'hdrl' + b'\x00' * 100000)
+        with self.assertRaises(ProbeError):
+            probe(video_path)
+        with open(video_path, 'rb') as f:
+            with self.assertRaises(ProbeError):
+                BudgetReader(f).read(-1)
+
+
+class GuessCacheTestCase(TestCase):
+    def test_guess(self):
+        guess_cache = GuessCache()
+        guess = guess_cache.guess('The.Big.Bang.Theory.S07E05.720p.HDTV.X264-DIMENSION.mkv', 'episode')
+        self.assertEqual(guess['series'], 'The Big Bang Theory')
+        self.assertIs(guess_cache.guess('The.Big.Bang.Theory.S07E05.720p.HDTV.X264-DIMENSION.mkv', 'episode'), guess)
+        self.assertIsNot(guess_cache.guess('The.Big.Bang.Theory.S07E05.720p.HDTV.X264-DIMENSION.mkv', 'file'), guess)
+        self.assertEqual((guess_cache.hits, guess_cache.misses), (1, 2))
+
+    def test_guess_size(self):
+        guess_cache = GuessCache(size=2)
+        guess_cache.guess('Dallas.S01E01.mkv', 'episode')
+        guess_cache.guess('Dallas.S01E02.mkv', 'episode')
+        guess_cache.guess('Dallas.S01E01.mkv', 'episode')
+        guess_cache.guess('Dallas.S01E03.mkv', 'episode')
+        self.assertEqual(list(guess_cache.guesses),
+                         [('episode', 'Dallas.S01E01.mkv'), ('episode', 'Dallas.S01E03.mkv')])
+
+    def test_extract_properties(self):
+        properties = extract_properties('720p.HDTV.x264-DIMENSION')
+        self.assertEqual(properties['screenSize'], {'720p'})
+        self.assertEqual(properties['format'], {'HDTV'})
+        self.assertEqual(properties['videoCodec'], {'h264'})
+        self.assertEqual(extract_properties(''), {})
+
+    def test_compute_guess_properties_matches(self):
+        guess_cache.clear()
+        video = EPISODES[0]
+        self.assertEqual(compute_guess_properties_matches(video, '720p.HDTV.x264-DIMENSION', 'screenSize'),
+                         {'resolution'})
+        self.assertEqual(compute_guess_properties_matches(video, '720p.HDTV.x264-DIMENSION', 'format'), {'format'})
+        self.assertEqual((guess_cache.hits, guess_cache.misses), (1, 1))
+
+    def test_guess_region(self):
+        region = make_region().configure('dogpile.cache.memory')
+        GuessCache(region=region).guess('Dallas.S01E01.mkv', 'episode')
+        guess_cache = GuessCache(region=region)
+        self.assertEqual(guess_cache.guess('Dallas.S01E01.mkv', 'episode')['episodeNumber'], 1)
+        self.assertEqual(guess_cache.misses, 1)
+        self.assertEqual(len(region.backend._cache), 1)
+
+
+class MatchesSubtitle(Subtitle):
+    def __init__(self, matches):
+        super(MatchesSubtitle, self).__init__(Language('eng'))
+        self.matches = matches
+
+    def compute_matches(self, video):
+        return set(self.matches)
+
+
+class SplitMatchesSubtitle(MatchesSubtitle):
+    expensive_matches = GUESS_MATCHES
+
+    def __init__(self, cheap_matches, matches):
+        super(SplitMatchesSubtitle, self).__init__(matches | cheap_matches)
+        self.cheap_matches = cheap_matches
+        self.computed = False
+
+    def compute_matches(self, video):
+        self.computed = True
+        return super(SplitMatchesSubtitle, self).compute_matches(video)
+
+    def compute_cheap_matches(self, video):
+        return set(self.cheap_matches)
+
+
+class ScoreTestCase(TestCase):
+    def test_compute_scores_episode(self):
+        subtitles = [MatchesSubtitle(m) for m in [{'series', 'season', 'episode'}, {'hash', 'series'},
+                                                  {'imdb_id', 'series', 'season', 'title', 'format'},
+                                                  {'tvdb_id', 'series', 'year', 'resolution'}, set(),
+                                                  {'series', 'season', 'episode', 'title', 'release_group'},
+                                                  {'episode', 'season', 'series'}]]
+        scores = compute_scores(subtitles, EPISODES[0])
+        self.assertEqual(scores, sorted([(s, s.compute_score(EPISODES[0])) for s in subtitles],
+                                        key=lambda x: x[1], reverse=True))
+        self.assertEqual(scores[0], (subtitles[1], EPISODES[0].scores['hash']))
+        self.assertEqual([s for s, _ in scores[-3:]], [subtitles[0], subtitles[6], subtitles[4]])
+
+    def test_compute_scores_movie(self):
+        subtitles = [MatchesSubtitle(m) for m in [{'title'}, {'hash', 'title'}, {'imdb_id', 'title', 'year'},
+                                                  {'title', 'year', 'video_codec'}]]
+        self.assertEqual(compute_scores(subtitles, MOVIES[0]),
+                         sorted([(s, s.compute_score(MOVIES[0])) for s in subtitles], key=lambda x: x[1],
+                                reverse=True))
+
+    def test_compute_score_hash(self):
+        subtitle = SplitMatchesSubtitle({'hash'}, {'series', 'season'})
+        self.assertEqual(subtitle.compute_score(EPISODES[0]), EPISODES[0].scores['hash'])
+        self.assertFalse(subtitle.computed)
+        subtitle = SplitMatchesSubtitle({'imdb_id'}, {'series', 'season', 'release_group'})
+        self.assertEqual(subtitle.compute_score(EPISODES[0]), EPISODES[0].scores['imdb_id'] +
+                         EPISODES[0].scores['release_group'])
+        self.assertTrue(subtitle.computed)
+
+    def test_iter_ranked_subtitles(self):
+        subtitles = [SplitMatchesSubtitle(c, m) for c, m in [({'series'}, {'season', 'episode'}),
+                                                             ({'hash'}, {'series'}),
+                                                             ({'imdb_id'}, {'series', 'season', 'format'}),
+                                                             (set(), {'series', 'year', 'resolution'}),
+                                                             (set(), set()),
+                                                             ({'series', 'season'}, {'episode', 'title'}),
+                                                             ({'episode', 'season'}, {'series'})]]
+        self.assertEqual(list(iter_ranked_subtitles(subtitles, EPISODES[0])), compute_scores(subtitles, EPISODES[0]))
+
+    def test_iter_ranked_subtitles_pruning(self):
+        subtitles = [SplitMatchesSubtitle({'hash'}, {'series'}), SplitMatchesSubtitle({'series'}, {'season'}),
+                     SplitMatchesSubtitle(set(), {'resolution'})]
+        subtitles[2].expensive_matches = {'resolution', 'format'}
+        ranked_subtitles = iter_ranked_subtitles(subtitles, EPISODES[0], min_score=30)
+        self.assertEqual(next(ranked_subtitles), (subtitles[0], EPISODES[0].scores['hash']))
+        self.assertEqual([s.computed for s in subtitles], [False, False, False])
+        self.assertEqual(next(ranked_subtitles), (subtitles[1], EPISODES[0].scores['series'] +
+                                                  EPISODES[0].scores['season']))
+        self.assertEqual(list(ranked_subtitles), [])
+        self.assertEqual([s.computed for s in subtitles], [False, True, False])
+
+    def test_iter_ranked_subtitles_skip(self):
+        subtitles = [SplitMatchesSubtitle({'series'}, {'season'}), SplitMatchesSubtitle({'series'}, {'episode'})]
+        ranked_subtitles = iter_ranked_subtitles(subtitles, EPISODES[0], skip=lambda s: s is subtitles[0])
+        self.assertEqual([s for s, _ in ranked_subtitles], [subtitles[1]])
+        self.assertEqual([s.computed for s in subtitles], [False, True])
+
+
+class SubtitleTestCase(TestCase):
+    def test_detect_encoding_sample(self):
+        content = 'é'.encode('latin-1') + b'a' * ENCODING_SAMPLE_SIZE
+        self.assertEqual(detect_encoding(content, ['utf-8', 'latin-1']), ('latin-1', content.decode('latin-1')))
+
+    def test_detect_encoding_truncated_sample(self):
+        content = b'a' * (ENCODING_SAMPLE_SIZE - 1) + 'é'.encode('utf-8')
+        self.assertEqual(detect_encoding(content, ['utf-8', 'latin-1']), ('utf-8', content.decode('utf-8')))
+
+    def test_detect_encoding_chardet(self):
+        content = ('Привет, как дела? ' * 100).encode('koi8-r')
+        encoding, text = detect_encoding(content, ['utf-8'])
+        self.assertEqual(encoding.lower(), 'koi8-r')
+        self.assertIsNone(text)
+
+    def test_text_memoized(self):
+        subtitle = Subtitle(Language('fra'))
+        subtitle.content = 'Ça va ?'.encode('latin-1')
+        self.assertEqual(subtitle.guessed_encoding, 'latin-1')
+        self.assertIs(subtitle.text, subtitle.text)
+        subtitle.encoding = 'utf-8'
+        self.assertEqual(subtitle.text, '\ufffda va ?')
+        subtitle.content = 'Ça va ?'.encode('utf-8')
+        subtitle.encoding = None
+        self.assertEqual(subtitle.guessed_encoding, 'utf-8')
+        self.assertEqual(subtitle.text, 'Ça va ?')
+
+    def test_iter_lines(self):
+        text = 'a\r\nb\rc\x85d\n\ne'
+        self.assertEqual(list(iter_lines(text)), text.splitlines(True))
+
+    def test_is_valid_subrip(self):
+        self.assertTrue(is_valid_subrip('1\n00:00:01,000 --> 00:00:02,000\nHello\n\n'
+                                        '2\r\n00:00:03,000 --> 00:00:04,000 X1:10\r\nWorld\r\n'))
+
+    def test_is_valid_subrip_invalid_timestamps(self):
+        self.assertFalse(is_valid_subrip('1\n00:00:01 --> 00:00:02,000\nHello\n'))
+
+    def test_is_valid_subrip_non_numeric_timestamps(self):
+        self.assertFalse(is_valid_subrip('1\n00:00:aa,000 --> 00:00:02,000\nHello\n'))
+
+    def test_is_valid_subrip_invalid_block(self):
+        self.assertFalse(is_valid_subrip('1\n00:00:01,000 --> 00:00:02,000\nHello\n\nWorld\n'))
+
+    def test_is_valid_subrip_tolerance(self):
+        block = '1\n00:00:01,000 --> 00:00:02,000\nHello\n\n'
+        self.assertTrue(is_valid_subrip(block * 20 + 'World\n'))
+        self.assertFalse(is_valid_subrip(block * 19 + 'World\n'))
+
+
+class FakeSubtitle(Subtitle):
+    """Subtitle without matches, recording the threads they are computed in"""
+    threads = set()
+
+    def __init__(self, language, provider_name):
+        super(FakeSubtitle, self).__init__(language)
+        self.provider_name = provider_name
+
+    def compute_matches(self, video):
+        self.threads.add(threading.current_thread())
+        return set()
+
+
+class InFlightCounter(object):
+    """Counter of the calls in flight recording their maximum, also counting them in its `parent` if any"""
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.lock = threading.Lock()
+        self.count = 0
+        self.max = 0
+
+    def __enter__(self):
+        if self.parent is not None:
+            self.parent.__enter__()
+        with self.lock:
+            self.count += 1
+            self.max = max(self.max, self.count)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.count -= 1
+        if self.parent is not None:
+            self.parent.__exit__(*args)
+
+
+class FakeProvider(Provider):
+    """Provider answering after a `delay` with a subtitle per language, or raising its `error` the first `failures`
+    times, always if negative. Also raised when kept alive and the first `initialization_failures` initializations.
+    Calls are counted by its `in_flight` counter"""
+    languages = {Language('eng'), Language('fra')}
+    name = None
+    in_flight = None
+    delay = 0
+    error = None
+    failures = -1
+    initializations = 0
+    initialization_failures = 0
+    keep_alives = 0
+    content = b'1\n00:00:01,000 --> 00:00:02,000\nHello\n'
+
+    def initialize(self):
+        self.__class__.initializations += 1
+        if self.initializations <= self.initialization_failures:
+            raise self.error
+
+    def list_subtitles(self, video, languages):
+        with self.in_flight:
+            time.sleep(self.delay)
+        if self.error is not None and self.failures != 0:
+            self.__class__.failures -= 1
+            raise self.error
+        return [FakeSubtitle(l, self.name) for l in sorted(languages)]
+
+    def download_subtitle(self, subtitle):
+        with self.in_flight:
+            time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        subtitle.content = self.content
+
+    def keep_alive(self):
+        if self.error is not None:
+            raise self.error
+        self.__class__.keep_alives += 1
+
+
+class FakeProvidersTestCase(TestCase):
+    providers = {'fake1': {'delay': 0.2}, 'fake2': {'delay': 0.2}, 'timeout': {'error': socket.timeout()},
+                 'slow': {'delay': 0.1, 'max_in_flight': 2}, 'invalid': {'content': b'Hello'},
+                 'limited': {'error': DownloadLimitExceeded()}, 'flaky': {'failures': 1, 'error': socket.timeout()},
+                 'alive': {'keep_alive_interval': 0.05},
+                 'expired': {'keep_alive_interval': 0.05, 'error': socket.timeout()},
+                 'unreachable': {'initialization_failures': 1, 'failures': 0, 'error': socket.timeout()}}
+
+    def setUp(self):
+        self.in_flight = InFlightCounter()
+        for name, attributes in self.providers.items():
+            attributes = dict(attributes, name=name, in_flight=InFlightCounter(self.in_flight))
+            provider_manager[name] = type(str('%sProvider' % name.capitalize()), (FakeProvider,), attributes)
+
+    def tearDown(self):
+        for name in self.providers:
+            del provider_manager[name]
+
+
+class ProviderPoolTestCase(FakeProvidersTestCase):
+    def test_list_subtitles_workers(self):
+        with ProviderPool(['fake1', 'fake2', 'timeout'], workers=3, failure_threshold=1, retries=0) as pp:
+            subtitles = pp.list_subtitles(EPISODES[0], {Language('eng')})
+        self.assertGreaterEqual(self.in_flight.max, 2)
+        self.assertEqual(sorted(s.provider_name for s in subtitles), ['fake1', 'fake2'])
+        self.assertEqual(pp.health, {'fake1': 'closed', 'fake2': 'closed', 'timeout': 'open'})
+
+    def test_list_subtitles_order(self):
+        with ProviderPool(['fake1', 'fake2']) as pp:
+            sequential = [s.provider_name for s in pp.list_subtitles(EPISODES[0], {Language('eng')})]
+        with ProviderPool(['fake1', 'fake2'], workers=2) as pp:
+            concurrent = [s.provider_name for s in pp.list_subtitles(EPISODES[0], {Language('eng')})]
+        self.assertEqual(sequential, concurrent)
+
+    def test_acquire_provider_max_in_flight(self):
+        with ProviderPool(['slow'], workers=4) as pp:
+            subtitles = list(imap(lambda v: pp.list_subtitles(v, {Language('eng')}), EPISODES, 4))
+            self.assertEqual(len(pp.initialized_providers['slow']), 2)
+        self.assertEqual(provider_manager['slow'].in_flight.max, 2)
+        self.assertEqual([len(s) for s in subtitles], [1, 1, 1, 1])
+
+    def test_list_subtitles_max_in_flight(self):
+        subtitles = list_subtitles(EPISODES, {Language('eng')}, ['fake1', 'fake2'], workers=8,
+                                   max_in_flight={'fake1': 4, 'fake2': 4})
+        self.assertEqual(provider_manager['fake1'].in_flight.max, 4)
+        self.assertEqual(provider_manager['fake2'].in_flight.max, 4)
+        self.assertEqual({v: len(s) for v, s in subtitles.items()}, {v: 2 for v in EPISODES})
+
+    def test_download_ranked_subtitles(self):
+        subtitles = [FakeSubtitle(Language('eng'), 'invalid'), FakeSubtitle(Language('eng'), 'fake1'),
+                     FakeSubtitle(Language('eng'), 'fake2'), FakeSubtitle(Language('fra'), 'fake2')]
+        with ProviderPool(['invalid', 'fake1', 'fake2']) as pp:
+            downloaded = download_ranked_subtitles(pp, iter([(s, 0) for s in subtitles]),
+                                                   {Language('eng'), Language('fra')}, set(), 2)
+        self.assertGreaterEqual(self.in_flight.max, 2)
+        self.assertEqual(downloaded, [subtitles[1], subtitles[3]])
+        self.assertIsNone(subtitles[2].content)
+
+    def test_download_ranked_subtitles_rounds(self):
+        subtitles = [FakeSubtitle(Language('eng'), 'invalid'), FakeSubtitle(Language('fra'), 'fake1'),
+                     FakeSubtitle(Language('eng'), 'invalid'), FakeSubtitle(Language('eng'), 'fake2'),
+                     FakeSubtitle(Language('eng'), 'fake1')]
+        with ProviderPool(['invalid', 'fake1', 'fake2']) as pp:
+            downloaded = download_ranked_subtitles(pp, iter([(s, 0) for s in subtitles]),
+                                                   {Language('eng'), Language('fra')}, set(), 1)
+        self.assertEqual(downloaded, [subtitles[1], subtitles[3]])
+        self.assertIsNone(subtitles[4].content)
+
+    def test_download_ranked_subtitles_daily_quota(self):
+        subtitles = [FakeSubtitle(Language('eng'), 'fake2') for _ in range(3)]
+        with ProviderPool(['fake2'], provider_configs={'fake2': {'daily_quota': 1}}) as pp:
+            attempts = []
+            download_subtitle = pp.download_subtitle
+            pp.download_subtitle = lambda s: attempts.append(s) or download_subtitle(s)
+            downloaded = download_ranked_subtitles(pp, iter([(s, 0) for s in subtitles]), {Language('eng')}, set(), 3)
+        self.assertEqual(downloaded, subtitles[:1])
+        self.assertEqual(attempts, subtitles[:1])
+
+    def test_download_subtitle_daily_quota(self):
+        with ProviderPool(['fake1'], provider_configs={'fake1': {'daily_quota': 2}}) as pp:
+            results = [pp.download_subtitle(FakeSubtitle(Language('eng'), 'fake1')) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(pp.health, {'fake1': 'closed'})
+
+    def test_download_subtitle_daily_quota_refund(self):
+        with ProviderPool(['timeout', 'invalid'], provider_configs={'timeout': {'daily_quota': 2},
+                                                                    'invalid': {'daily_quota': 2}}, retries=0) as pp:
+            self.assertFalse(pp.download_subtitle(FakeSubtitle(Language('eng'), 'timeout')))
+            self.assertFalse(pp.download_subtitle(FakeSubtitle(Language('eng'), 'invalid')))
+            self.assertEqual(pp.quotas['timeout'].remaining, 2)
+            self.assertEqual(pp.quotas['invalid'].remaining, 2)
+
+    def test_download_subtitle_daily_quota_half_open(self):
+        with ProviderPool(['fake1'], provider_configs={'fake1': {'daily_quota': 1}}, cooldown=0) as pp:
+            pp.quotas['fake1'].exhaust()
+            pp.circuit_breakers['fake1'].trip()
+            self.assertFalse(pp.download_subtitle(FakeSubtitle(Language('eng'), 'fake1')))
+            self.assertEqual(pp.health, {'fake1': 'open'})
+
+    def test_download_subtitle_download_limit_exceeded(self):
+        with ProviderPool(['limited'], provider_configs={'limited': {'daily_quota': 10}}) as pp:
+            self.assertFalse(pp.download_subtitle(FakeSubtitle(Language('eng'), 'limited')))
+        self.assertEqual(pp.quotas['limited'].remaining, 0)
+        self.assertEqual(pp.get_queries(EPISODES[0], {Language('eng')}), [])
+        self.assertEqual(pp.health, {'limited': 'closed'})
+
+    def test_download_subtitle_download_limit_exceeded_no_quota(self):
+        with ProviderPool(['limited']) as pp:
+            self.assertFalse(pp.download_subtitle(FakeSubtitle(Language('eng'), 'limited')))
+            self.assertEqual(pp.health, {'limited': 'open'})
+            breaker = pp.circuit_breakers['limited']
+            self.assertAlmostEqual(breaker.open_cooldown, get_quota_reset_delay(breaker.opened_at), delta=1)
+
+    def test_rate_limit(self):
+        with ProviderPool(['fake1'], provider_configs={'fake1': {'rate_limit': 20, 'rate_burst': 2}}) as pp:
+            self.assertNotIn('rate_limit', pp.provider_configs['fake1'])
+            rate_limiter = pp.rate_limiters['fake1']
+            rate_limiter.timer = lambda: rate_limiter.timestamp
+            delays = []
+            rate_limiter.sleep = delays.append
+            for _ in range(4):
+                pp.download_subtitle(FakeSubtitle(Language('eng'), 'fake1'))
+        self.assertEqual(delays, [0.05, 0.1])
+
+    def test_list_subtitles_circuit_breaker(self):
+        with ProviderPool(['timeout'], failure_threshold=2, cooldown=0.1, retries=0) as pp:
+            pp.list_subtitles(EPISODES[0], {Language('eng')})
+            self.assertEqual(pp.health, {'timeout': 'closed'})
+            pp.list_subtitles(EPISODES[0], {Language('eng')})
+            self.assertEqual(pp.health, {'timeout': 'open'})
+            self.assertEqual(pp.get_queries(EPISODES[0], {Language('eng')}), [])
+            time.sleep(0.1)
+            self.assertEqual(len(pp.get_queries(EPISODES[0], {Language('eng')})), 1)
+            self.assertEqual(pp.health, {'timeout': 'half-open'})
+
+    def test_list_subtitles_retry(self):
+        retry_delay, circuit.RETRY_DELAY = circuit.RETRY_DELAY, 0
+        try:
+            with ProviderPool(['flaky'], failure_threshold=1, retries=1) as pp:
+                self.assertEqual(len(pp.list_subtitles(EPISODES[0], {Language('eng')})), 1)
+                self.assertEqual(pp.health, {'flaky': 'closed'})
+        finally:
+            circuit.RETRY_DELAY = retry_delay
+
+    def test_keep_alive(self):
+        with ProviderPool(['alive', 'expired'], retries=0) as pp:
+            pp.list_subtitles(EPISODES[0], {Language('eng')})
+            pp.keep_alive()
+            self.assertEqual(provider_manager['alive'].keep_alives, 0)
+            time.sleep(0.1)
+            pp.keep_alive()
+            self.assertEqual(provider_manager['alive'].keep_alives, 1)
+            self.assertEqual(len(pp.idle_providers['alive']), 1)
+            self.assertEqual(pp.initialized_providers['expired'], [])
+            self.assertEqual(pp.idle_providers['expired'], [])
+
+    def test_keep_alive_thread(self):
+        with ProviderPool(['alive'], keep_alive=True) as pp:
+            pp.list_subtitles(EPISODES[0], {Language('eng')})
+            time.sleep(0.3)
+        self.assertGreaterEqual(provider_manager['alive'].keep_alives, 2)
+        self.assertIsNone(pp.keep_alive_thread)
+
+    def test_watch_best_subtitles(self):
+        os.mkdir(TEST_DIR)
+        paths = [os.path.join(os.path.abspath(TEST_DIR), os.path.split(v.name)[1]) for v in EPISODES[:2]]
+        for path in paths:
+            open(path, 'w').close()
+        watch_videos, watch.watch_videos = watch.watch_videos, lambda paths_, delay: iter([[p] for p in paths])
+        try:
+            with ScanIndex(os.path.join(TEST_DIR, 'index.db')) as index:
+                watcher = watch_best_subtitles([os.path.abspath(TEST_DIR)], {Language('eng')}, ['fake1'], index=index)
+                subtitles = list(watcher)
+                self.assertIsNotNone(index.get_video(paths[0], os.stat(paths[0])))
+        finally:
+            watch.watch_videos = watch_videos
+            shutil.rmtree(TEST_DIR)
+        self.assertEqual([len(s) for s in subtitles], [1, 1])
+        self.assertEqual(provider_manager['fake1'].initializations, 1)
+
+    def test_api_pool(self):
+        with ProviderPool(['fake1']) as pp:
+            subtitles = list_subtitles(EPISODES[:1], {Language('eng')}, pool=pp)
+            provider = pp.initialized_providers['fake1'][0]
+            download_subtitles(subtitles[EPISODES[0]], pool=pp)
+            self.assertEqual(pp.initialized_providers['fake1'], [provider])
+        self.assertTrue(subtitles[EPISODES[0]][0].is_valid)
+
+
+class RateLimitTestCase(TestCase):
+    def setUp(self):
+        self.now = 0
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(2, 2, timer=lambda: self.now)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0, 0, 0.5, 1])
+        self.now = 2
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0.5])
+
+    def test_daily_quota(self):
+        quota = DailyQuota('fake', 2, timer=lambda: self.now)
+        self.assertEqual([quota.consume() for _ in range(3)], [True, True, False])
+        self.now = 86400
+        self.assertEqual(quota.remaining, 2)
+
+    def test_quota_reset_delay(self):
+        self.assertEqual(get_quota_reset_delay(0), 86400)
+        self.assertEqual(get_quota_reset_delay(86400 * 3 + 3600), 82800)
+
+    def test_daily_quota_refund(self):
+        quota = DailyQuota('fake', 1, timer=lambda: self.now)
+        self.assertTrue(quota.consume())
+        quota.refund()
+        self.assertEqual(quota.remaining, 1)
+
+    def test_daily_quota_region(self):
+        region = make_region().configure('dogpile.cache.memory')
+        self.assertTrue(DailyQuota('fake', 2, region, timer=lambda: self.now).consume())
+        quota = DailyQuota('fake', 2, region, timer=lambda: self.now)
+        self.assertEqual(quota.remaining, 1)
+        quota.exhaust()
+        self.assertFalse(DailyQuota('fake', 2, region, timer=lambda: self.now).consume())
+
+
+class CircuitBreakerTestCase(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker('fake', failure_threshold=2, cooldown=10, timer=lambda: self.now)
+
+    def test_open(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_success(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.assertTrue(self.breaker.allow())
+
+    def test_trip(self):
+        self.breaker.trip(20)
+        self.assertEqual(self.breaker.state, 'open')
+        self.now = 10
+        self.assertFalse(self.breaker.allow())
+        self.now = 20
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.now = 30
+        self.assertTrue(self.breaker.allow())
+
+    def test_trip_late_failure(self):
+        self.breaker.trip(20)
+        self.now = 1
+        self.breaker.record_failure()
+        self.now = 15
+        self.assertFalse(self.breaker.allow())
+        self.now = 20
+        self.assertTrue(self.breaker.allow())
+
+    def test_half_open_late_result(self):
+        ticket = self.breaker.allow()
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+        probe = self.breaker.allow()
+        self.breaker.record_success(ticket)
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.record_failure(ticket)
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.breaker.record_success(probe)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_half_open_failure(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.now = 15
+        self.assertFalse(self.breaker.allow())
+        self.now = 20
+        self.assertTrue(self.breaker.allow())
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Handler answering with the User-Agent and Accept-Encoding headers of the request, counting connections"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        body = ('%s|%s' % (self.headers.get('User-Agent'), self.headers.get('Accept-Encoding'))).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DropHandler(EchoHandler):
+    """Handler closing the connection without answering"""
+    def do_GET(self):
+        self.close_connection = True
+
+
+class EchoServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    connections = 0
+
+
+class XMLRPCHandler(SimpleXMLRPCRequestHandler):
+    """XML-RPC handler keeping connections alive, counting them"""
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/xml-rpc',)
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+class XMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    connections = 0
+
+
+class TransportTestCase(TestCase):
+    def setUp(self):
+        self.server = EchoServer(('127.0.0.1', 0), EchoHandler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        self.requests = []
+        self.transport = Transport(max_retries=0, hook=lambda *args: self.requests.append(args))
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        for _ in range(2):
+            session = self.transport.create_session()
+            self.assertEqual(session.get(self.url).status_code, 200)
+            session.close()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual([r[:3] for r in self.requests], [('GET', self.url, 200)] * 2)
+
+    def test_headers(self):
+        session = self.transport.create_session({'User-Agent': 'Subliminal'})
+        user_agent, accept_encoding = session.get(self.url).text.split('|')
+        self.assertEqual(user_agent, 'Subliminal')
+        self.assertIn('gzip', accept_encoding)
+
+    def test_hook_error(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+        sock.close()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.transport.create_session().get(url)
+        self.assertEqual([r[:3] for r in self.requests], [('GET', url, None)])
+
+    def test_no_read_retry(self):
+        server = EchoServer(('127.0.0.1', 0), DropHandler)
+        threading.Thread(target=server.serve_forever).start()
+        transport = Transport(max_retries=2)
+        try:
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                transport.create_session().get('http://127.0.0.1:%d/' % server.server_address[1])
+            self.assertEqual(server.connections, 1)
+        finally:
+            transport.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_close_on_pool_terminate(self):
+        session = transport.create_session()
+        self.assertEqual(session.get(self.url).status_code, 200)
+        session.close()
+        self.assertEqual(len(transport.adapter.poolmanager.pools), 1)
+        ProviderPool(['thesubdb']).terminate()
+        self.assertEqual(len(transport.adapter.poolmanager.pools), 0)
+
+    def test_xmlrpc_keep_alive(self):
+        server = XMLRPCServer(('127.0.0.1', 0), XMLRPCHandler)
+        server.register_function(lambda token: {'status': '200 OK', 'token': token}, 'NoOperation')
+        threading.Thread(target=server.serve_forever).start()
+        try:
+            url = 'http://127.0.0.1:%d/xml-rpc' % server.server_address[1]
+            for token in ('a', 'b'):
+                proxy = ServerProxy(url, transport=XMLRPCTransport(self.transport))
+                self.assertEqual(proxy.NoOperation(token), {'status': '200 OK', 'token': token})
+                proxy('close')()
+            self.assertEqual(server.connections, 1)
+            self.assertEqual([r[:3] for r in self.requests], [('POST', url, 200)] * 2)
+        finally:
+            self.transport.close()
+            server.shutdown()
+            server.server_close()
+
+
+class FakeOpenSubtitlesServer(object):
+    """XML-RPC server of OpenSubtitles accepting only the tokens it issued and not logged out, answering the
+    `unauthorized` tokens with a 401"""
+    def __init__(self):
+        self.tokens = []
+        self.unauthorized = []
+        self.logins = 0
+
+    def LogIn(self, *args):
+        self.logins += 1
+        self.tokens.append('token%d' % self.logins)
+        return {'status': '200 OK', 'token': self.tokens[-1]}
+
+    def LogOut(self, token):
+        self.tokens.remove(token)
+        return {'status': '200 OK'}
+
+    def NoOperation(self, token):
+        if token in self.unauthorized:
+            return {'status': '401 Unauthorized'}
+        return {'status': '200 OK' if token in self.tokens else '406 No session'}
+
+    def close(self):
+        pass
+
+
+class FakeAddic7edHandler(BaseHTTPRequestHandler):
+    """Handler of Addic7ed accepting only the cookies it issued, serving pages with a login link in the navigation bar
+    and anonymous sessions such a page instead of the subtitle"""
+    def do_POST(self):
+        self.server.logins += 1
+        self.server.cookies.append('wikisubtitlesuser=%d' % self.server.logins)
+        self.send_response(302)
+        self.send_header('Location', '/')
+        self.send_header('Set-Cookie', self.server.cookies[-1] + '; path=/')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.startswith('/original/') and self.headers.get('Cookie') in self.server.cookies:
+            content_type, body = 'text/srt', b'1\n00:00:01,000 --> 00:00:02,000\nHello\n'
+        else:
+            content_type, body = 'text/html', b'<a href="login.php">Login</a>'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeAddic7edServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self.cookies = []
+        self.logins = 0
+
+
+class SessionStoreTestCase(TestCase):
+    def setUp(self):
+        os.mkdir(TEST_DIR)
+        self.path = os.path.join(TEST_DIR, 'sessions.json')
+        self.now = 0
+        self.store = SessionStore(self.path, timer=lambda: self.now)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_DIR)
+
+    def test_session_store(self):
+        self.store.set('fake', {'token': 'abc'}, 10)
+        self.assertEqual(SessionStore(self.path, timer=lambda: self.now).get('fake'), {'token': 'abc'})
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.now = 10
+        self.assertIsNone(self.store.get('fake'))
+
+    def test_session_store_delete(self):
+        self.store.set('fake1', {'token': 'abc'}, 10)
+        self.store.set('fake2', {'token': 'def'}, 10)
+        self.store.delete('fake1')
+        self.assertIsNone(self.store.get('fake1'))
+        self.assertEqual(self.store.get('fake2'), {'token': 'def'})
+
+    def test_opensubtitles_session(self):
+        server = FakeOpenSubtitlesServer()
+        provider = OpenSubtitlesProvider(session_store=self.store)
+        provider.server = server
+        provider.initialize()
+        provider.no_operation()
+        provider.terminate()
+        provider = OpenSubtitlesProvider(session_store=self.store)
+        provider.server = server
+        provider.initialize()
+        self.assertEqual((provider.token, server.logins), ('token1', 1))
+        server.tokens.remove('token1')
+        provider.no_operation()
+        self.assertEqual((provider.token, server.logins), ('token2', 2))
+        self.assertEqual(self.store.get('opensubtitles'), {'token': 'token2'})
+
+    def test_opensubtitles_session_unauthorized(self):
+        server = FakeOpenSubtitlesServer()
+        server.unauthorized.append('stale')
+        self.store.set('opensubtitles', {'token': 'stale'}, 10)
+        provider = OpenSubtitlesProvider(session_store=self.store)
+        provider.server = server
+        provider.initialize()
+        provider.no_operation()
+        self.assertEqual((provider.token, server.logins), ('token1', 1))
+        self.assertEqual(self.store.get('opensubtitles'), {'token': 'token1'})
+        server.unauthorized.append('token1')
+        with self.assertRaises(Unauthorized):
+            provider.no_operation()
+        self.assertEqual(server.logins, 1)
+
+    def test_addic7ed_session(self):
+        server = FakeAddic7edServer(('127.0.0.1', 0), FakeAddic7edHandler)
+        threading.Thread(target=server.serve_forever).start()
+        try:
+            subtitle = Subtitle(Language('eng'), page_link='http://www.addic7ed.com/serie/Dallas/1/3/1')
+            subtitle.download_link = '/original/1/0'
+            for _ in range(2):
+                provider = provider_manager['addic7ed']('user', 'pass', session_store=self.store)
+                provider.server = 'http://127.0.0.1:%d' % server.server_address[1]
+                provider.initialize()
+                provider.download_subtitle(subtitle)
+                provider.terminate()
+            self.assertEqual((server.logins, subtitle.content[:1]), (1, b'1'))
+            server.cookies.remove('wikisubtitlesuser=1')
+            subtitle.content = None
+            provider.download_subtitle(subtitle)
+            self.assertEqual((server.logins, subtitle.content[:1]), (2, b'1'))
+            self.assertEqual(self.store.get('addic7ed:user'), {'cookies': {'wikisubtitlesuser': '2'}})
+            provider.get('/shows.php')
+            self.assertEqual(server.logins, 2)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+@skipIf(list_subtitles_async is None, 'asyncio API requires Python 3.5')
+class AsyncTestCase(FakeProvidersTestCase):
+    def setUp(self):
+        super(AsyncTestCase, self).setUp()
+        import asyncio
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        super(AsyncTestCase, self).tearDown()
+
+    def test_list_subtitles_async(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(8) as executor:
+            subtitles = self.loop.run_until_complete(list_subtitles_async(EPISODES, {Language('eng')},
+                                                                          ['fake1', 'fake2'],
+                                                                          max_in_flight={'fake1': 4, 'fake2': 4},
+                                                                          executor=executor))
+        self.assertEqual(provider_manager['fake1'].in_flight.max, 4)
+        self.assertEqual(provider_manager['fake2'].in_flight.max, 4)
+        self.assertEqual({v: sorted(s.provider_name for s in subtitles[v]) for v in EPISODES},
+                         {v: ['fake1', 'fake2'] for v in EPISODES})
+
+    def test_list_subtitles_async_initialization_retry(self):
+        from subliminal.aio import AsyncProviderPool
+        retry_delay, circuit.RETRY_DELAY = circuit.RETRY_DELAY, 0
+        try:
+            pool = AsyncProviderPool(['unreachable'], failure_threshold=1, retries=1)
+            subtitles = self.loop.run_until_complete(list_subtitles_async(EPISODES[:1], {Language('eng')},
+                                                                          pool=pool))
+            self.assertEqual(len(subtitles[EPISODES[0]]), 1)
+            self.assertEqual(pool.health, {'unreachable': 'closed'})
+            self.loop.run_until_complete(pool.terminate_async())
+        finally:
+            circuit.RETRY_DELAY = retry_delay
+
+    def test_download_best_subtitles_async(self):
+        FakeSubtitle.threads.clear()
+        subtitles = self.loop.run_until_complete(download_best_subtitles_async(EPISODES[:1], {Language('eng')},
+                                                                               ['fake1', 'fake2']))
+        self.assertEqual(len(subtitles[EPISODES[0]]), 1)
+        self.assertTrue(subtitles[EPISODES[0]][0].is_valid)
+        self.assertTrue(FakeSubtitle.threads)
+        self.assertNotIn(threading.current_thread(), FakeSubtitle.threads)
+
+
+class WatchTestCase(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.debouncer = Debouncer(10, timer=lambda: self.now)
+
+    def test_debouncer_release(self):
+        self.debouncer.touch('a.mkv')
+        self.now = 5
+        self.debouncer.touch('b.mkv')
+        self.assertEqual(self.debouncer.timeout, 5)
+        self.now = 10
+        self.assertEqual(self.debouncer.release(), ['a.mkv'])
+        self.assertEqual(self.debouncer.release(), [])
+        self.now = 15
+        self.assertEqual(self.debouncer.release(), ['b.mkv'])
+        self.assertIsNone(self.debouncer.timeout)
+
+    def test_debouncer_touch(self):
+        self.debouncer.touch('a.mkv')
+        self.debouncer.touch('b.mkv')
+        self.now = 8
+        self.debouncer.touch('a.mkv')
+        self.now = 12
+        self.assertEqual(self.debouncer.release(), ['b.mkv'])
+        self.now = 18
+        self.assertEqual(self.debouncer.release(), ['a.mkv'])
+
+    def test_debouncer_discard(self):
+        self.debouncer.touch('a.mkv')
+        self.debouncer.discard('a.mkv')
+        self.now = 10
+        self.assertEqual(self.debouncer.release(), [])
+
 
 def suite():
     suite = TestSuite()
     suite.addTest(TestLoader().loadTestsFromTestCase(ApiTestCase))
     suite.addTest(TestLoader().loadTestsFromTestCase(VideoTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(ProbeTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(GuessCacheTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(ScoreTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(SubtitleTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(ProviderPoolTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(AsyncTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(RateLimitTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(CircuitBreakerTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(TransportTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(SessionStoreTestCase))
+    suite.addTest(TestLoader().loadTestsFromTestCase(WatchTestCase))
     return suite
 
 
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+import threading
+import time
+import requests
+import requests.adapters
+from requests.packages.urllib3.util.retry import Retry
+from .compat import ProtocolError, Transport as BaseXMLRPCTransport
+
+
+logger = logging.getLogger(__name__)
+
+#: Default timeout in seconds of requests
+TIMEOUT = 10
+
+#: Default number of connections kept alive per host, enough for the concurrent requests of any provider
+POOL_SIZE = 10
+
+#: Default number of hosts to keep connections alive for
+POOL_HOSTS = 10
+
+#: Default number of retries of requests failing to connect, see :class:`Transport`
+MAX_RETRIES = 2
+
+
+class Session(requests.Session):
+    """A :class:`requests.Session` sharing the connection pools of its :class:`Transport`
+
+    Requests use the timeout of the transport unless given one and are reported to it. Headers and cookies are
+    specific to the session. Closing the session leaves the shared connections alive for the other sessions
+
+    :param transport: the transport
+    :type transport: :class:`Transport`
+
+    """
+    def __init__(self, transport):
+        super(Session, self).__init__()
+        self.transport = transport
+        self.mount('http://', transport.adapter)
+        self.mount('https://', transport.adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.transport.timeout)
+        status_code = None
+        start = time.time()
+        try:
+            response = super(Session, self).request(method, url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            self.transport.report(method, url, status_code, time.time() - start)
+
+    def close(self):
+        pass
+
+
+class Transport(object):
+    """HTTP transport shared by the providers
+
+    Sessions created with :meth:`create_session` share a connection pool per host, so connections are kept alive
+    across providers instances and TCP/TLS setup is paid once per host rather than once per instance. Responses are
+    gzip-compressed when the server supports it
+
+    The transport only retries requests failing to connect, which never reached the server. Requests that may have
+    reached it, e.g. on a read timeout, are retried by :meth:`~subliminal.providers.ProviderPool.call_provider` with a
+    jittered delay and accounted for in the circuit breaker of the provider
+
+    The `pool_size` is the same for every host, it is not derived from the
+    :attr:`~subliminal.providers.Provider.max_in_flight` of each provider. The default is enough for the largest of
+    them, :meth:`configure` a larger size when raising it so concurrent requests do not open connections that are
+    closed after use. Connections are kept alive until :meth:`close`, which a
+    :class:`~subliminal.providers.ProviderPool` calls when it terminates
+
+    :param int pool_size: number of connections kept alive per host, connections in excess are closed after use
+    :param int pool_hosts: number of hosts to keep connections alive for
+    :param int max_retries: number of retries of requests failing to connect
+    :param float timeout: timeout in seconds of requests
+    :param hook: function called after each request with its method, URL, status code or `None` on error and
+        duration in seconds
+    :type hook: callable or None
+
+    """
+    def __init__(self, pool_size=POOL_SIZE, pool_hosts=POOL_HOSTS, max_retries=MAX_RETRIES, timeout=TIMEOUT,
+                 hook=None):
+        self.adapter = None
+        self.lock = threading.Lock()
+        self.configure(pool_size, pool_hosts, max_retries, timeout, hook)
+
+    def configure(self, pool_size=POOL_SIZE, pool_hosts=POOL_HOSTS, max_retries=MAX_RETRIES, timeout=TIMEOUT,
+                  hook=None):
+        """Configure the transport, closing the current connections
+
+        Sessions created before keep their connection pools, create new ones to use the configuration.
+        See :class:`Transport` for the parameters
+
+        """
+        with self.lock:
+            adapter = self.adapter
+            self.pool_size = pool_size
+            self.pool_hosts = pool_hosts
+            self.max_retries = max_retries
+            self.timeout = timeout
+            self.hook = hook
+            self.adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size,
+                                                         max_retries=Retry(total=max_retries, read=False))
+        if adapter is not None:
+            adapter.close()
+
+    def create_session(self, headers=None):
+        """Create a :class:`Session` using the shared connections
+
+        :param headers: headers to send with each request in addition to the default ones
+        :type headers: dict or None
+        :return: the session
+        :rtype: :class:`Session`
+
+        """
+        session = Session(self)
+        session.headers.update(headers or {})
+        return session
+
+    def report(self, method, url, status_code, elapsed):
+        """Report a request to the hook, if any
+
+        :param string method: method of the request
+        :param string url: URL of the request
+        :param status_code: status code of the response, `None` if the request failed
+        :type status_code: int or None
+        :param float elapsed: duration of the request in seconds
+
+        """
+        logger.debug('%s %s: %s in %.3fs', method, url, status_code, elapsed)
+        if self.hook is not None:
+            self.hook(method, url, status_code, elapsed)
+
+    def close(self):
+        """Close the connections kept alive, later requests open new ones"""
+        self.adapter.close()
+
+    def __repr__(self):
+        return '<%s [%d per host, %d hosts]>' % (self.__class__.__name__, self.pool_size, self.pool_hosts)
+
+
+class XMLRPCTransport(BaseXMLRPCTransport, object):
+    """XML-RPC transport for :class:`xmlrpclib.ServerProxy` making its requests with a :class:`Session` of a
+    :class:`Transport`
+
+    Unlike the default XML-RPC transport that holds a single connection, connections are kept alive in the shared
+    pools so concurrent calls reuse them. Calls have the timeout of the transport, are reported to it and responses
+    are gzip-compressed when the server supports it
+
+    :param transport: the transport
+    :type transport: :class:`Transport`
+    :param string scheme: scheme of the server URL, ``http`` or ``https``
+
+    """
+    def __init__(self, transport, scheme='http'):
+        BaseXMLRPCTransport.__init__(self)
+        self.session = transport.create_session({'Content-Type': 'text/xml', 'User-Agent': self.user_agent})
+        self.scheme = scheme
+
+    def request(self, host, handler, request_body, verbose=False):
+        r = self.session.post('%s://%s%s' % (self.scheme, host, handler), data=request_body)
+        if r.status_code != 200:
+            raise ProtocolError(host + handler, r.status_code, r.reason, r.headers)
+        parser, unmarshaller = self.getparser()
+        parser.feed(r.content)
+        parser.close()
+        return unmarshaller.close()
+
+    def close(self):
+        self.session.close()
+
+
+#: The HTTP transport shared by the providers
+transport = Transport()
@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division
+import bisect
+import collections
 import datetime
 import hashlib
 import logging
+import multiprocessing
+import multiprocessing.pool
 import os
 import struct
 import babelfish
-import enzyme
-import guessit
+from .compat import DirEntry, scandir
+from .exceptions import ProbeError
+from .guess import guess_episode_info, guess_file_info, guess_movie_info
+from .probe import DEFAULT_BUDGET, probe, probe_enzyme
 
 
 logger = logging.getLogger(__name__)
@@ -24,6 +30,9 @@ VIDEO_EXTENSIONS = ('.3g2', '.3gp', '.3gp2', '.3gpp', '.60d', '.ajp', '.asf', '.
 #: Subtitle extensions
 SUBTITLE_EXTENSIONS = ('.srt', '.sub', '.smi', '.txt', '.ssa', '.ass', '.mpl')
 
+#: Alpha2 codes recognized as language extensions of subtitles
+ALPHA2_CODES = frozenset(babelfish.language_converters['alpha2'].codes)
+
 
 class Video(object):
     """Base class for videos
@@ -69,7 +78,7 @@ class Video(object):
 
     @classmethod
     def fromname(cls, name):
-        return cls.fromguess(os.path.split(name)[1], guessit.guess_file_info(name))
+        return cls.fromguess(os.path.split(name)[1], guess_file_info(name))
 
     def __repr__(self):
         return '<%s [%r]>' % (self.__class__.__name__, self.name)
@@ -119,7 +128,7 @@ class Episode(Video):
 
     @classmethod
     def fromname(cls, name):
-        return cls.fromguess(os.path.split(name)[1], guessit.guess_episode_info(name))
+        return cls.fromguess(os.path.split(name)[1], guess_episode_info(name))
 
     def __repr__(self):
         if self.year is None:
@@ -158,7 +167,7 @@ class Movie(Video):
 
     @classmethod
     def fromname(cls, name):
-        return cls.fromguess(os.path.split(name)[1], guessit.guess_movie_info(name))
+        return cls.fromguess(os.path.split(name)[1], guess_movie_info(name))
 
     def __repr__(self):
         if self.year is None:
@@ -166,33 +175,71 @@ class Movie(Video):
         return '<%s [%r, %d]>' % (self.__class__.__name__, self.title, self.year)
 
 
-def scan_subtitle_languages(path):
+def index_subtitles(filenames):
+    """Index subtitles with their language from the `filenames` of a directory
+
+    Subtitles with an alpha2 extension get the corresponding language, others are undetermined.
+    The index is sorted by filename so :func:`scan_subtitle_languages` can find the subtitles
+    of a video without going through all of them.
+
+    :param list filenames: names of the files in the directory
+    :return: the subtitle index
+    :rtype: list of (filename, :class:`babelfish.Language`) tuples
+
+    """
+    subtitle_index = []
+    for filename in filenames:
+        if isinstance(filename, bytes) or not filename.endswith(SUBTITLE_EXTENSIONS):
+            continue
+        root = os.path.splitext(filename)[0]
+        if root[-3:-2] == '.' and root[-2:] in ALPHA2_CODES:
+            subtitle_index.append((filename, babelfish.Language.fromalpha2(root[-2:])))
+        else:
+            subtitle_index.append((filename, babelfish.Language('und')))
+    subtitle_index.sort(key=lambda s: s[0])
+    return subtitle_index
+
+
+def scan_subtitle_languages(path, subtitle_index=None):
     """Search for subtitles with alpha2 extension from a video `path` and return their language
 
     :param string path: path to the video
+    :param subtitle_index: index of the subtitles in the directory of the video, if already built
+        with :func:`index_subtitles`
+    :type subtitle_index: list or None
     :return: found subtitle languages
     :rtype: set
 
     """
-    language_extensions = tuple('.' + c for c in babelfish.language_converters['alpha2'].codes)
     dirpath, filename = os.path.split(path)
+    if subtitle_index is None:
+        subtitle_index = index_subtitles(os.listdir(dirpath))
+    prefix = os.path.splitext(filename)[0]
     subtitles = set()
-    for p in os.listdir(dirpath):
-        if not isinstance(p, bytes) and p.startswith(os.path.splitext(filename)[0]) and p.endswith(SUBTITLE_EXTENSIONS):
-            if os.path.splitext(p)[0].endswith(language_extensions):
-                subtitles.add(babelfish.Language.fromalpha2(os.path.splitext(p)[0][-2:]))
-            else:
-                subtitles.add(babelfish.Language('und'))
+    for subtitle_filename, language in subtitle_index[bisect.bisect_left(subtitle_index, (prefix,)):]:
+        if not subtitle_filename.startswith(prefix):
+            break
+        subtitles.add(language)
     logger.debug('Found subtitles %r', subtitles)
     return subtitles
 
 
-def scan_video(path, subtitles=True, embedded_subtitles=True):
+def scan_video(path, subtitles=True, embedded_subtitles=True, hash_functions=None, size=None,
+               probe_budget=DEFAULT_BUDGET):
     """Scan a video and its subtitle languages from a video `path`
 
+    Metadata are probed from the headers of the video with :func:`~subliminal.probe.probe`. Matroska videos fall
+    back on a full parse by :mod:`enzyme` when the headers cannot be probed within `probe_budget`.
+
     :param string path: absolute path to the video
     :param bool subtitles: scan for subtitles with the same name
     :param bool embedded_subtitles: scan for embedded subtitles
+    :param hash_functions: functions to compute the hashes with by hash name, if not all
+        :data:`HASH_FUNCTIONS`, see :func:`compute_hashes`
+    :type hash_functions: dict or None
+    :param size: size of the video in bytes, if already known
+    :type size: int or None
+    :param int probe_budget: maximum number of bytes to read to probe the metadata
     :return: the scanned video
     :rtype: :class:`Video`
     :raise: ValueError if cannot guess enough information from the path
@@ -200,88 +247,118 @@ def scan_video(path, subtitles=True, embedded_subtitles=True):
     """
     dirpath, filename = os.path.split(path)
     logger.info('Scanning video %r in %r', filename, dirpath)
-    video = Video.fromguess(path, guessit.guess_file_info(path))
-    video.size = os.path.getsize(path)
+    video = Video.fromguess(path, guess_file_info(path))
+    video.size = size if size is not None else os.path.getsize(path)
     if video.size > 10485760:
         logger.debug('Size is %d', video.size)
-        video.hashes['opensubtitles'] = hash_opensubtitles(path)
-        video.hashes['thesubdb'] = hash_thesubdb(path)
+        video.hashes = compute_hashes(path, hash_functions, video.size)
         logger.debug('Computed hashes %r', video.hashes)
     else:
         logger.warning('Size is lower than 10MB: hashes not computed')
     if subtitles:
         video.subtitle_languages |= scan_subtitle_languages(path)
-    # enzyme
+    # metadata
     try:
-        if filename.endswith('.mkv'):
-            with open(path, 'rb') as f:
-                mkv = enzyme.MKV(f)
-            if mkv.video_tracks:
-                video_track = mkv.video_tracks[0]
-                # resolution
-                if video_track.height in (480, 720, 1080):
-                    if video_track.interlaced:
-                        video.resolution = '%di' % video_track.height
-                        logger.debug('Found resolution %s with enzyme', video.resolution)
-                    else:
-                        video.resolution = '%dp' % video_track.height
-                        logger.debug('Found resolution %s with enzyme', video.resolution)
-                # video codec
-                if video_track.codec_id == 'V_MPEG4/ISO/AVC':
-                    video.video_codec = 'h264'
-                    logger.debug('Found video_codec %s with enzyme', video.video_codec)
-                elif video_track.codec_id == 'V_MPEG4/ISO/SP':
-                    video.video_codec = 'DivX'
-                    logger.debug('Found video_codec %s with enzyme', video.video_codec)
-                elif video_track.codec_id == 'V_MPEG4/ISO/ASP':
-                    video.video_codec = 'XviD'
-                    logger.debug('Found video_codec %s with enzyme', video.video_codec)
-            else:
-                logger.warning('MKV has no video track')
-            if mkv.audio_tracks:
-                audio_track = mkv.audio_tracks[0]
-                # audio codec
-                if audio_track.codec_id == 'A_AC3':
-                    video.audio_codec = 'AC3'
-                    logger.debug('Found audio_codec %s with enzyme', video.audio_codec)
-                elif audio_track.codec_id == 'A_DTS':
-                    video.audio_codec = 'DTS'
-                    logger.debug('Found audio_codec %s with enzyme', video.audio_codec)
-                elif audio_track.codec_id == 'A_AAC':
-                    video.audio_codec = 'AAC'
-                    logger.debug('Found audio_codec %s with enzyme', video.audio_codec)
-            else:
-                logger.warning('MKV has no audio track')
-            if mkv.subtitle_tracks:
-                # embedded subtitles
-                if embedded_subtitles:
-                    embedded_subtitle_languages = set()
-                    for st in mkv.subtitle_tracks:
-                        if st.language:
-                            try:
-                                embedded_subtitle_languages.add(babelfish.Language.fromalpha3b(st.language))
-                            except babelfish.Error:
-                                logger.error('Embedded subtitle track language %r is not a valid language', st.language)
-                                embedded_subtitle_languages.add(babelfish.Language('und'))
-                        elif st.name:
-                            try:
-                                embedded_subtitle_languages.add(babelfish.Language.fromname(st.name))
-                            except babelfish.Error:
-                                logger.debug('Embedded subtitle track name %r is not a valid language', st.name)
-                                embedded_subtitle_languages.add(babelfish.Language('und'))
-                        else:
-                            embedded_subtitle_languages.add(babelfish.Language('und'))
-                    logger.debug('Found embedded subtitle %r with enzyme', embedded_subtitle_languages)
-                    video.subtitle_languages |= embedded_subtitle_languages
+        tracks = probe(path, probe_budget)
+    except ProbeError as e:
+        logger.debug('Probing video metadata failed: %s', e)
+        if not filename.endswith('.mkv'):
+            return video
+        try:
+            tracks = probe_enzyme(path)
+        except ProbeError:
+            logger.exception('Parsing video metadata with enzyme failed')
+            return video
+    video_tracks = [t for t in tracks if t.type == 'video']
+    if video_tracks:
+        video_track = video_tracks[0]
+        # resolution
+        if video_track.height in (480, 720, 1080):
+            if video_track.interlaced:
+                video.resolution = '%di' % video_track.height
             else:
-                logger.debug('MKV has no subtitle track')
-    except enzyme.Error:
-        logger.exception('Parsing video metadata with enzyme failed')
+                video.resolution = '%dp' % video_track.height
+            logger.debug('Found resolution %s', video.resolution)
+        # video codec
+        if video_track.codec is not None:
+            video.video_codec = video_track.codec
+            logger.debug('Found video_codec %s', video.video_codec)
+    else:
+        logger.warning('Video has no video track')
+    audio_tracks = [t for t in tracks if t.type == 'audio']
+    if audio_tracks:
+        # audio codec
+        if audio_tracks[0].codec is not None:
+            video.audio_codec = audio_tracks[0].codec
+            logger.debug('Found audio_codec %s', video.audio_codec)
+    else:
+        logger.warning('Video has no audio track')
+    subtitle_tracks = [t for t in tracks if t.type == 'subtitle']
+    if subtitle_tracks:
+        # embedded subtitles
+        if embedded_subtitles:
+            embedded_subtitle_languages = {t.language or babelfish.Language('und') for t in subtitle_tracks}
+            logger.debug('Found embedded subtitle %r', embedded_subtitle_languages)
+            video.subtitle_languages |= embedded_subtitle_languages
+    else:
+        logger.debug('Video has no subtitle track')
     return video
 
 
-def scan_videos(paths, subtitles=True, embedded_subtitles=True, age=None):
-    """Scan `paths` for videos and their subtitle languages
+def walk(top, follow_symlinks=False, index=None):
+    """Walk the directory tree from `top` with :func:`os.scandir`
+
+    Like :func:`os.walk` but files are yielded as :func:`os.scandir` entries so their type and stat information
+    are cached: :meth:`~os.DirEntry.is_symlink` and :meth:`~os.DirEntry.stat` cost at most one syscall per file.
+    Sub directories can be pruned by removing them from the yielded names in place.
+
+    Following symbolic links to directories can lead to infinite recursion if a link points to one of its parent
+    directories.
+
+    :param string top: path to the directory to walk
+    :param bool follow_symlinks: walk into symbolic links to directories
+    :param index: index to reuse unchanged directory listings with, if any
+    :type index: :class:`~subliminal.index.ScanIndex` or None
+    :return: a generator of (dirpath, dirnames, entries) with entries of the files and symbolic links to files
+    :rtype: generator of tuple of (string, list of string, list of :class:`~os.DirEntry`)
+
+    """
+    try:
+        listing = None
+        if index is not None:
+            stat = os.stat(top)
+            listing = index.get_directory(top, stat)
+        if listing is not None:
+            dirnames, linknames, filenames = listing
+            entries = [DirEntry(top, filename) for filename in filenames]
+        else:
+            dirnames, linknames, entries = [], [], []
+            for entry in scandir(top):
+                # badly encoded names cannot be joined with top
+                if isinstance(entry.name, bytes) or not entry.is_dir():
+                    entries.append(entry)
+                elif entry.is_symlink():
+                    linknames.append(entry.name)
+                else:
+                    dirnames.append(entry.name)
+            if index is not None:
+                index.set_directory(top, stat, dirnames, linknames, [e.name for e in entries])
+    except OSError:
+        logger.exception('Error while listing directory %r', top)
+        return
+    dirnames = dirnames + linknames if follow_symlinks else list(dirnames)
+    yield top, dirnames, entries
+    for dirname in dirnames:
+        for result in walk(os.path.join(top, dirname), follow_symlinks, index):
+            yield result
+
+
+def iter_videos(paths, subtitles=True, embedded_subtitles=True, age=None, workers=None, index=None,
+                hash_functions=None, follow_symlinks=False):
+    """Scan `paths` for videos and their subtitle languages, yielding each video as soon as it is scanned
+
+    Videos are yielded in the order they are found, whether they are scanned sequentially or by `workers`.
+    Directories are walked lazily with :func:`walk` so memory does not grow with the number of videos.
 
     :params paths: absolute paths to scan for videos
     :type paths: list of string
@@ -289,31 +366,110 @@ def scan_videos(paths, subtitles=True, embedded_subtitles=True, age=None):
     :param bool embedded_subtitles: scan for embedded subtitles
     :param age: age of the video, if any
     :type age: datetime.timedelta or None
-    :return: the scanned videos
-    :rtype: list of :class:`Video`
+    :param workers: number of processes to scan videos with, if not sequentially
+    :type workers: int or None
+    :param index: index to skip unchanged videos and directories with, if any
+    :type index: :class:`~subliminal.index.ScanIndex` or None
+    :param hash_functions: functions to compute the hashes with by hash name, if not all
+        :data:`HASH_FUNCTIONS`, see :func:`compute_hashes`
+    :type hash_functions: dict or None
+    :param bool follow_symlinks: scan symbolic links to videos and directories in directories instead of skipping them
+    :return: a generator of the scanned videos
+    :rtype: generator of :class:`Video`
 
     """
-    videos = []
+    if hash_functions is None:
+        hash_functions = HASH_FUNCTIONS
+
+    def complete(filepath, stat, subtitle_index, indexed, video):
+        if indexed:
+            # compute hashes that were not required when the video was indexed
+            missing_hash_functions = {n: f for n, f in hash_functions.items() if n not in video.hashes}
+            if video.size > 10485760 and missing_hash_functions:
+                video.hashes.update(compute_hashes(filepath, missing_hash_functions, video.size))
+                logger.debug('Computed missing hashes %r', video.hashes)
+                index.set_video(filepath, stat, video, embedded_subtitles)
+        elif index is not None:
+            index.set_video(filepath, stat, video, embedded_subtitles)
+        # subtitles are scanned here with the subtitle index of the directory
+        if subtitles:
+            video.subtitle_languages |= scan_subtitle_languages(filepath, subtitle_index)
+        return video
+
+    pool = None
+    # videos being scanned, oldest first, as (filepath, stat, subtitle_index, indexed, video or async result)
+    pending = collections.deque()
+    try:
+        for filepath, stat, subtitle_index in iter_video_paths(paths, subtitles, age, index, follow_symlinks):
+            video = index.get_video(filepath, stat, embedded_subtitles) if index is not None else None
+            if video is not None:
+                pending.append((filepath, stat, subtitle_index, True, video))
+            else:
+                arguments = (filepath, False, embedded_subtitles, hash_functions, stat.st_size)
+                if workers is not None and workers > 1:
+                    if pool is None:
+                        logger.info('Scanning videos with %d workers', workers)
+                        pool = multiprocessing.Pool(workers)
+                    pending.append((filepath, stat, subtitle_index, False,
+                                    pool.apply_async(scan_video_or_skip, (arguments,))))
+                else:
+                    pending.append((filepath, stat, subtitle_index, False, scan_video_or_skip(arguments)))
+            # yield completed videos in order, keeping at most two videos per worker in flight
+            while pending:
+                filepath, stat, subtitle_index, indexed, video = pending[0]
+                if isinstance(video, multiprocessing.pool.AsyncResult):
+                    if len(pending) <= 2 * workers and not video.ready():
+                        break
+                    video = video.get()
+                pending.popleft()
+                if video is not None:
+                    yield complete(filepath, stat, subtitle_index, indexed, video)
+        while pending:
+            filepath, stat, subtitle_index, indexed, video = pending.popleft()
+            if isinstance(video, multiprocessing.pool.AsyncResult):
+                video = video.get()
+            if video is not None:
+                yield complete(filepath, stat, subtitle_index, indexed, video)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def iter_video_paths(paths, subtitles=True, age=None, index=None, follow_symlinks=False):
+    """Find the videos in `paths`, lazily
+
+    Files in `paths` come first, then the videos found in the directories in `paths`. See :func:`iter_videos`
+    for the parameters.
+
+    :return: a generator of video paths with their stat and the subtitle index of their directory, if `subtitles`
+    :rtype: generator of tuple of (string, :class:`os.stat_result`, list or None)
+
+    """
+    subtitle_indexes = {}
     # scan files
     for filepath in [p for p in paths if os.path.isfile(p)]:
+        stat = os.stat(filepath)
         if age is not None:
             try:
-                video_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
+                video_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(stat.st_mtime)
             except ValueError:
                 logger.exception('Error while getting video age, skipping it')
                 continue
             if video_age > age:
                 logger.info('Skipping video %r: older than %r', filepath, age)
                 continue
-        try:
-            videos.append(scan_video(filepath, subtitles, embedded_subtitles))
-        except ValueError as e:
-            logger.error('Skipping video: %s', e)
-            continue
+        subtitle_index = None
+        if subtitles:
+            dirpath = os.path.dirname(filepath)
+            if dirpath not in subtitle_indexes:
+                subtitle_indexes[dirpath] = index_subtitles(os.listdir(dirpath))
+            subtitle_index = subtitle_indexes[dirpath]
+        yield filepath, stat, subtitle_index
     # scan directories
     for path in [p for p in paths if os.path.isdir(p)]:
         logger.info('Scanning directory %r', path)
-        for dirpath, dirnames, filenames in os.walk(path):
+        for dirpath, dirnames, entries in walk(path, follow_symlinks, index):
             # skip badly encoded directories
             if isinstance(dirpath, bytes):
                 logger.error('Skipping badly encoded directory %r', dirpath.decode('utf-8', errors='replace'))
@@ -328,7 +484,9 @@ def scan_videos(paths, subtitles=True, embedded_subtitles=True, age=None):
                     logger.debug('Skipping hidden dirname %r in %r', dirname, dirpath)
                     dirnames.remove(dirname)
             # scan for videos
-            for filename in filenames:
+            subtitle_index = None
+            for entry in entries:
+                filename = entry.name
                 # skip badly encoded files
                 if isinstance(filename, bytes):
                     logger.error('Skipping badly encoded filename %r in %r', filename.decode('utf-8', errors='replace'),
@@ -341,27 +499,86 @@ def scan_videos(paths, subtitles=True, embedded_subtitles=True, age=None):
                 if filename.startswith('.'):
                     logger.debug('Skipping hidden filename %r in %r', filename, dirpath)
                     continue
-                filepath = os.path.join(dirpath, filename)
                 # skip links
-                if os.path.islink(filepath):
+                if not follow_symlinks and entry.is_symlink():
                     logger.debug('Skipping link %r in %r', filename, dirpath)
                     continue
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    logger.exception('Error while getting video stat, skipping it')
+                    continue
                 if age is not None:
                     try:
-                        video_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getmtime(filepath))
+                        video_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(stat.st_mtime)
                     except ValueError:
                         logger.exception('Error while getting video age, skipping it')
                         continue
                     if video_age > age:
                         logger.info('Skipping video %r: older than %r', filepath, age)
                         continue
-                try:
-                    video = scan_video(filepath, subtitles, embedded_subtitles)
-                except ValueError as e:
-                    logger.error('Skipping video: %s', e)
-                    continue
-                videos.append(video)
-    return videos
+                # index subtitles of the directory once for all its videos
+                if subtitles and subtitle_index is None:
+                    subtitle_index = index_subtitles([e.name for e in entries])
+                yield filepath, stat, subtitle_index
+
+
+def scan_videos(paths, subtitles=True, embedded_subtitles=True, age=None, workers=None, index=None,
+                hash_functions=None, follow_symlinks=False):
+    """Scan `paths` for videos and their subtitle languages
+
+    This is :func:`iter_videos` with the scanned videos collected in a list, see it for the parameters
+
+    :return: the scanned videos
+    :rtype: list of :class:`Video`
+
+    """
+    return list(iter_videos(paths, subtitles=subtitles, embedded_subtitles=embedded_subtitles, age=age,
+                            workers=workers, index=index, hash_functions=hash_functions,
+                            follow_symlinks=follow_symlinks))
+
+
+def scan_video_or_skip(arguments):
+    """Call :func:`scan_video` with the `arguments` tuple, returning `None` instead of raising ValueError
+
+    This is the function run by the workers of :func:`iter_videos`
+
+    :param tuple arguments: arguments of :func:`scan_video`
+    :return: the scanned video, if any
+    :rtype: :class:`Video` or None
+
+    """
+    try:
+        return scan_video(*arguments)
+    except ValueError as e:
+        logger.error('Skipping video: %s', e)
+        return None
+
+
+def compute_hashes(video_path, hash_functions=None, filesize=None):
+    """Compute the hashes of a video, reading its first and last 64KiB only once for all the `hash_functions`
+
+    :param string video_path: path of the video
+    :param hash_functions: functions to compute the hashes with by hash name, if not all :data:`HASH_FUNCTIONS`
+    :type hash_functions: dict of hash name => function of (filesize, head, tail)
+    :param filesize: size of the video, if known
+    :type filesize: int or None
+    :return: the hashes by hash name
+    :rtype: dict
+
+    """
+    if hash_functions is None:
+        hash_functions = HASH_FUNCTIONS
+    if not hash_functions:
+        return {}
+    if filesize is None:
+        filesize = os.path.getsize(video_path)
+    with open(video_path, 'rb') as f:
+        head = f.read(65536)
+        f.seek(max(0, filesize - 65536), 0)
+        tail = f.read(65536)
+    return {name: hash_function(filesize, head, tail) for name, hash_function in hash_functions.items()}
 
 
 def hash_opensubtitles(video_path):
@@ -372,40 +589,52 @@ def hash_opensubtitles(video_path):
     :rtype: string
 
     """
-    bytesize = struct.calcsize(b'<q')
-    with open(video_path, 'rb') as f:
-        filesize = os.path.getsize(video_path)
-        filehash = filesize
-        if filesize < 65536 * 2:
-            return None
-        for _ in range(65536 // bytesize):
-            filebuffer = f.read(bytesize)
-            (l_value,) = struct.unpack(b'<q', filebuffer)
-            filehash += l_value
-            filehash = filehash & 0xFFFFFFFFFFFFFFFF  # to remain as 64bit number
-        f.seek(max(0, filesize - 65536), 0)
-        for _ in range(65536 // bytesize):
-            filebuffer = f.read(bytesize)
-            (l_value,) = struct.unpack(b'<q', filebuffer)
-            filehash += l_value
-            filehash = filehash & 0xFFFFFFFFFFFFFFFF
-    returnedhash = '%016x' % filehash
-    return returnedhash
+    return compute_hashes(video_path, {'opensubtitles': hash_opensubtitles_chunks})['opensubtitles']
+
+
+def hash_opensubtitles_chunks(filesize, head, tail):
+    """Compute a hash using OpenSubtitles' algorithm from the first and last 64KiB of the video
+
+    Each chunk is summed as 8192 little-endian 64bit integers with a single :func:`struct.unpack`
+
+    :param int filesize: size of the video
+    :param bytes head: first 64KiB of the video
+    :param bytes tail: last 64KiB of the video
+    :return: the hash
+    :rtype: string
+
+    """
+    if filesize < 65536 * 2:
+        return None
+    filehash = filesize + sum(struct.unpack(b'<8192q', head)) + sum(struct.unpack(b'<8192q', tail))
+    return '%016x' % (filehash & 0xFFFFFFFFFFFFFFFF)  # to remain as 64bit number
 
 
 def hash_thesubdb(video_path):
     """Compute a hash using TheSubDB's algorithm
 
     :param string video_path: path of the video
-    :return: the hash
-    :rtype: string
+    :return: the hash, `None` if the video is smaller than 64KiB
+    :rtype: string or None
+
+    """
+    return compute_hashes(video_path, {'thesubdb': hash_thesubdb_chunks})['thesubdb']
+
+
+def hash_thesubdb_chunks(filesize, head, tail):
+    """Compute a hash using TheSubDB's algorithm from the first and last 64KiB of the video
+
+    :param int filesize: size of the video
+    :param bytes head: first 64KiB of the video
+    :param bytes tail: last 64KiB of the video
+    :return: the hash, `None` if the video is smaller than 64KiB
+    :rtype: string or None
 
     """
-    readsize = 64 * 1024
-    if os.path.getsize(video_path) < readsize:
+    if filesize < 65536:
         return None
-    with open(video_path, 'rb') as f:
-        data = f.read(readsize)
-        f.seek(-readsize, os.SEEK_END)
-        data += f.read(readsize)
-    return hashlib.md5(data).hexdigest()
+    return hashlib.md5(head + tail).hexdigest()
+
+
+#: Functions to compute hashes from the first and last 64KiB of a video by hash name, see :func:`compute_hashes`
+HASH_FUNCTIONS = {'opensubtitles': hash_opensubtitles_chunks, 'thesubdb': hash_thesubdb_chunks}
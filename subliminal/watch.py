@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import collections
+import logging
+import os.path
+import time
+from .api import download_best_subtitles
+from .providers import ProviderPool, provider_manager
+from .video import VIDEO_EXTENSIONS, scan_videos
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+logger = logging.getLogger(__name__)
+
+#: Delay in seconds without any event on a path before it is considered complete
+DEFAULT_DELAY = 10
+
+
+class Debouncer(object):
+    """Hold paths until no event occurred on them for `delay` seconds
+
+    This prevents partially written videos from being scanned while they are still being copied
+
+    :param int delay: delay in seconds
+    :param timer: function returning the current time in seconds
+
+    """
+    def __init__(self, delay=DEFAULT_DELAY, timer=time.time):
+        self.delay = delay
+        self.timer = timer
+
+        #: Pending paths with the time of their last event, oldest first
+        self.paths = collections.OrderedDict()
+
+    def touch(self, path):
+        """Record an event on `path`, postponing its release
+
+        :param string path: path of the event
+
+        """
+        self.paths.pop(path, None)
+        self.paths[path] = self.timer()
+
+    def discard(self, path):
+        """Forget about `path`, if pending
+
+        :param string path: path to forget about
+
+        """
+        self.paths.pop(path, None)
+
+    @property
+    def timeout(self):
+        """Seconds until the next release or `None` if there is no pending path"""
+        if not self.paths:
+            return None
+        return max(0, next(iter(self.paths.values())) + self.delay - self.timer())
+
+    def release(self):
+        """Release the paths without any event for `delay` seconds
+
+        :return: released paths, oldest first
+        :rtype: list
+
+        """
+        now = self.timer()
+        released = []
+        for path, last_event in list(self.paths.items()):
+            if now - last_event < self.delay:
+                break
+            del self.paths[path]
+            released.append(path)
+        return released
+
+
+def watch_videos(paths, delay=DEFAULT_DELAY):
+    """Watch `paths` for new videos with inotify
+
+    New and renamed videos as well as directories moved into the watched `paths` are yielded once no event
+    occurred on them for `delay` seconds. Sub directories are watched too, including the new ones. This blocks
+    without consuming resources until an event occurs.
+
+    :param paths: absolute paths to the directories to watch
+    :type paths: list of string
+    :param int delay: delay in seconds without any event on a path before it is yielded
+    :return: a generator of lists of paths to videos or directories to scan
+    :raise: ImportError if pyinotify is not installed
+
+    """
+    if pyinotify is None:
+        raise ImportError('pyinotify is required to watch videos')
+    debouncer = Debouncer(delay)
+
+    def process_event(event):
+        pathname, name = event.pathname, event.name
+        if isinstance(pathname, bytes):
+            try:
+                pathname, name = pathname.decode('utf-8'), name.decode('utf-8')
+            except UnicodeDecodeError:
+                logger.error('Skipping badly encoded path %r', pathname.decode('utf-8', errors='replace'))
+                return
+        if event.mask & (pyinotify.IN_DELETE | pyinotify.IN_MOVED_FROM):
+            debouncer.discard(pathname)
+            return
+        if name.startswith('.'):
+            logger.debug('Skipping hidden path %r', pathname)
+            return
+        if event.dir:
+            # directories created in place send events for their own files
+            if event.mask & pyinotify.IN_MOVED_TO:
+                logger.debug('Directory %r moved in', pathname)
+                debouncer.touch(pathname)
+            return
+        if name.endswith(VIDEO_EXTENSIONS):
+            logger.debug('Event %s on video %r', event.maskname, pathname)
+            debouncer.touch(pathname)
+
+    watch_manager = pyinotify.WatchManager()
+    notifier = pyinotify.Notifier(watch_manager, process_event)
+    mask = (pyinotify.IN_CREATE | pyinotify.IN_MODIFY | pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO |
+            pyinotify.IN_MOVED_FROM | pyinotify.IN_DELETE)
+    for path in paths:
+        logger.info('Watching directory %r', path)
+        watch_manager.add_watch(path, mask, rec=True, auto_add=True,
+                                exclude_filter=lambda p: os.path.split(p)[1].startswith('.'))
+    try:
+        while True:
+            timeout = debouncer.timeout
+            if notifier.check_events(None if timeout is None else int(timeout * 1000)):
+                notifier.read_events()
+                notifier.process_events()
+            released_paths = debouncer.release()
+            if released_paths:
+                logger.info('Found %d new paths', len(released_paths))
+                yield released_paths
+    finally:
+        notifier.stop()
+
+
+def watch_best_subtitles(paths, languages, providers=None, provider_configs=None, min_score=0,
+                         hearing_impaired=False, single=False, subtitles=True, embedded_subtitles=True,
+                         delay=DEFAULT_DELAY, workers=None, index=None, follow_symlinks=False, pool=None):
+    """Watch `paths` for new videos and download their best subtitles as soon as they are complete
+
+    See :func:`watch_videos` for the detection of new videos, :func:`~subliminal.video.scan_videos` for
+    the scan and :func:`~subliminal.api.download_best_subtitles` for the download.
+
+    All the downloads use the same :class:`~subliminal.providers.ProviderPool` so providers stay initialized, and are
+    kept alive, between groups of new videos. A new pool is terminated when the generator is closed.
+
+    :param paths: absolute paths to the directories to watch
+    :type paths: list of string
+    :param languages: languages of subtitles to download
+    :type languages: set of :class:`babelfish.Language`
+    :param providers: providers to use for the search, if not all
+    :type providers: list of string or None
+    :param provider_configs: configuration for providers
+    :type provider_configs: dict of provider name => provider constructor kwargs or None
+    :param int min_score: minimum score for subtitles to download
+    :param bool hearing_impaired: download hearing impaired subtitles
+    :param bool single: do not download for videos with an undetermined subtitle language detected
+    :param bool subtitles: scan for subtitles with the same name
+    :param bool embedded_subtitles: scan for embedded subtitles
+    :param int delay: delay in seconds without any event on a path before it is scanned
+    :param workers: number of processes to scan videos with and of threads to query the providers with concurrently,
+        if not sequentially
+    :type workers: int or None
+    :param index: index to skip unchanged videos and directories with, if any
+    :type index: :class:`~subliminal.index.ScanIndex` or None
+    :param bool follow_symlinks: walk into symbolic links to directories
+    :param pool: long-lived pool to use instead of a new one
+    :type pool: :class:`~subliminal.providers.ProviderPool` or None
+    :return: a generator of downloaded subtitles, for each group of new videos
+    :rtype: generator of dict of :class:`~subliminal.video.Video` => [:class:`~subliminal.subtitle.Subtitle`]
+    :raise: ImportError if pyinotify is not installed
+
+    """
+    hash_functions = provider_manager.get_hash_functions(providers)
+    pp = pool or ProviderPool(providers, provider_configs, workers, keep_alive=True)
+    try:
+        for new_paths in watch_videos(paths, delay):
+            videos = scan_videos(new_paths, subtitles=subtitles, embedded_subtitles=embedded_subtitles,
+                                 workers=workers, index=index, hash_functions=hash_functions,
+                                 follow_symlinks=follow_symlinks)
+            if index is not None:
+                index.commit()
+            if not videos:
+                continue
+            yield download_best_subtitles(videos, languages, min_score=min_score, hearing_impaired=hearing_impaired,
+                                          single=single, pool=pp)
+    finally:
+        if pool is None:
+            pp.terminate()